@@ -0,0 +1,316 @@
+import atexit
+import glob
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import profiling
+
+try:
+    import zstandard
+except ImportError:  # only needed for ARCHIVE_COMPRESSION=zstd
+    zstandard = None
+
+# Bytes copied per read when moving a page into the archive
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Streamed pages are spooled in memory up to this size, then on disk, before they are archived
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+# Pages between flushes of a JSON Lines archive, so a run that dies loses at most that many pages
+DEFAULT_FLUSH_PAGES = 100
+
+JSONL_NAME_PREFIX = '{"name":'
+JSONL_PAGE_PREFIX = ',"page":'
+
+
+# Collects one streamed page (see Archive.open_page) and hands it to the archive when the
+# with-block exits, if the page was committed: only once the whole body has been read is it a page.
+# A page left before that (its download or load failed part way) is thrown away.
+class PageWriter:
+    def __init__(self, archive, name):
+        self.archive = archive
+        self.name = name
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        self.committed = False
+
+    def write(self, data):
+        self.spool.write(data)
+
+    # Function to mark the page complete, after its body has been read to the end
+    def commit(self):
+        self.committed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and self.committed:
+                self.spool.seek(0)
+                with profiling.stage('archive_write'):
+                    self.archive.write_stream(self.name, self.spool)
+        finally:
+            self.spool.close()
+
+
+# Base class of the archive sinks. Every sink stores the raw response body of a page under a name
+# such as 'hotel_data_1_100' or 'facilities/facility_data_1_100', exactly as received.
+class Archive:
+    def write(self, name, body):
+        with profiling.stage('archive_write'):
+            self.write_stream(name, io.BytesIO(body))
+
+    def write_stream(self, name, stream):
+        raise NotImplementedError
+
+    # Function to get a writer for a page that is still downloading (used by the streaming loaders)
+    def open_page(self, name):
+        return PageWriter(self, name)
+
+    def close(self):
+        pass
+
+
+# Archiving turned off
+class NullArchive(Archive):
+    def write_stream(self, name, stream):
+        pass
+
+    def open_page(self, name):
+        return _DiscardingPageWriter()
+
+
+class _DiscardingPageWriter:
+    def write(self, data):
+        pass
+
+    def commit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+# One file per page: <directory>/<name>.json, written to a temporary file and renamed into place
+class FileArchive(Archive):
+    def __init__(self, directory='.'):
+        self.directory = directory
+
+    def write_stream(self, name, stream):
+        path = os.path.join(self.directory, f'{name}.json')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(f'{path}.tmp', 'wb') as file:
+            shutil.copyfileobj(stream, file, COPY_CHUNK_SIZE)
+        os.replace(f'{path}.tmp', path)
+
+
+# All pages of a run appended to one JSON Lines file, optionally gzip- or zstd-compressed.
+# Each line is {"name": ..., "page": <raw body>}; the body is spliced in as-is (newlines in JSON can
+# only be whitespace, so they are blanked out) rather than decoded and encoded again. Every
+# flush_pages pages the compressed stream is flushed to disk, so the pages of a run that dies before
+# close() are readable up to the last flush (see read_archive_pages).
+class JsonLinesArchive(Archive):
+    def __init__(self, directory='archive', compression='gzip', flush_pages=DEFAULT_FLUSH_PAGES):
+        os.makedirs(directory, exist_ok=True)
+        run_id = f'{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}'
+        if compression == 'gzip':
+            self.path = os.path.join(directory, f'pages-{run_id}.jsonl.gz')
+            self.file = gzip.open(self.path, 'wb', compresslevel=6)
+        elif compression == 'zstd':
+            if zstandard is None:
+                raise ValueError("ARCHIVE_COMPRESSION=zstd needs the zstandard package")
+            self.path = os.path.join(directory, f'pages-{run_id}.jsonl.zst')
+            self.raw_file = open(self.path, 'wb')
+            self.file = zstandard.ZstdCompressor().stream_writer(self.raw_file)
+        elif compression in (None, '', 'none'):
+            self.path = os.path.join(directory, f'pages-{run_id}.jsonl')
+            self.file = open(self.path, 'wb')
+        else:
+            raise ValueError(f"Unknown archive compression: {compression}")
+        self.flush_pages = flush_pages
+        self.pages = 0
+        self.lock = threading.Lock()
+
+    def write_stream(self, name, stream):
+        with self.lock:
+            self.file.write(f'{JSONL_NAME_PREFIX}{json.dumps(name)}{JSONL_PAGE_PREFIX}'.encode())
+            while True:
+                chunk = stream.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.file.write(chunk.replace(b'\n', b' ').replace(b'\r', b' '))
+            self.file.write(b'}\n')
+            self.pages += 1
+            if self.flush_pages and self.pages % self.flush_pages == 0:
+                self.file.flush()
+                if hasattr(self, 'raw_file'):
+                    self.raw_file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            if hasattr(self, 'raw_file'):
+                self.raw_file.close()
+
+
+# Append-only segment files with an offset index. Page bodies are concatenated into
+# segment-<run>-<n>.seg files of up to segment_max_bytes each, and segment-<run>.idx gets one
+# "name <TAB> segment file <TAB> offset <TAB> length" line per page for random access.
+class SegmentArchive(Archive):
+    def __init__(self, directory='archive', segment_max_bytes=1024 ** 3):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.run_id = f'{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}'
+        self.segment_number = 0
+        self.segment = None
+        self.index = open(os.path.join(directory, f'segment-{self.run_id}.idx'), 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+
+    def _roll_segment(self):
+        if self.segment:
+            self.segment.close()
+        self.segment_number += 1
+        self.segment_name = f'segment-{self.run_id}-{self.segment_number:05d}.seg'
+        self.segment = open(os.path.join(self.directory, self.segment_name), 'ab')
+
+    def write_stream(self, name, stream):
+        with self.lock:
+            if self.segment is None or self.segment.tell() >= self.segment_max_bytes:
+                self._roll_segment()
+            offset = self.segment.tell()
+            shutil.copyfileobj(stream, self.segment, COPY_CHUNK_SIZE)
+            length = self.segment.tell() - offset
+            self.segment.flush()
+            self.index.write(f'{name}\t{self.segment_name}\t{offset}\t{length}\n')
+            self.index.flush()
+
+    def close(self):
+        with self.lock:
+            if self.segment:
+                self.segment.close()
+            self.index.close()
+
+
+# Function to build an archive sink from the environment:
+#   ARCHIVE_MODE         files (default) | jsonl | segments | none
+#   ARCHIVE_PATH         directory to write to (default '.' for files, 'archive' otherwise)
+#   ARCHIVE_COMPRESSION  gzip (default) | zstd | none, for jsonl
+#   ARCHIVE_FLUSH_PAGES  pages between flushes of a jsonl archive (default 100, 0 only on close)
+def create_archive_from_env():
+    mode = os.getenv('ARCHIVE_MODE', 'files')
+    if mode == 'none':
+        return NullArchive()
+    if mode == 'files':
+        return FileArchive(os.getenv('ARCHIVE_PATH', '.'))
+    if mode == 'jsonl':
+        return JsonLinesArchive(os.getenv('ARCHIVE_PATH', 'archive'), os.getenv('ARCHIVE_COMPRESSION', 'gzip'),
+                                int(os.getenv('ARCHIVE_FLUSH_PAGES', DEFAULT_FLUSH_PAGES)))
+    if mode == 'segments':
+        return SegmentArchive(os.getenv('ARCHIVE_PATH', 'archive'))
+    raise ValueError(f"Unknown ARCHIVE_MODE: {mode}")
+
+
+_shared_archive = None
+_shared_archive_lock = threading.Lock()
+
+
+# Function to get the process-wide archive sink, built from the environment on first use and
+# closed (flushing compressed streams) when the process exits
+def get_shared_archive():
+    global _shared_archive
+    with _shared_archive_lock:
+        if _shared_archive is None:
+            _shared_archive = create_archive_from_env()
+            atexit.register(_shared_archive.close)
+        return _shared_archive
+
+
+def _open_jsonl(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError(f"Reading {path} needs the zstandard package")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')), encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+# Errors reading a compressed archive whose end is missing, as it is when the run writing it died
+TRUNCATED_ARCHIVE_ERRORS = (EOFError,) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+# Function to read the page lines of a JSON Lines archive. An archive whose run died before closing it
+# ends early, possibly in the middle of a page: it is read up to the last complete page, with a warning.
+def _read_jsonl_lines(path):
+    with _open_jsonl(path) as file:
+        try:
+            for line in file:
+                if not line.endswith('\n'):
+                    logging.warning(f"Archive {path} ends in a partly written page, which is skipped")
+                    return
+                if line.strip():
+                    yield line
+        except TRUNCATED_ARCHIVE_ERRORS as err:
+            logging.warning(f"Archive {path} is truncated, read up to its last complete page: {err}")
+
+
+# Function to split a JSON Lines archive line into the page name and the raw page body
+def _split_jsonl_line(line, decoder=json.JSONDecoder()):
+    name, end = decoder.raw_decode(line, len(JSONL_NAME_PREFIX))
+    body = line[end + len(JSONL_PAGE_PREFIX):].rstrip()
+    return name, body[:-1]
+
+
+# Function to list the archive sources under a directory, whatever sink wrote them (including the
+# old indent=4 files). A source is a tuple read_archive_pages() understands: ('file', path, name),
+# ('jsonl', path) or ('segment', path, offset, length, name). Listing is cheap, so replay can spread
+# the reading and parsing of the sources across processes.
+def list_archive_sources(directory):
+    sources = []
+    for path in sorted(glob.glob(os.path.join(directory, '**', '*.json'), recursive=True)):
+        sources.append(('file', path, os.path.relpath(path, directory)[:-len('.json')]))
+    for pattern in ('*.jsonl', '*.jsonl.gz', '*.jsonl.zst'):
+        for path in sorted(glob.glob(os.path.join(directory, '**', pattern), recursive=True)):
+            sources.append(('jsonl', path))
+    for index_path in sorted(glob.glob(os.path.join(directory, '**', 'segment-*.idx'), recursive=True)):
+        with open(index_path, encoding='utf-8') as index:
+            for line in index:
+                name, segment_name, offset, length = line.rstrip('\n').split('\t')
+                segment_path = os.path.join(os.path.dirname(index_path), segment_name)
+                sources.append(('segment', segment_path, int(offset), int(length), name))
+    return sources
+
+
+# Function to read the pages of one archive source as (name, body) pairs; a file or segment entry
+# holds one page, a JSON Lines file many. body is bytes or str, ready for json.loads.
+def read_archive_pages(source):
+    kind = source[0]
+    if kind == 'file':
+        _, path, name = source
+        with open(path, 'rb') as file:
+            yield name, file.read()
+    elif kind == 'jsonl':
+        for line in _read_jsonl_lines(source[1]):
+            yield _split_jsonl_line(line)
+    elif kind == 'segment':
+        _, path, offset, length, name = source
+        with open(path, 'rb') as segment:
+            segment.seek(offset)
+            yield name, segment.read(length)
+
+
+# Function to iterate over every archived page under a directory as (name, body) pairs
+def iter_archive_pages(directory):
+    for source in list_archive_sources(directory):
+        yield from read_archive_pages(source)
@@ -0,0 +1,104 @@
+# Compares the three ways main.py can write hotels on a local MySQL/MariaDB:
+# row by row (insert_data_into_mysql), batched (insert_data_into_mysql_batched) and
+# LOAD DATA LOCAL INFILE (bulk_load.py), using the same archived pages for each.
+#
+# Point DB_* at a disposable database (every hb_* table is truncated between runs) and run from the
+# repository root:
+#     python -m benchmarks.bench_bulk_load --archive-dir <dir with hotel_data_*.json or archives>
+import argparse
+import os
+import time
+
+import bulk_load
+import main as hotel_loader
+
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), 'schema.sql')
+
+
+def create_schema(conn):
+    cursor = conn.cursor()
+    with open(SCHEMA_FILE) as file:
+        schema = '\n'.join(line for line in file if not line.startswith('--'))
+    for statement in schema.split(';'):
+        if statement.strip():
+            cursor.execute(statement)
+    conn.commit()
+    cursor.close()
+
+
+def truncate_tables(conn):
+    cursor = conn.cursor()
+    for table_name in bulk_load.BULK_LOAD_TABLES:
+        cursor.execute(f"TRUNCATE TABLE {table_name}")
+    conn.commit()
+    cursor.close()
+
+
+def count_rows(conn):
+    cursor = conn.cursor()
+    total = 0
+    for table_name in bulk_load.BULK_LOAD_TABLES:
+        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+        total += cursor.fetchone()[0]
+    cursor.close()
+    return total
+
+
+def run_row_by_row(pages, conn):
+    for hotel_data in pages:
+        hotel_loader.insert_data_into_mysql(hotel_data, conn)
+
+
+def run_batched(pages, conn):
+    for hotel_data in pages:
+        hotel_loader.insert_data_into_mysql_batched(hotel_data, conn)
+
+
+def run_bulk(pages, conn):
+    bulk_load.bulk_load(iter(pages), conn)
+
+
+def run_bulk_deferred(pages, conn):
+    bulk_load.bulk_load(iter(pages), conn, defer_constraints=True)
+
+
+MODES = {
+    'row_by_row': run_row_by_row,
+    'batched': run_batched,
+    'bulk': run_bulk,
+    'bulk_deferred': run_bulk_deferred,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the hotel write paths against a local MySQL.')
+    parser.add_argument('--archive-dir', required=True, help='Archived hotel pages to load')
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    # Parse everything up front so only the database write path is timed
+    pages = list(bulk_load.iter_archived_hotel_pages(args.archive_dir))
+    hotels = sum(len(hotel_data['hotels']) for hotel_data in pages)
+
+    conn = bulk_load.connect_for_bulk_load()
+    if not conn:
+        raise SystemExit('Could not connect to MySQL, check DB_HOST/DB_USER/DB_PASS/DB_NAME')
+    create_schema(conn)
+
+    print(f"{len(pages)} pages, {hotels} hotels")
+    print(f"{'mode':<14}{'seconds':>10}{'hotels/s':>12}{'rows/s':>12}{'rows':>10}")
+    try:
+        for mode in args.modes:
+            truncate_tables(conn)
+            started = time.perf_counter()
+            MODES[mode](pages, conn)
+            elapsed = time.perf_counter() - started
+            rows = count_rows(conn)
+            print(f"{mode:<14}{elapsed:>10.2f}{hotels / elapsed:>12.1f}{rows / elapsed:>12.1f}{rows:>10}")
+    finally:
+        truncate_tables(conn)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
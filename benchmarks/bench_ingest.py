@@ -0,0 +1,254 @@
+# End-to-end ingest benchmark: loads synthetic hotels from the local API stand-in (benchmarks/mock_api.py)
+# with the main.py and main_new.py load paths, through the same pipeline as ingest.py, and reports
+# hotels/s, rows/s, peak RSS and p50/p99 page fetch and load latency for each. Every path runs in a
+# process of its own, so its peak RSS is its own.
+#
+# The database is either a disposable local MySQL/MariaDB named by DB_* (--db mysql; the tables a path
+# writes are dropped and recreated before it runs) or an in-process stand-in that skips the server's
+# work (--db stand-in, see benchmarks/stand_in_db.py). Run from the repository root:
+#     python -m benchmarks.bench_ingest --db stand-in --hotels 2000 --latency-ms 100
+#     python -m benchmarks.bench_ingest --paths hotels --error-rate 0.02 --output after.json --baseline before.json
+#
+# The API rate limit defaults to 1000 requests/s and archiving to off, so the loaders are what is
+# measured; set HOTELBEDS_RATE_LIMIT or ARCHIVE_MODE to measure with them.
+import argparse
+import collections
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import tempfile
+import time
+
+import mysql.connector
+
+import ingest
+import metrics
+from benchmarks import mock_api, stand_in_db
+from checkpoint import COMPLETED, CheckpointStore, FAILED
+from pipeline import page_ranges, run_ingest, settings_from_env
+
+BENCHMARK_DIR = os.path.dirname(__file__)
+
+# What each benchmarked path writes: the schema file creating its tables (None if the loader creates them
+# itself) and the tables to drop before the run and count rows in afterwards
+BenchPath = collections.namedtuple('BenchPath', ['schema_file', 'tables'])
+
+BENCH_PATHS = {
+    'hotels': BenchPath('schema.sql', ('hb_hotel_info', 'hb_location_coordinates', 'hb_description',
+                                       'hb_facilities', 'hb_rooms_type', 'hb_room_features', 'hb_room_stays',
+                                       'hb_room_stay_facilities', 'hb_phone_numbers', 'hb_board_codes',
+                                       'hb_address', 'hb_images')),
+    'hotels_document': BenchPath('schema_document.sql', ('hb_hotel_info',)),
+    'hotels_lean': BenchPath(None, ('hb_hotel_document',)),
+}
+
+
+def reset_tables(conn, bench_path):
+    cursor = conn.cursor()
+    for table_name in bench_path.tables:
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+    if bench_path.schema_file:
+        with open(os.path.join(BENCHMARK_DIR, bench_path.schema_file)) as file:
+            schema = '\n'.join(line for line in file if not line.startswith('--'))
+        for statement in schema.split(';'):
+            if statement.strip():
+                cursor.execute(statement)
+    conn.commit()
+    cursor.close()
+
+
+def count_rows(conn, tables):
+    cursor = conn.cursor()
+    total = 0
+    for table_name in tables:
+        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+        total += cursor.fetchone()[0]
+    cursor.close()
+    return total
+
+
+def connect():
+    return mysql.connector.connect(
+        host=os.getenv('DB_HOST'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASS'),
+        database=os.getenv('DB_NAME')
+    )
+
+
+# Function to wrap a job's page functions so every call's duration is appended to timings[stage]
+def timed_job(job, timings):
+    def timed(stage, function):
+        def run(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timings[stage].append(time.perf_counter() - started)
+        return run
+
+    return job._replace(fetch_page=timed('fetch', job.fetch_page), load_page=timed('load', job.load_page),
+                        load_rows=job.load_rows and timed('load', job.load_rows))
+
+
+# Function to get the q quantile (0..1) of a list of samples by nearest rank
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+def peak_rss_mib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+# Child process: loads hotels 1..hotels with one path and puts its measurements on results
+def run_path(path, hotels, batch_size, db, settings, results):
+    # Configured before the loader module is imported, so its log file setup does not apply
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s:%(levelname)s:%(message)s')
+    if db == 'stand-in':
+        stand_in_db.install()
+    bench_path = BENCH_PATHS[path]
+    ingest_resource = ingest.RESOURCES[path]
+    module = importlib.import_module(ingest_resource.module)
+
+    conn = connect()
+    try:
+        reset_tables(conn, bench_path)
+        if ingest_resource.prepare and not getattr(module, ingest_resource.prepare)(False):
+            raise RuntimeError(f"Could not prepare the tables for {path}")
+
+        timings = {'fetch': [], 'load': []}
+        job = timed_job(getattr(module, ingest_resource.job), timings)
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            checkpoints = CheckpointStore(os.path.join(checkpoint_dir, 'bench_checkpoints.sqlite3'))
+            started = time.perf_counter()
+            run_ingest(page_ranges(1, hotels + 1, batch_size), checkpoints, job, settings)
+            elapsed = time.perf_counter() - started
+            summary = checkpoints.summary(job.resource)
+            checkpoints.close()
+        rows = count_rows(conn, bench_path.tables)
+    finally:
+        conn.close()
+
+    results.put({
+        'path': path,
+        'seconds': elapsed,
+        'hotels': metrics.RECORDS_LOADED.total(),
+        'rows': rows,
+        'pages_completed': summary.get(COMPLETED, 0),
+        'pages_failed': summary.get(FAILED, 0),
+        'retries': metrics.API_RETRIES.total(),
+        'peak_rss_mib': peak_rss_mib(),
+        'fetch_p50': percentile(timings['fetch'], 0.5),
+        'fetch_p99': percentile(timings['fetch'], 0.99),
+        'load_p50': percentile(timings['load'], 0.5),
+        'load_p99': percentile(timings['load'], 0.99),
+    })
+
+
+# Function to wait for a path process's measurements; None if it exited without any
+def collect_result(process, results):
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                break
+    try:
+        return results.get_nowait()
+    except queue.Empty:
+        return None
+
+
+def _ms(seconds):
+    return '-' if seconds is None else f'{seconds * 1000:.0f}'
+
+
+def print_results(results, baseline=None):
+    print(f"{'path':<17}{'seconds':>9}{'hotels/s':>10}{'rows/s':>10}{'RSS MiB':>9}{'fetch p50/p99 ms':>18}"
+          f"{'load p50/p99 ms':>17}{'failed':>8}{'retries':>9}")
+    for result in results:
+        hotels_per_second = result['hotels'] / result['seconds']
+        print(f"{result['path']:<17}{result['seconds']:>9.2f}{hotels_per_second:>10.1f}"
+              f"{result['rows'] / result['seconds']:>10.0f}{result['peak_rss_mib']:>9.0f}"
+              f"{_ms(result['fetch_p50']) + '/' + _ms(result['fetch_p99']):>18}"
+              f"{_ms(result['load_p50']) + '/' + _ms(result['load_p99']):>17}"
+              f"{result['pages_failed']:>8}{result['retries']:>9.0f}")
+        before = (baseline or {}).get(result['path'])
+        if before:
+            change = hotels_per_second / (before['hotels'] / before['seconds']) - 1
+            rss_change = result['peak_rss_mib'] / before['peak_rss_mib'] - 1
+            print(f"{'':<17}vs baseline: {change:+.1%} hotels/s, {rss_change:+.1%} peak RSS")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the hotel load paths against a local API stand-in.')
+    parser.add_argument('--paths', nargs='+', choices=sorted(BENCH_PATHS), default=list(BENCH_PATHS))
+    parser.add_argument('--db', choices=('mysql', 'stand-in'), default='mysql',
+                        help='Disposable MySQL/MariaDB from DB_*, or the in-process stand-in')
+    parser.add_argument('--hotels', type=int, default=2000, help='Hotels loaded by each path')
+    parser.add_argument('--batch-size', type=int, default=100, help='Hotels per page')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--fetch-workers', type=int, help='Default: FETCH_WORKERS')
+    parser.add_argument('--writer-workers', type=int, help='Default: WRITER_WORKERS')
+    parser.add_argument('--transform-workers', type=int, help='Default: TRANSFORM_WORKERS')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Results JSON of an earlier run to compare with')
+    mock_api.add_shape_arguments(parser)
+    mock_api.add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    overrides = {key: getattr(args, key) for key in ('fetch_workers', 'writer_workers', 'transform_workers')
+                 if getattr(args, key) is not None}
+    settings = settings_from_env()._replace(**overrides)
+
+    server = mock_api.start_mock_api(shape=mock_api.shape_from_args(args), faults=mock_api.faults_from_args(args),
+                                     total_hotels=args.hotels, seed=args.seed)
+    server.warm(page_ranges(1, args.hotels + 1, args.batch_size))
+    # Inherited by the path processes
+    os.environ['HOTELBEDS_BASE_URL'] = server.base_url
+    os.environ.setdefault('API_KEY', 'benchmark')
+    os.environ.setdefault('API_SECRET', 'benchmark')
+    os.environ.setdefault('HOTELBEDS_RATE_LIMIT', '1000')
+    os.environ.setdefault('HOTELBEDS_RATE_BURST', '100')
+    os.environ.setdefault('ARCHIVE_MODE', 'none')
+
+    print(f"{args.hotels} hotels in pages of {args.batch_size}, database: {args.db}, {settings}")
+    context = multiprocessing.get_context('spawn')
+    results = []
+    try:
+        for path in args.paths:
+            path_results = context.Queue()
+            process = context.Process(target=run_path, name=f'bench-{path}',
+                                      args=(path, args.hotels, args.batch_size, args.db, settings, path_results))
+            process.start()
+            result = collect_result(process, path_results)
+            process.join()
+            if result is None:
+                print(f"{path}: failed (exit code {process.exitcode})")
+                continue
+            results.append(result)
+    finally:
+        server.shutdown()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = {result['path']: result for result in json.load(file)['results']}
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'options': vars(args), 'results': results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# Local stand-in for the Hotelbeds content API, serving synthetic pages so the loaders can be benchmarked
+# without spending API quota. It answers the endpoints the loaders use (hotels, types/facilities and
+# types/facilitygroups) with the same from/to paging and gzip encoding as the real API. Hotels have a
+# configurable shape; latency, 500s and 429s can be injected, or an exact sequence of responses
+# scripted (see MockApiServer.script). Pages are generated from a seed, so every run serves exactly
+# the same content.
+#
+# Run it on its own and point the loaders at it:
+#     python -m benchmarks.mock_api --port 8099 --hotels 5000 --latency-ms 150
+#     HOTELBEDS_BASE_URL=http://127.0.0.1:8099/hotel-content-api/1.0 python ingest.py hotels --end 5000
+import argparse
+import collections
+import functools
+import gzip
+import http.server
+import json
+import random
+import threading
+import time
+import urllib.parse
+
+API_PREFIX = '/hotel-content-api/1.0'
+
+# How big each synthetic hotel is: facilities on the hotel, rooms, facilities per room, stays per room,
+# facilities per stay, images and the length of the description
+HotelShape = collections.namedtuple(
+    'HotelShape', ['facilities', 'rooms', 'room_facilities', 'room_stays', 'stay_facilities', 'images',
+                   'description_chars'],
+    defaults=(40, 6, 8, 2, 2, 30, 1500))
+
+# Injected faults: a fixed latency plus up to jitter_ms more per response and latency_per_record_ms for
+# every record on the page, the share of responses that are 500s and 429s, and the Retry-After sent
+# with a 429
+Faults = collections.namedtuple(
+    'Faults', ['latency_ms', 'jitter_ms', 'error_rate', 'throttle_rate', 'retry_after', 'latency_per_record_ms'],
+    defaults=(0, 0, 0.0, 0.0, 1, 0))
+
+# The facility catalogue served by types/facilities; hotels only use codes from it
+FACILITY_COUNT = 500
+FACILITY_GROUP_COUNT = 50
+
+CATEGORY_CODES = ('1EST', '2EST', '3EST', '4EST', '5EST', 'HS', 'APTH')
+DESTINATIONS = (('ES', '07', 'PMI'), ('ES', '28', 'MAD'), ('ES', '08', 'BCN'), ('IT', 'RM', 'ROE'),
+                ('FR', '75', 'PAR'), ('GB', 'LND', 'LON'), ('US', 'NY', 'NYC'), ('TH', 'BKK', 'BKK'))
+
+
+def _facility_group(code):
+    return 1 + code % FACILITY_GROUP_COUNT
+
+
+# Function to pick count distinct catalogue facilities, as (facility_group_code, facility_code) pairs
+def _sample_facilities(rng, count):
+    return [(_facility_group(code), code) for code in rng.sample(range(1, FACILITY_COUNT + 1), count)]
+
+
+def synthetic_hotel(code, shape, rng):
+    country_code, state_code, destination_code = rng.choice(DESTINATIONS)
+    rooms = []
+    for room_index in range(shape.rooms):
+        rooms.append({
+            'roomCode': f'R{room_index:02d}.{rng.choice(("ST", "SU", "DX"))}',
+            'isParentRoom': False,
+            'minPax': 1,
+            'maxPax': 2 + room_index % 3,
+            'maxAdults': 2 + room_index % 2,
+            'maxChildren': room_index % 3,
+            'minAdults': 1,
+            'roomType': rng.choice(('DBL', 'TWN', 'SGL', 'SUI')),
+            'characteristicCode': rng.choice(('ST', 'SU', 'DX', 'VM')),
+            'roomFacilities': [
+                {'facilityCode': facility_code, 'facilityGroupCode': group_code, 'indLogic': rng.random() < 0.5,
+                 'number': 1, 'voucher': False}
+                for group_code, facility_code in _sample_facilities(rng, shape.room_facilities)],
+            'roomStays': [
+                {'stayType': 'BED', 'order': str(stay_index + 1), 'description': f'Bedroom {stay_index + 1}',
+                 'roomStayFacilities': [
+                     {'facilityCode': facility_code, 'facilityGroupCode': group_code, 'number': 1 + rng.randrange(2)}
+                     for group_code, facility_code in _sample_facilities(rng, shape.stay_facilities)]}
+                for stay_index in range(shape.room_stays)],
+        })
+    return {
+        'code': code,
+        'name': {'content': f'Synthetic Hotel {code}'},
+        'description': {'content': ''.join(rng.choices('abcdefghij klmnopqrst ', k=shape.description_chars))},
+        'countryCode': country_code,
+        'stateCode': state_code,
+        'destinationCode': destination_code,
+        'zoneCode': rng.randrange(1, 40),
+        'coordinates': {'longitude': round(rng.uniform(-180, 180), 6), 'latitude': round(rng.uniform(-90, 90), 6)},
+        'categoryCode': rng.choice(CATEGORY_CODES),
+        'accommodationTypeCode': 'HOTEL',
+        'boardCodes': rng.sample(['RO', 'BB', 'HB', 'FB', 'AI'], 3),
+        'address': {'content': f'{rng.randrange(1, 300)} Synthetic Street'},
+        'postalCode': f'{rng.randrange(10000, 99999)}',
+        'city': {'content': destination_code.title()},
+        'email': f'hotel{code}@example.com',
+        'phones': [{'phoneNumber': f'+34{rng.randrange(10 ** 8, 10 ** 9)}', 'phoneType': phone_type}
+                   for phone_type in ('PHONEBOOKING', 'PHONEHOTEL', 'FAXNUMBER')],
+        'rooms': rooms,
+        'facilities': [
+            {'facilityCode': facility_code, 'facilityGroupCode': group_code, 'order': order,
+             'number': rng.randrange(5), 'voucher': False}
+            for order, (group_code, facility_code) in enumerate(_sample_facilities(rng, shape.facilities))],
+        'images': [
+            {'imageTypeCode': rng.choice(('GEN', 'HAB', 'RES', 'PIS')),
+             'path': f'{code // 1000:02d}/{code:06d}/{code:06d}a_hb_{image_index}.jpg',
+             'order': image_index + 1, 'visualOrder': image_index + 1}
+            for image_index in range(shape.images)],
+        'lastUpdate': f'2024-{1 + code % 12:02d}-{1 + code % 28:02d}',
+        'S2C': f'{1 + code % 5}*',
+        'ranking': rng.randrange(1, 100),
+    }
+
+
+# Function to build the JSON body of a page (endpoint is the path below API_PREFIX). Codes run from
+# from_index to to_index, stopping at the endpoint's total.
+def synthetic_page(endpoint, from_index, to_index, shape, total_hotels, seed):
+    if endpoint == 'hotels':
+        to_index = min(to_index, total_hotels)
+        hotels = [synthetic_hotel(code, shape, random.Random(seed * 1_000_003 + code))
+                  for code in range(from_index, to_index + 1)]
+        return {'from': from_index, 'to': to_index, 'total': total_hotels, 'hotels': hotels}
+    if endpoint == 'types/facilities':
+        to_index = min(to_index, FACILITY_COUNT)
+        facilities = [{'code': code, 'facilityGroupCode': _facility_group(code), 'facilityTypologyCode': 1 + code % 10,
+                       'description': {'content': f'Facility {code}'}}
+                      for code in range(from_index, to_index + 1)]
+        return {'from': from_index, 'to': to_index, 'total': FACILITY_COUNT, 'facilities': facilities}
+    if endpoint == 'types/facilitygroups':
+        to_index = min(to_index, FACILITY_GROUP_COUNT)
+        groups = [{'code': code, 'description': {'content': f'Facility group {code}'}}
+                  for code in range(from_index, to_index + 1)]
+        return {'from': from_index, 'to': to_index, 'total': FACILITY_GROUP_COUNT, 'facilityGroups': groups}
+    return None
+
+
+class MockApiHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        endpoint = url.path[len(API_PREFIX):].strip('/') if url.path.startswith(API_PREFIX) else None
+
+        with server.fault_lock:
+            server.signatures.append(self.headers.get('X-Signature'))
+            scripted = server.scripted.popleft() if server.scripted else None
+            fault_roll = server.fault_rng.random()
+            delay = (server.faults.latency_ms + server.fault_rng.uniform(0, server.faults.jitter_ms)) / 1000
+        if server.faults.latency_per_record_ms:
+            try:
+                records = max(0, int(params.get('to', 100)) - int(params.get('from', 1)) + 1)
+            except ValueError:
+                records = 0
+            delay += server.faults.latency_per_record_ms * records / 1000
+        if delay:
+            time.sleep(delay)
+
+        if scripted:
+            status, headers = scripted
+            self.send_body(status, b'{"error": "Scripted response"}', headers)
+            return
+        if fault_roll < server.faults.throttle_rate:
+            self.send_body(429, b'{"error": "Quota exceeded"}', {'Retry-After': str(server.faults.retry_after)})
+            return
+        if fault_roll < server.faults.throttle_rate + server.faults.error_rate:
+            self.send_body(500, b'{"error": "Injected server error"}')
+            return
+        try:
+            body = server.page_body(endpoint, int(params.get('from', 1)), int(params.get('to', 100)))
+        except ValueError:
+            body = None
+        if body is None:
+            self.send_body(404, b'{"error": "Not found"}')
+            return
+        self.send_body(200, body, {'Content-Encoding': 'gzip'})
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockApiServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, shape=HotelShape(), faults=Faults(), total_hotels=10000, seed=1):
+        super().__init__(address, MockApiHandler)
+        self.shape = shape
+        self.faults = faults
+        self.total_hotels = total_hotels
+        self.seed = seed
+        self.fault_rng = random.Random(seed)
+        self.fault_lock = threading.Lock()
+        self.scripted = collections.deque()
+        # X-Signature header of the last requests received, in order
+        self.signatures = collections.deque(maxlen=1000)
+        # Gzipped bodies are cached (about 2 kB per hotel with the default shape) so that after warm()
+        # the stand-in is not what limits a benchmark run
+        self.page_body = functools.lru_cache(maxsize=None)(self._page_body)
+
+    def _page_body(self, endpoint, from_index, to_index):
+        page = synthetic_page(endpoint, from_index, to_index, self.shape, self.total_hotels, self.seed)
+        if page is None:
+            return None
+        return gzip.compress(json.dumps(page).encode('utf-8'), compresslevel=6)
+
+    # Function to queue error responses, each a status code or (status, headers), that are served to the
+    # next requests in order before the pages (and injected faults) are again
+    def script(self, *responses):
+        with self.fault_lock:
+            for response in responses:
+                self.scripted.append(response if isinstance(response, tuple) else (response, {}))
+
+    # Function to build the hotel pages for a list of (from_index, to_index) ranges ahead of a run
+    def warm(self, page_ranges, endpoint='hotels'):
+        for from_index, to_index in page_ranges:
+            self.page_body(endpoint, from_index, to_index)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}{API_PREFIX}'
+
+
+# Function to start the mock API on a background thread; port 0 picks a free port (see server.base_url)
+def start_mock_api(port=0, host='127.0.0.1', shape=HotelShape(), faults=Faults(), total_hotels=10000, seed=1):
+    server = MockApiServer((host, port), shape, faults, total_hotels, seed)
+    threading.Thread(target=server.serve_forever, name='mock-api', daemon=True).start()
+    return server
+
+
+def add_shape_arguments(parser):
+    defaults = HotelShape()
+    for field in HotelShape._fields:
+        parser.add_argument(f'--{field.replace("_", "-")}', type=int, default=getattr(defaults, field),
+                            help=f'Per hotel (default: {getattr(defaults, field)})')
+
+
+def add_fault_arguments(parser):
+    parser.add_argument('--latency-ms', type=float, default=0, help='Fixed latency added to every response')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Up to this much more latency, at random')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of responses that are 500s')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of responses that are 429s')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with a 429')
+    parser.add_argument('--latency-per-record-ms', type=float, default=0,
+                        help='Latency added per record requested, so bigger pages take longer')
+
+
+def shape_from_args(args):
+    return HotelShape(**{field: getattr(args, field) for field in HotelShape._fields})
+
+
+def faults_from_args(args):
+    return Faults(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate, args.retry_after,
+                  args.latency_per_record_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve synthetic Hotelbeds content API pages locally.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--hotels', type=int, default=10000, help='Total hotels served')
+    parser.add_argument('--seed', type=int, default=1)
+    add_shape_arguments(parser)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockApiServer((args.host, args.port), shape_from_args(args), faults_from_args(args), args.hotels,
+                           args.seed)
+    print(f"Serving {args.hotels} synthetic hotels on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+-- Normalized hotel tables written by main.py, for a disposable local MySQL/MariaDB used in benchmarks.
+-- Column names follow the INSERT statements in main.py; rooms and stays use an AUTO_INCREMENT `id`
+-- that hb_room_features.room_id, hb_room_stays.room_id and hb_room_stay_facilities.stay_id refer to.
+
+CREATE TABLE IF NOT EXISTS hb_hotel_info (
+    hotel_code INT NOT NULL,
+    hotel_name VARCHAR(255),
+    category_code VARCHAR(16),
+    accommodation_type_code VARCHAR(32),
+    email VARCHAR(255),
+    website VARCHAR(255),
+    last_update DATE,
+    S2C VARCHAR(16),
+    ranking INT,
+    KEY idx_hotel_info_code (hotel_code)
+);
+
+CREATE TABLE IF NOT EXISTS hb_location_coordinates (
+    hotel_code INT NOT NULL,
+    longitude DOUBLE,
+    latitude DOUBLE,
+    country_code VARCHAR(8),
+    state_code VARCHAR(16),
+    destination_code VARCHAR(16),
+    zone_code INT,
+    city VARCHAR(255),
+    KEY idx_location_hotel (hotel_code)
+);
+
+CREATE TABLE IF NOT EXISTS hb_description (
+    hotel_code INT NOT NULL,
+    description_text TEXT,
+    KEY idx_description_hotel (hotel_code)
+);
+
+CREATE TABLE IF NOT EXISTS hb_facilities (
+    hotel_code INT NOT NULL,
+    facility_code INT,
+    facility_group_code INT,
+    number INT,
+    voucher TINYINT(1),
+    KEY idx_facilities_hotel (hotel_code)
+);
+
+CREATE TABLE IF NOT EXISTS hb_rooms_type (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    hotel_code INT NOT NULL,
+    room_code VARCHAR(32),
+    room_type VARCHAR(16),
+    characteristic_code VARCHAR(16),
+    min_pax INT,
+    max_pax INT,
+    min_adults INT,
+    max_adults INT,
+    max_children INT,
+    is_parent_room TINYINT(1),
+    KEY idx_rooms_hotel_room (hotel_code, room_code)
+);
+
+CREATE TABLE IF NOT EXISTS hb_room_features (
+    room_id INT NOT NULL,
+    facility_code INT,
+    facility_group_code INT,
+    ind_logic TINYINT(1),
+    number INT,
+    voucher TINYINT(1),
+    KEY idx_room_features_room (room_id)
+);
+
+CREATE TABLE IF NOT EXISTS hb_room_stays (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    room_id INT NOT NULL,
+    stay_type VARCHAR(16),
+    `orderid` VARCHAR(8),
+    description VARCHAR(255),
+    KEY idx_room_stays_room (room_id, stay_type, `orderid`)
+);
+
+CREATE TABLE IF NOT EXISTS hb_room_stay_facilities (
+    stay_id INT NOT NULL,
+    facility_code INT,
+    facility_group_code INT,
+    number INT,
+    KEY idx_stay_facilities_stay (stay_id)
+);
+
+CREATE TABLE IF NOT EXISTS hb_phone_numbers (
+    hotel_code INT NOT NULL,
+    phone_number VARCHAR(64),
+    phone_type VARCHAR(32),
+    KEY idx_phones_hotel (hotel_code)
+);
+
+CREATE TABLE IF NOT EXISTS hb_board_codes (
+    hotel_code INT NOT NULL,
+    board_code VARCHAR(8),
+    KEY idx_board_codes_hotel (hotel_code)
+);
+
+CREATE TABLE IF NOT EXISTS hb_address (
+    hotel_code INT NOT NULL,
+    address VARCHAR(512),
+    city VARCHAR(255),
+    KEY idx_address_hotel (hotel_code)
+);
+
+CREATE TABLE IF NOT EXISTS hb_images (
+    hotel_code INT NOT NULL,
+    image_type_code VARCHAR(8),
+    path VARCHAR(255),
+    image_order INT,
+    visual_order INT,
+    room_code VARCHAR(32),
+    room_type VARCHAR(16),
+    characteristic_code VARCHAR(16),
+    KEY idx_images_hotel (hotel_code)
+);
@@ -0,0 +1,25 @@
+-- hb_hotel_info as main_new.py writes it (one row per hotel with its nested data as JSON columns), for a
+-- disposable local MySQL/MariaDB used in benchmarks. It shares its name with the normalized table in
+-- schema.sql, so the benchmark drops whichever one is there before loading with the other.
+
+CREATE TABLE IF NOT EXISTS hb_hotel_info (
+    hotel_code INT NOT NULL,
+    hotel_name VARCHAR(255),
+    category_code VARCHAR(16),
+    accommodation_type_code VARCHAR(32),
+    email VARCHAR(255),
+    website VARCHAR(255),
+    last_update DATE,
+    S2C VARCHAR(16),
+    ranking INT,
+    coordinates JSON,
+    city VARCHAR(255),
+    facilities JSON,
+    rooms JSON,
+    images JSON,
+    phones JSON,
+    board_codes JSON,
+    address VARCHAR(512),
+    hotel_details JSON,
+    KEY idx_hotel_info_code (hotel_code)
+);
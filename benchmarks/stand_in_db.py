@@ -0,0 +1,152 @@
+# In-process stand-in for MySQL, for benchmarking the loaders where no disposable MySQL/MariaDB is at
+# hand. It takes the statements the loaders send through the mysql.connector connection API and keeps
+# only what they read back: row counts per table and the AUTO_INCREMENT ids of rooms and stays. Runs
+# against it measure everything but the server's own work (fetching, parsing, transforming and building
+# statements), so compare them with each other, not with runs against a real server. Rollbacks are not
+# undone; the synthetic pages never make a loader roll back.
+#
+# install() points db_pool.create_pool and mysql.connector.connect at it for the current process.
+import collections
+import re
+import threading
+
+import mysql.connector
+
+import db_pool
+
+INSERT_PATTERN = re.compile(r'^\s*INSERT\s+INTO\s+`?(\w+)`?\s*\(([^)]*)\)', re.IGNORECASE)
+COUNT_PATTERN = re.compile(r'SELECT\s+COUNT\(\*\)\s+FROM\s+`?(\w+)`?', re.IGNORECASE)
+TABLE_PATTERN = re.compile(r'^\s*(?:DROP|TRUNCATE)\s+TABLE\s+(?:IF\s+EXISTS\s+)?`?(\w+)`?', re.IGNORECASE)
+
+# Tables whose ids the loaders look up after inserting, and the natural key they look them up by
+ID_KEYS = {
+    'hb_rooms_type': ('hotel_code', 'room_code'),
+    'hb_room_stays': ('room_id', 'stay_type', 'orderid'),
+}
+
+
+class StandInDatabase:
+    def __init__(self):
+        self.row_counts = collections.Counter()
+        # {table_name: {first key column value: {natural key: id}}}
+        self.ids = {table_name: collections.defaultdict(dict) for table_name in ID_KEYS}
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def insert(self, table_name, columns, rows):
+        with self.lock:
+            self.row_counts[table_name] += len(rows)
+            if table_name not in ID_KEYS:
+                return None
+            positions = [columns.index(column) for column in ID_KEYS[table_name]]
+            ids = self.ids[table_name]
+            for row in rows:
+                key = tuple(row[position] for position in positions)
+                ids[key[0]][key] = self.next_id
+                self.next_id += 1
+            return self.next_id - 1
+
+    # Function to answer the room and stay id lookups: ids whose first key column is one of values
+    def lookup_ids(self, table_name, values):
+        ids = self.ids[table_name]
+        with self.lock:
+            return [key + (row_id,) for value in set(values) if value in ids for key, row_id in ids[value].items()]
+
+    def reset(self, table_name):
+        with self.lock:
+            self.row_counts.pop(table_name, None)
+            if table_name in self.ids:
+                self.ids[table_name] = collections.defaultdict(dict)
+
+
+def _columns(column_list):
+    return [column.strip(' `') for column in column_list.split(',')]
+
+
+class StandInCursor:
+    def __init__(self, database):
+        self.database = database
+        self.results = []
+        self.lastrowid = None
+        self.rowcount = 0
+
+    def execute(self, query, params=()):
+        self.results = []
+        match = INSERT_PATTERN.match(query)
+        if match:
+            self.lastrowid = self.database.insert(match.group(1), _columns(match.group(2)), [params])
+            self.rowcount = 1
+            return
+        match = COUNT_PATTERN.search(query)
+        if match:
+            self.results = [(self.database.row_counts[match.group(1)],)]
+            return
+        match = TABLE_PATTERN.match(query)
+        if match:
+            self.database.reset(match.group(1))
+            return
+        for table_name in ID_KEYS:
+            if f'FROM {table_name}' in query and query.lstrip().upper().startswith('SELECT'):
+                self.results = self.database.lookup_ids(table_name, params)
+                return
+        # Anything else (DDL, savepoints, content hash lookups, deletes) has nothing to read back
+
+    def executemany(self, query, rows):
+        self.results = []
+        match = INSERT_PATTERN.match(query)
+        if not match:
+            raise mysql.connector.ProgrammingError(f"Stand-in executemany only takes INSERTs: {query[:60]}")
+        rows = list(rows)
+        self.lastrowid = self.database.insert(match.group(1), _columns(match.group(2)), rows)
+        self.rowcount = len(rows)
+
+    def fetchall(self):
+        results, self.results = self.results, []
+        return results
+
+    def fetchone(self):
+        return self.results.pop(0) if self.results else None
+
+    def close(self):
+        pass
+
+
+class StandInConnection:
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, **kwargs):
+        return StandInCursor(self.database)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class StandInPool:
+    def __init__(self, database):
+        self.database = database
+
+    def get_connection(self):
+        return StandInConnection(self.database)
+
+
+_database = StandInDatabase()
+
+
+# Function to route the loaders' MySQL connections in this process to the stand-in; returns the database
+def install():
+    db_pool.create_pool = lambda pool_size, pool_name='hb_ingest': StandInPool(_database)
+    mysql.connector.connect = lambda **kwargs: StandInConnection(_database)
+    return _database
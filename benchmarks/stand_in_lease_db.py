@@ -0,0 +1,94 @@
+# SQLite stand-in for the MySQL database holding the range lease table, so RangeLeaseStore and
+# run_leased_ingest can be exercised by several local processes sharing one file, without a MySQL
+# server. It takes the statements the lease store sends through the mysql.connector connection API and
+# rewrites the MySQL-only parts for SQLite: UPDATE ... ORDER BY ... LIMIT (as an UPDATE of the rowids a
+# subquery picks), NOW(3) and NOW(3) + INTERVAL n SECOND (as seconds from clock), INSERT IGNORE and the
+# MySQL-only column options and indexes of the CREATE TABLE. SQLite runs one write at a time per file,
+# which is what makes a claim atomic here; MySQL gets there with row locks instead.
+#
+# Use connect as the lease store's connect function:
+#     RangeLeaseStore(functools.partial(stand_in_lease_db.connect, 'leases.sqlite3'), crawl_id)
+import re
+import sqlite3
+import time
+
+import mysql.connector
+
+LIMITED_UPDATE_PATTERN = re.compile(
+    r'^\s*UPDATE\s+(\w+)\s+SET\s+(.*?)\s+WHERE\s+(.*?)\s+ORDER\s+BY\s+(.*?)\s+LIMIT\s+\?\s*$', re.DOTALL)
+INDEX_PATTERN = re.compile(r',\s*KEY\s+\w+\s*\([^)]*\)')
+
+# MySQL errno the lease store retries a claim after, for SQLite's "database is locked"
+LOCK_WAIT_TIMEOUT = 1205
+
+
+# Function to rewrite a lease store statement for SQLite
+def translate(query):
+    query = query.replace('%s', '?')
+    query = query.replace('NOW(3) + INTERVAL ? SECOND', '(now3() + ?)').replace('NOW(3)', 'now3()')
+    query = query.replace('INSERT IGNORE', 'INSERT OR IGNORE')
+    query = query.replace('CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3)', 'CURRENT_TIMESTAMP')
+    query = INDEX_PATTERN.sub('', query)
+    match = LIMITED_UPDATE_PATTERN.match(query)
+    if match:
+        table_name, assignments, condition, order = match.groups()
+        query = (f"UPDATE {table_name} SET {assignments} WHERE rowid IN "
+                 f"(SELECT rowid FROM {table_name} WHERE {condition} ORDER BY {order} LIMIT ?)")
+    return query
+
+
+def _mysql_error(err):
+    errno = LOCK_WAIT_TIMEOUT if 'locked' in str(err) else None
+    return mysql.connector.DatabaseError(msg=str(err), errno=errno)
+
+
+class StandInLeaseCursor:
+    def __init__(self, connection):
+        self.cursor = connection.cursor()
+
+    @property
+    def with_rows(self):
+        return self.cursor.description is not None
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def execute(self, query, params=()):
+        try:
+            self.cursor.execute(translate(query), params)
+        except sqlite3.Error as err:
+            raise _mysql_error(err) from err
+
+    def executemany(self, query, params):
+        try:
+            self.cursor.executemany(translate(query), params)
+        except sqlite3.Error as err:
+            raise _mysql_error(err) from err
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def close(self):
+        self.cursor.close()
+
+
+# Autocommitting connection to the SQLite file at path. clock gives the database time in seconds, so a
+# test can move it forward to expire leases instead of waiting for them.
+class StandInLeaseConnection:
+    def __init__(self, path, clock=time.time):
+        self.connection = sqlite3.connect(path, isolation_level=None, timeout=30, check_same_thread=False)
+        self.connection.create_function('now3', 0, clock)
+
+    def cursor(self, **kwargs):
+        return StandInLeaseCursor(self.connection)
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        self.connection.close()
+
+
+def connect(path, clock=time.time):
+    return StandInLeaseConnection(path, clock)
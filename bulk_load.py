@@ -0,0 +1,245 @@
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import mysql.connector
+
+import main as hotel_loader
+from archive import list_archive_sources, read_archive_pages
+from dead_letter import dead_letter_entry, write_dead_letters
+from transform import HOTEL_TABLES, flatten_hotels_separately
+
+# Tables in the order they are loaded: parents before the rows that point at them
+BULK_LOAD_TABLES = HOTEL_TABLES
+
+# Rooms and stays get their ids assigned here instead of by AUTO_INCREMENT, so child rows can be
+# written to the staging files before anything reaches MySQL
+TABLES_WITH_ASSIGNED_IDS = ('hb_rooms_type', 'hb_room_stays')
+
+HOTEL_PAGE_PREFIXES = ('hotel_data_', 'hotel_delta_')
+
+_TSV_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+
+
+# Function to read the column list of a table from the batched INSERT statement in main.py
+def table_columns(table_name):
+    match = re.search(r'INSERT INTO \w+ \(([^)]*)\)', hotel_loader.BATCH_INSERT_QUERIES[table_name])
+    columns = [column.strip() for column in match.group(1).split(',')]
+    if table_name in TABLES_WITH_ASSIGNED_IDS:
+        columns.insert(0, 'id')
+    return columns
+
+
+# Function to format one value the way LOAD DATA's default FIELDS/LINES options expect it
+def tsv_value(value):
+    if value is None:
+        return '\\N'
+    if value is True:
+        return '1'
+    if value is False:
+        return '0'
+    return str(value).translate(_TSV_ESCAPES)
+
+
+# Per-table tab-separated staging files for one bulk load, plus the id counters for rooms and stays
+class StagingFiles:
+    def __init__(self, directory, next_room_id, next_stay_id):
+        self.directory = directory
+        self.files = {table_name: open(os.path.join(directory, f'{table_name}.tsv'), 'w', encoding='utf-8',
+                                       newline='\n')
+                      for table_name in BULK_LOAD_TABLES}
+        self.row_counts = dict.fromkeys(BULK_LOAD_TABLES, 0)
+        self.dead_lettered = 0
+        self.next_room_id = next_room_id
+        self.next_stay_id = next_stay_id
+
+    def path(self, table_name):
+        return os.path.join(self.directory, f'{table_name}.tsv')
+
+    def write_rows(self, table_name, rows):
+        self.files[table_name].writelines('\t'.join(map(tsv_value, row)) + '\n' for row in rows)
+        self.row_counts[table_name] += len(rows)
+
+    # Function to flatten a page of hotels into the staging files, giving every room and stay its id.
+    # Hotels that cannot be flattened are written to the dead letter file instead.
+    def write_page(self, hotel_data):
+        rows, _, failed = flatten_hotels_separately(hotel_data)
+        if failed:
+            write_dead_letters([dead_letter_entry('hotels', hotel, err) for hotel, err in failed])
+            self.dead_lettered += len(failed)
+            for hotel, err in failed:
+                code = hotel.get('code') if isinstance(hotel, dict) else None
+                logging.warning(f"Dead-lettered hotel {code}: {type(err).__name__}: {err}")
+
+        room_ids = {}
+        rooms = []
+        for row in rows['hb_rooms_type']:
+            room_ids[(row[0], row[1])] = self.next_room_id
+            rooms.append((self.next_room_id,) + row)
+            self.next_room_id += 1
+
+        stay_ids = {}
+        stays = []
+        for row in rows['hb_room_stays']:
+            (hotel_code, room_code), stay_type, order = row[0], row[1], row[2]
+            stay_ids[(hotel_code, room_code, stay_type, order)] = self.next_stay_id
+            stays.append((self.next_stay_id, room_ids[(hotel_code, room_code)]) + row[1:])
+            self.next_stay_id += 1
+
+        rows['hb_rooms_type'] = rooms
+        rows['hb_room_stays'] = stays
+        rows['hb_room_features'] = [(room_ids[row[0]],) + row[1:] for row in rows['hb_room_features']]
+        rows['hb_room_stay_facilities'] = [(stay_ids[row[0]],) + row[1:] for row in rows['hb_room_stay_facilities']]
+
+        for table_name in BULK_LOAD_TABLES:
+            self.write_rows(table_name, rows[table_name])
+        return len(rows['hb_hotel_info'])
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+
+
+# Function to open a MySQL connection that may use LOAD DATA LOCAL INFILE
+def connect_for_bulk_load():
+    try:
+        return mysql.connector.connect(
+            host=os.getenv('DB_HOST'),
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASS'),
+            database=os.getenv('DB_NAME'),
+            allow_local_infile=True
+        )
+    except mysql.connector.Error as err:
+        logging.error(f"Error connecting to MySQL: {err}")
+        return None
+
+
+def next_id(cursor, table_name):
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table_name}")
+    return cursor.fetchone()[0]
+
+
+# Function to iterate over the archived hotel pages in a directory as parsed page dicts; pages that are
+# not valid JSON are logged and skipped
+def iter_archived_hotel_pages(archive_dir):
+    for source in list_archive_sources(archive_dir):
+        for name, body in read_archive_pages(source):
+            if os.path.basename(name).startswith(HOTEL_PAGE_PREFIXES):
+                try:
+                    yield json.loads(body)
+                except ValueError as err:
+                    logging.error(f"Bulk load skipped page {name}, which could not be parsed: {err}")
+
+
+# Function to iterate over freshly fetched hotel pages (archived as usual) for a from/to range
+def iter_fetched_hotel_pages(start_index, end_index, batch_size):
+    for from_index in range(start_index, end_index, batch_size):
+        to_index = from_index + batch_size - 1
+        hotel_data = hotel_loader.fetch_hotel_data(from_index, to_index,
+                                                   archive_name=f'hotel_data_{from_index}_{to_index}')
+        if hotel_data:
+            yield hotel_data
+        else:
+            logging.error(f"Bulk load skipped records {from_index} to {to_index}: fetch failed")
+
+
+# Function to load pages of hotels through per-table staging files and LOAD DATA LOCAL INFILE.
+# Room and stay ids are assigned from the current MAX(id), so nothing else may write those two tables
+# while a bulk load runs; it is meant for cold, initial loads. The LOAD DATA statements run in one
+# transaction, so on InnoDB a failed load leaves no rows behind. With defer_constraints, unique and
+# foreign key checks are off for the session during the load. (ALTER TABLE ... DISABLE KEYS is not
+# used: InnoDB ignores it, and the ALTER would commit the transaction part way.)
+def bulk_load(pages, conn, staging_dir=None, defer_constraints=False, keep_staging=False):
+    staging_dir = staging_dir or tempfile.mkdtemp(prefix='hb_bulk_load_')
+    os.makedirs(staging_dir, exist_ok=True)
+    cursor = conn.cursor()
+    table_name = None
+    started = time.monotonic()
+
+    try:
+        staging = StagingFiles(staging_dir, next_id(cursor, 'hb_rooms_type'), next_id(cursor, 'hb_room_stays'))
+        hotels = 0
+        try:
+            for hotel_data in pages:
+                hotels += staging.write_page(hotel_data)
+        finally:
+            staging.close()
+        staged = time.monotonic()
+        logging.info(f"Bulk load staged {hotels} hotels in {staged - started:.1f}s "
+                     f"({staging.dead_lettered} dead-lettered): {staging.row_counts}")
+
+        if defer_constraints:
+            cursor.execute("SET SESSION unique_checks = 0")
+            cursor.execute("SET SESSION foreign_key_checks = 0")
+
+        for table_name in BULK_LOAD_TABLES:
+            columns = ', '.join(f'`{column}`' for column in table_columns(table_name))
+            cursor.execute(f"""
+                LOAD DATA LOCAL INFILE %s INTO TABLE {table_name}
+                CHARACTER SET utf8mb4
+                ({columns})
+            """, (staging.path(table_name),))
+
+        if defer_constraints:
+            cursor.execute("SET SESSION unique_checks = 1")
+            cursor.execute("SET SESSION foreign_key_checks = 1")
+
+        conn.commit()
+        logging.info(f"Bulk load loaded {hotels} hotels in {time.monotonic() - staged:.1f}s.")
+        return staging.row_counts
+
+    except mysql.connector.Error as err:
+        logging.error(f"Error bulk loading MySQL table: {table_name}, Error: {err}")
+        conn.rollback()
+        return None
+
+    finally:
+        cursor.close()
+        if not keep_staging:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Bulk load Hotelbeds hotels with LOAD DATA LOCAL INFILE.')
+    parser.add_argument('--archive-dir', help='Load the archived hotel pages in this directory')
+    parser.add_argument('--start', type=int, help='Fetch from the API starting at this index instead')
+    parser.add_argument('--end', type=int, help='End index when fetching from the API')
+    parser.add_argument('--batch-size', type=int, default=100, help='Number of records per batch when fetching')
+    parser.add_argument('--staging-dir', help='Where to write the TSV staging files (default: a temp dir)')
+    parser.add_argument('--keep-staging', action='store_true', help='Keep the staging files after loading')
+    parser.add_argument('--defer-constraints', action='store_true',
+                        help='Disable unique/foreign key checks during the load')
+    args = parser.parse_args()
+    if bool(args.archive_dir) == (args.start is not None):
+        parser.error('pass either --archive-dir or --start/--end')
+    if args.start is not None and args.end is None:
+        parser.error('--start needs --end')
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.archive_dir:
+        pages = iter_archived_hotel_pages(args.archive_dir)
+    else:
+        pages = iter_fetched_hotel_pages(args.start, args.end, args.batch_size)
+
+    conn = connect_for_bulk_load()
+    if not conn:
+        return
+    try:
+        row_counts = bulk_load(pages, conn, args.staging_dir, args.defer_constraints, args.keep_staging)
+        if row_counts:
+            print(f"Bulk load finished: {row_counts}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import sqlite3
+import threading
+import time
+
+from paginator import merge_ranges
+
+DEFAULT_CHECKPOINT_FILE = 'ingest_checkpoints.sqlite3'
+
+IN_FLIGHT = 'in_flight'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+# Persistent record of which from/to page ranges each resource has loaded, kept in a small SQLite file.
+# Every range is marked in_flight when it is picked up and completed/failed when it is done, so a run
+# started with --resume skips the records the completed ranges cover and retries the rest, including
+# any in_flight ranges left behind by a crash. Runs may use different page sizes.
+# It also keeps the high-water mark each resource's incremental sync continues from, and the page size
+# the adaptive paginator settled on.
+class CheckpointStore:
+    def __init__(self, path=DEFAULT_CHECKPOINT_FILE):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS page_progress (
+                    resource TEXT NOT NULL,
+                    from_index INTEGER NOT NULL,
+                    to_index INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (resource, from_index, to_index)
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS page_size_state (
+                    resource TEXT PRIMARY KEY,
+                    page_size INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    resource TEXT PRIMARY KEY,
+                    high_water_mark TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self.conn.commit()
+
+    def _set_status(self, resource, from_index, to_index, status, error=None):
+        attempts = 1 if status == IN_FLIGHT else 0
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO page_progress (resource, from_index, to_index, status, attempts, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (resource, from_index, to_index) DO UPDATE SET
+                    status = excluded.status,
+                    attempts = page_progress.attempts + excluded.attempts,
+                    error = excluded.error,
+                    updated_at = excluded.updated_at
+            """, (resource, from_index, to_index, status, attempts, error, time.time()))
+            self.conn.commit()
+
+    def mark_in_flight(self, resource, from_index, to_index):
+        self._set_status(resource, from_index, to_index, IN_FLIGHT)
+
+    def mark_completed(self, resource, from_index, to_index):
+        self._set_status(resource, from_index, to_index, COMPLETED)
+
+    def mark_failed(self, resource, from_index, to_index, error=None):
+        self._set_status(resource, from_index, to_index, FAILED, error)
+
+    # Function to list the merged (from_index, to_index) ranges of a resource that are completed
+    def completed_ranges(self, resource):
+        with self.lock:
+            completed = self.conn.execute(
+                "SELECT from_index, to_index FROM page_progress WHERE resource = ? AND status = ?",
+                (resource, COMPLETED)
+            ).fetchall()
+        return merge_ranges(completed)
+
+    # Function to drop the ranges whose records completed ranges already cover, keeping the order of the input
+    def pending_ranges(self, resource, ranges):
+        completed = self.completed_ranges(resource)
+        return [page for page in ranges
+                if not any(from_index <= page[0] and page[1] <= to_index for from_index, to_index in completed)]
+
+    # Function to count a resource's ranges by status; with since (a time.time() value), only the ranges
+    # updated from then on, i.e. the ones a run started at that time has picked up so far
+    def summary(self, resource, since=None):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM page_progress WHERE resource = ? AND updated_at >= ? GROUP BY status",
+                (resource, since or 0)
+            ).fetchall()
+        return dict(rows)
+
+    # Function to forget all recorded ranges of a resource
+    def reset(self, resource):
+        with self.lock:
+            self.conn.execute("DELETE FROM page_progress WHERE resource = ?", (resource,))
+            self.conn.commit()
+
+    # Function to read the point an incremental sync of a resource should continue from
+    def get_high_water_mark(self, resource):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT high_water_mark FROM sync_state WHERE resource = ?", (resource,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_high_water_mark(self, resource, high_water_mark):
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO sync_state (resource, high_water_mark, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (resource) DO UPDATE SET
+                    high_water_mark = excluded.high_water_mark,
+                    updated_at = excluded.updated_at
+            """, (resource, high_water_mark, time.time()))
+            self.conn.commit()
+
+    # Function to read the page size the adaptive paginator last settled on for a resource
+    def get_page_size(self, resource):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT page_size FROM page_size_state WHERE resource = ?", (resource,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_page_size(self, resource, page_size):
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO page_size_state (resource, page_size, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (resource) DO UPDATE SET
+                    page_size = excluded.page_size,
+                    updated_at = excluded.updated_at
+            """, (resource, page_size, time.time()))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
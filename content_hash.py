@@ -0,0 +1,55 @@
+import hashlib
+import json
+
+# Rows per SELECT/INSERT when reading or writing hashes for a page
+HASH_CHUNK_SIZE = 1000
+
+
+# Function to hash a hotel's canonical JSON (sorted keys, no whitespace) so that the same content
+# always gives the same hash no matter how the API ordered the keys
+def hotel_content_hash(hotel):
+    canonical = json.dumps(hotel, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+# Function to create the per-hotel hash index table if it does not exist yet
+def create_hash_table(cursor, table_name):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            hotel_code INT NOT NULL PRIMARY KEY,
+            content_hash CHAR(64) NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+
+
+# Function to read the stored hashes for a set of hotels, as {hotel_code: content_hash}
+def fetch_stored_hashes(cursor, table_name, hotel_codes):
+    stored = {}
+    for start in range(0, len(hotel_codes), HASH_CHUNK_SIZE):
+        chunk = tuple(hotel_codes[start:start + HASH_CHUNK_SIZE])
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(f"SELECT hotel_code, content_hash FROM {table_name} WHERE hotel_code IN ({placeholders})",
+                       chunk)
+        stored.update(cursor.fetchall())
+    return stored
+
+
+# Function to write {hotel_code: content_hash} with one multi-row upsert per chunk
+def store_hashes(cursor, table_name, hashes):
+    rows = list(hashes.items())
+    query = f"""
+        INSERT INTO {table_name} (hotel_code, content_hash) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE content_hash = VALUES(content_hash)
+    """
+    for start in range(0, len(rows), HASH_CHUNK_SIZE):
+        cursor.executemany(query, rows[start:start + HASH_CHUNK_SIZE])
+
+
+# Function to split a page of hotels into the ones whose content changed (or are new) and their hashes.
+# Returns (changed_hotels, {hotel_code: new_hash}, unchanged_count).
+def changed_hotels(cursor, table_name, hotels):
+    hashes = {hotel['code']: hotel_content_hash(hotel) for hotel in hotels}
+    stored = fetch_stored_hashes(cursor, table_name, list(hashes))
+    changed = [hotel for hotel in hotels if stored.get(hotel['code']) != hashes[hotel['code']]]
+    return changed, {hotel['code']: hashes[hotel['code']] for hotel in changed}, len(hotels) - len(changed)
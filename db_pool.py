@@ -0,0 +1,68 @@
+import logging
+import os
+import time
+
+import mysql.connector
+from mysql.connector import pooling
+
+
+# Function to create a pool of MySQL connections from the DB_* environment variables.
+# mysql.connector opens all pool_size connections up front and caps pools at CNX_POOL_MAXSIZE.
+def create_pool(pool_size, pool_name='hb_ingest'):
+    return pooling.MySQLConnectionPool(
+        pool_name=pool_name,
+        pool_size=max(1, min(pool_size, pooling.CNX_POOL_MAXSIZE)),
+        pool_reset_session=True,
+        host=os.getenv('DB_HOST'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASS'),
+        database=os.getenv('DB_NAME')
+    )
+
+
+# Function to check that a connection is still alive, reconnecting it if the server dropped it.
+# Raises mysql.connector.Error if it cannot be brought back.
+def ensure_connection(conn, attempts=3, delay=2):
+    conn.ping(reconnect=True, attempts=attempts, delay=delay)
+    return conn
+
+
+# Function to take a healthy connection from the pool, waiting up to timeout seconds while all of
+# them are in use. close() on the returned connection gives it back to the pool.
+def get_connection(pool, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            conn = pool.get_connection()
+            break
+        except pooling.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.1)
+    return ensure_connection(conn)
+
+
+# Function to load a page with a writer's connection, replacing a dropped connection and retrying
+# the page once if the first attempt failed because the connection went away.
+# Returns (loaded, connection to keep using).
+def load_with_reconnect(pool, conn, load, page, description):
+    loaded = False
+    for attempt in range(2):
+        try:
+            conn = ensure_connection(conn) if conn else get_connection(pool)
+            loaded = load(page, conn)
+        except Exception as e:
+            logging.error(f"Writer failed for {description}: {e}")
+        if loaded or (conn and conn.is_connected()):
+            break
+        if attempt == 0:
+            logging.warning(f"MySQL connection lost, reconnecting to retry {description}.")
+    return loaded, conn
+
+
+def close_connection(conn):
+    if conn:
+        try:
+            conn.close()
+        except mysql.connector.Error as err:
+            logging.error(f"Error closing MySQL connection: {err}")
@@ -0,0 +1,82 @@
+import datetime
+import json
+import os
+import threading
+
+DEFAULT_DEAD_LETTER_FILE = 'dead_letter.jsonl'
+
+# Writer threads append to the same file
+_file_lock = threading.Lock()
+
+# Codes of the records the last page loaded on each thread dead-lettered, so what is done with the page
+# afterwards (its export) can leave them out
+_last_page = threading.local()
+
+
+# Path of the JSON Lines file dead letters are appended to (DEAD_LETTER_FILE)
+def dead_letter_path():
+    return os.getenv('DEAD_LETTER_FILE', DEFAULT_DEAD_LETTER_FILE)
+
+
+# Name of the MySQL table dead letters are also stored in (DEAD_LETTER_TABLE), or None for file only
+def dead_letter_table():
+    return os.getenv('DEAD_LETTER_TABLE') or None
+
+
+# Function to describe a record that could not be loaded, keeping the record's original JSON so it
+# can be fixed up and replayed later
+def dead_letter_entry(resource, record, error, table_name=None):
+    return {
+        'resource': resource,
+        'code': record.get('code') if isinstance(record, dict) else None,
+        'table': table_name,
+        'error': f'{type(error).__name__}: {error}',
+        'failed_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'record': record,
+    }
+
+
+# Function to create the dead letter table if it does not exist yet
+def create_dead_letter_table(cursor, table_name):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            resource VARCHAR(64) NOT NULL,
+            record_code VARCHAR(64),
+            table_name VARCHAR(64),
+            error TEXT NOT NULL,
+            record LONGTEXT NOT NULL,
+            failed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_resource_code (resource, record_code)
+        )
+    """)
+
+
+# Function to write dead letters to the table in the caller's transaction
+def store_dead_letters(cursor, table_name, entries):
+    cursor.executemany(f"""
+        INSERT INTO {table_name} (resource, record_code, table_name, error, record)
+        VALUES (%s, %s, %s, %s, %s)
+    """, [(entry['resource'], None if entry['code'] is None else str(entry['code']), entry['table'],
+           entry['error'], json.dumps(entry['record'], ensure_ascii=False)) for entry in entries])
+
+
+# Function to append dead letters to the JSON Lines file, one entry per line
+def write_dead_letters(entries, path=None):
+    lines = ''.join(json.dumps(entry, ensure_ascii=False, default=str) + '\n' for entry in entries)
+    with _file_lock:
+        with open(path or dead_letter_path(), 'a', encoding='utf-8') as file:
+            file.write(lines)
+
+
+# Function to note the dead letters of the page just loaded on this thread
+def note_page_dead_letters(entries):
+    _last_page.codes = {entry['code'] for entry in entries}
+
+
+# Function to get (and forget) the codes of the records dead-lettered from the page last loaded on this
+# thread
+def take_page_dead_letter_codes():
+    codes = getattr(_last_page, 'codes', None) or set()
+    _last_page.codes = set()
+    return codes
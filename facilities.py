@@ -1,10 +1,16 @@
+import argparse
 import requests
 import mysql.connector
-import hashlib
-import time
-import json
 import os
+import sys
 from dotenv import load_dotenv
+from hotelbeds_client import get_shared_client
+from archive import get_shared_archive
+from checkpoint import DEFAULT_CHECKPOINT_FILE
+import ingest
+from pipeline import IngestJob
+import metrics
+import profiling
 import logging
 
 # Load environment variables
@@ -15,43 +21,27 @@ logging.basicConfig(level=logging.DEBUG, filename='hotel_data.log',
                     format='%(asctime)s:%(levelname)s:%(message)s')
 
 
-def generate_api_signature(api_key, secret):
-    timestamp = str(int(time.time()))  # Get current timestamp in seconds
-    concatenated_string = api_key + secret + timestamp
-    signature = hashlib.sha256(concatenated_string.encode()).hexdigest()
-    return signature
-
-
-API_KEY = os.getenv('API_KEY')
-API_SECRET = os.getenv('API_SECRET')
-signature = generate_api_signature(API_KEY, API_SECRET)
-
-
-def save_json_to_file(data, filename):
-    with open(filename, 'w') as file:
-        json.dump(data, file, indent=4)
-
-
-# Function to fetch data from API
-def fetch_facility_data(from_index, to_index):
-    url = 'https://api.hotelbeds.com/hotel-content-api/1.0/types/facilities'
-    params = {
+# Function to build the query parameters for a page of facility types
+def facility_request_params(from_index, to_index):
+    return {
         'fields': 'all',
         'language': 'ENG',
         'from': from_index,
         'to': to_index,
         'useSecondaryLanguage': True
     }
-    headers = {
-        'Api-Key': API_KEY,
-        'X-Signature': signature,
-        'Accept': 'application/json'
-    }
+
+
+# Function to fetch data from API
+def fetch_facility_data(from_index, to_index, archive_name=None):
+    params = facility_request_params(from_index, to_index)
 
     try:
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        response = get_shared_client().get('types/facilities', params)
+        if archive_name:
+            get_shared_archive().write(archive_name, response.content)
+        with profiling.stage('parse_json'):
+            return response.json()
     except requests.exceptions.RequestException as e:
         logging.error(f"Failed to fetch data from API: {e}")
         return None
@@ -72,61 +62,67 @@ def connect_to_mysql():
         return None
 
 
-# Function to insert data into MySQL tables
+# Function to insert data into MySQL tables, one multi-row INSERT per page
 def insert_data_into_mysql(facility_data, conn):
     if not facility_data or not conn:
         logging.error("Invalid input data or MySQL connection.")
-        return
+        return False
 
     cursor = conn.cursor()
 
     try:
-        for facility in facility_data.get('facilities', []):
-            facility_query = """
-                INSERT INTO hb_facilities_data (code, facilityGroupCode, facilityTypologyCode, description)
-                VALUES (%s, %s, %s, %s)
-            """
-            facility_data_to_insert = (
+        facility_query = """
+            INSERT INTO hb_facilities_data (code, facilityGroupCode, facilityTypologyCode, description)
+            VALUES (%s, %s, %s, %s)
+        """
+        rows = [
+            (
                 facility.get('code'),
                 facility.get('facilityGroupCode'),
                 facility.get('facilityTypologyCode'),
                 facility['description'].get('content') if 'description' in facility else None
             )
+            for facility in facility_data.get('facilities', [])
+        ]
+        if rows:
+            with metrics.db_write('hb_facilities_data', len(rows)):
+                cursor.executemany(facility_query, rows)
 
-            # logging.debug(f"Inserting data: {facility_data_to_insert}")
-            cursor.execute(facility_query, facility_data_to_insert)
-
-        conn.commit()
-        logging.info("Data inserted into MySQL tables successfully.")
+        with metrics.DB_COMMIT_SECONDS.time():
+            conn.commit()
+        logging.info(f"Data inserted into MySQL tables successfully ({len(rows)} records).")
+        return True
 
     except Exception as e:
         logging.error(f"Error inserting data into MySQL: {e}")
         conn.rollback()
+        return False
 
     finally:
         cursor.close()
 
 
-def main():
-    batch_size = 100  # Number of records per batch
-    start_index = 1  # Starting index
-    end_index = 100  # End index
+# Name this script's page ranges are recorded under in the checkpoint store
+CHECKPOINT_RESOURCE = 'facilities'
+
+INGEST_JOB = IngestJob(CHECKPOINT_RESOURCE, fetch_facility_data, insert_data_into_mysql,
+                       'facilities/facility_data', endpoint='types/facilities',
+                       request_params=facility_request_params, records_key='facilities')
 
-    conn = connect_to_mysql()
-    if not conn:
-        return
 
-    for from_index in range(start_index, end_index + 1, batch_size):
-        to_index = min(from_index + batch_size - 1, end_index)
-        logging.info(f"Fetching records from {from_index} to {to_index}...")
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load Hotelbeds facility types into hb_facilities_data.')
+    parser.add_argument('--start', type=int, default=1, help='Starting index')
+    parser.add_argument('--end', type=int, default=100, help='End index')
+    parser.add_argument('--batch-size', type=int, default=100, help='Number of records per batch')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip ranges already completed in the checkpoint file and retry the rest')
+    parser.add_argument('--checkpoint-file', default=DEFAULT_CHECKPOINT_FILE)
+    return parser.parse_args()
 
-        facility_data = fetch_facility_data(from_index, to_index)
-        if facility_data:
-            # logging.debug(f"Fetched data: {facility_data}")
-            save_json_to_file(facility_data, f'facilities/facility_data_{from_index}_{to_index}.json')
-            insert_data_into_mysql(facility_data, conn)
 
-    conn.close()
+def main():
+    ingest.run_resource('facilities', parse_args(), module=sys.modules[__name__])
 
 
 if __name__ == "__main__":
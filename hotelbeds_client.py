@@ -0,0 +1,247 @@
+import email.utils
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import ijson
+except ImportError:  # streaming falls back to parsing the whole body at once
+    ijson = None
+
+import metrics
+import profiling
+from rate_limiter import RateLimiter
+
+DEFAULT_BASE_URL = 'https://api.hotelbeds.com/hotel-content-api/1.0'
+
+# Status codes worth retrying: quota exceeded and transient server/gateway errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def generate_api_signature(api_key, secret):
+    timestamp = str(int(time.time()))  # Get current timestamp in seconds
+    concatenated_string = api_key + secret + timestamp
+    signature = hashlib.sha256(concatenated_string.encode()).hexdigest()
+    return signature
+
+
+# Caches the X-Signature value and regenerates it once it is ttl seconds old.
+# Signatures embed the current timestamp and the API only accepts them for a short window,
+# so a long crawl must keep re-signing instead of reusing the one computed at start-up.
+class ApiSigner:
+    def __init__(self, api_key, api_secret, ttl=60):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.ttl = ttl
+        self.signature = None
+        self.signed_at = 0.0
+        self.lock = threading.Lock()
+
+    def get_signature(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.signature is None or now - self.signed_at >= self.ttl:
+                self.signature = generate_api_signature(self.api_key, self.api_secret)
+                self.signed_at = now
+            return self.signature
+
+    # Function to force a fresh signature on the next request (after an auth failure)
+    def invalidate(self):
+        with self.lock:
+            self.signature = None
+
+
+# File-like wrapper that copies every chunk read from a stream into sink, so the raw response body
+# can be archived while it is being parsed, without decoding and re-encoding it
+class TeeReader:
+    def __init__(self, stream, sink=None):
+        self.stream = stream
+        self.sink = sink
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        if data and self.sink is not None:
+            self.sink.write(data)
+        return data
+
+
+# Function to turn a Retry-After header (seconds or an HTTP date) into a delay in seconds
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+# Shared Hotelbeds content API client.
+# One pooled requests.Session keeps TCP/TLS connections alive between pages, asks for gzip,
+# applies connect/read timeouts and retries transient failures with exponential backoff and
+# full jitter. A 429/503 with Retry-After waits at least as long as the server asked.
+# Every attempt, retries included, first takes a token from the (optionally shared) rate limiter.
+# The X-Signature header comes from an ApiSigner on every attempt; a 401/403 re-signs and is
+# retried once without counting against max_retries.
+class HotelbedsClient:
+    def __init__(self, api_key, api_secret, base_url=DEFAULT_BASE_URL, connect_timeout=10, read_timeout=120,
+                 max_retries=5, backoff_base=1.0, backoff_max=60.0, pool_size=10, rate_limiter=None,
+                 signature_ttl=60):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+        self.signer = ApiSigner(api_key, api_secret, signature_ttl)
+        self.local = threading.local()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Api-Key': api_key,
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip'
+        })
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv('API_KEY'),
+            os.getenv('API_SECRET'),
+            base_url=os.getenv('HOTELBEDS_BASE_URL', DEFAULT_BASE_URL),
+            connect_timeout=float(os.getenv('HOTELBEDS_CONNECT_TIMEOUT', 10)),
+            read_timeout=float(os.getenv('HOTELBEDS_READ_TIMEOUT', 120)),
+            max_retries=int(os.getenv('HOTELBEDS_MAX_RETRIES', 5)),
+            backoff_base=float(os.getenv('HOTELBEDS_BACKOFF_BASE', 1.0)),
+            backoff_max=float(os.getenv('HOTELBEDS_BACKOFF_MAX', 60.0)),
+            pool_size=int(os.getenv('HOTELBEDS_POOL_SIZE', 10)),
+            rate_limiter=RateLimiter.from_env(),
+            signature_ttl=float(os.getenv('HOTELBEDS_SIGNATURE_TTL', 60))
+        )
+
+    def backoff_delay(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    # Function to GET an API path (e.g. 'hotels', 'types/facilities') with retries.
+    # Returns the final requests.Response; raises requests.exceptions.RequestException once retries run out.
+    def get(self, path, params=None, stream=False):
+        url = f'{self.base_url}/{path.lstrip("/")}'
+        attempt = 0
+        resigned = False
+        while True:
+            if self.rate_limiter:
+                waited = time.perf_counter()
+                self.rate_limiter.acquire()
+                waited = time.perf_counter() - waited
+                metrics.RATE_LIMIT_WAIT_SECONDS.inc(waited)
+                profiling.record('rate_limit_wait', waited)
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, headers={'X-Signature': self.signer.get_signature()},
+                                            timeout=self.timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                metrics.API_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=path, status='error')
+                profiling.record('api_request', time.perf_counter() - started)
+                if attempt >= self.max_retries:
+                    raise
+                metrics.API_RETRIES.inc(endpoint=path, reason=type(e).__name__)
+                delay = self.backoff_delay(attempt)
+                logging.warning(f"Request to {path} failed ({e}), retrying in {delay:.1f}s "
+                                f"(attempt {attempt + 1}/{self.max_retries})")
+            else:
+                metrics.API_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=path,
+                                                    status=response.status_code)
+                profiling.record('api_request', time.perf_counter() - started)
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if self.rate_limiter:
+                    self.rate_limiter.observe(response, retry_after)
+                if response.status_code in (401, 403) and not resigned:
+                    logging.warning(f"Request to {path} returned {response.status_code}, re-signing and retrying")
+                    response.close()
+                    self.signer.invalidate()
+                    resigned = True
+                    metrics.API_RETRIES.inc(endpoint=path, reason='resign')
+                    continue
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    response_bytes = None if stream else len(response.content)
+                    if response_bytes is not None:
+                        metrics.API_BYTES.inc(response_bytes, endpoint=path)
+                    self.local.last_response = (time.perf_counter() - started, response_bytes)
+                    return response
+                metrics.API_RETRIES.inc(endpoint=path, reason=response.status_code)
+                delay = self.backoff_delay(attempt, retry_after)
+                logging.warning(f"Request to {path} returned {response.status_code}, retrying in {delay:.1f}s "
+                                f"(attempt {attempt + 1}/{self.max_retries})")
+                response.close()
+            with profiling.stage('retry_backoff'):
+                time.sleep(delay)
+            attempt += 1
+
+    # Function to get (seconds, bytes) of the last successful request made on this thread: the time of
+    # its final attempt, without retries or rate limiter waits, and its body size (None when streamed)
+    def last_response(self):
+        return getattr(self.local, 'last_response', None)
+
+    def get_json(self, path, params=None):
+        return self.get(path, params).json()
+
+    # Function to yield the elements of a top-level list (e.g. 'hotels') one at a time while the
+    # response body is still downloading, so a page never has to be held in memory as a whole.
+    # The raw (decompressed) body is copied to sink as it is read. Without ijson the body is parsed
+    # in one go and the elements are yielded from the parsed list.
+    def iter_items(self, path, params, key, sink=None):
+        response = self.get(path, params, stream=True)
+        try:
+            if ijson is None:
+                body = response.content
+                metrics.API_BYTES.inc(len(body), endpoint=path)
+                if sink is not None:
+                    sink.write(body)
+                yield from json.loads(body).get(key, [])
+            else:
+                response.raw.decode_content = True
+                reader = TeeReader(response.raw, sink)
+                try:
+                    yield from ijson.items(reader, f'{key}.item', use_float=True)
+                finally:
+                    metrics.API_BYTES.inc(reader.bytes_read, endpoint=path)
+        finally:
+            response.close()
+
+    def close(self):
+        self.session.close()
+
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+# Function to get the process-wide client, built from the environment on first use
+def get_shared_client():
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = HotelbedsClient.from_env()
+        return _shared_client
@@ -0,0 +1,321 @@
+import argparse
+import collections
+import importlib
+import json
+import logging
+import time
+
+from dotenv import load_dotenv
+
+import metrics
+import profiling
+from checkpoint import CheckpointStore, DEFAULT_CHECKPOINT_FILE, FAILED, IN_FLIGHT
+from orchestrator import ProgressReporter, run_with_dependencies
+from paginator import AdaptivePaginator, last_requested_index
+from parquet_export import ParquetExporter
+from pipeline import page_ranges, run_ingest, run_streaming_ingest, settings_from_env
+from range_lease import RangeLeaseStore, connect_from_env, run_leased_ingest
+
+# Load environment variables
+load_dotenv()
+
+# How a resource is ingested: the module that defines it, the names of its IngestJob (and --upsert
+# variant) in that module, its default index range and batch size, whether the end index is
+# inclusive, optionally the module functions that prepare its tables before a run,
+# prepare(upsert) -> bool, and run an incremental sync,
+# incremental(since, batch_size, checkpoints, settings) -> checkpoint summary, the resources that
+# must have loaded before it when they are part of the same run, and whether its pages are hotels
+# that --export-parquet can export.
+IngestResource = collections.namedtuple(
+    'IngestResource',
+    ['module', 'job', 'upsert_job', 'start', 'end', 'batch_size', 'inclusive_end', 'prepare', 'incremental',
+     'depends_on', 'parquet_export'],
+    defaults=(None, None, (), False))
+
+# Hotels are loaded after the facility reference data, which REFERENCE_CHECK validates them against
+REFERENCE_RESOURCES = ('facility_groups', 'facilities')
+
+RESOURCES = {
+    'hotels': IngestResource('main', 'FULL_INGEST_JOB', 'UPSERT_INGEST_JOB', 21401, 25000, 100, False,
+                             'prepare_ingest', 'run_incremental_sync', REFERENCE_RESOURCES, True),
+    'hotels_document': IngestResource('main_new', 'DOCUMENT_INGEST_JOB', 'DOCUMENT_UPSERT_JOB', 1, 400, 200, False,
+                                      'prepare_document_ingest', depends_on=REFERENCE_RESOURCES,
+                                      parquet_export=True),
+    'hotels_lean': IngestResource('main_new', 'LEAN_INGEST_JOB', 'LEAN_UPSERT_JOB', 1, 400, 200, False,
+                                  'prepare_lean_ingest', depends_on=REFERENCE_RESOURCES, parquet_export=True),
+    'facilities': IngestResource('facilities', 'INGEST_JOB', None, 1, 100, 100, True),
+    'facility_groups': IngestResource('facilities_group', 'INGEST_JOB', None, 1, 30000, 100, True),
+}
+
+# Options only some resources support, and how to tell whether a resource does. In a run of several
+# resources each applies to the resources that support it; the others are loaded in full as usual.
+RESOURCE_OPTIONS = {
+    'upsert': lambda resource: resource.upsert_job is not None,
+    'incremental': lambda resource: resource.incremental is not None,
+    'export_parquet': lambda resource: resource.parquet_export,
+}
+
+
+def _flag(key):
+    return '--' + key.replace('_', '-')
+
+
+# Function to get an option of RESOURCE_OPTIONS for one resource: its value if the resource supports
+# it, otherwise None
+def _resource_option(args, name, key):
+    value = getattr(args, key, None)
+    if value and not RESOURCE_OPTIONS[key](RESOURCES[name]):
+        logging.info(f"{_flag(key)} does not apply to {name}, which is loaded in full.")
+        return None
+    return value
+
+
+# Function to check the options of a run for ones that cannot work together and, given the run's
+# resource_names, for ones none of them supports. Returns the error message, or None if there is none.
+def invalid_options(args, resource_names=()):
+    for key, supports in RESOURCE_OPTIONS.items():
+        if resource_names and getattr(args, key, None) and not any(supports(RESOURCES[name])
+                                                                   for name in resource_names):
+            return f"{_flag(key)} is not supported for {', '.join(resource_names)}"
+    incremental = getattr(args, 'incremental', False)
+    distributed = getattr(args, 'distributed', None)
+    if distributed and incremental:
+        return "--incremental cannot be combined with --distributed"
+    if getattr(args, 'adaptive', False) and (distributed or incremental):
+        return "--adaptive cannot be combined with --distributed or --incremental"
+    if getattr(args, 'export_parquet', None) and (getattr(args, 'upsert', False) or incremental):
+        return "--export-parquet exports full loads only, not --upsert or --incremental"
+    return None
+
+
+PIPELINE_ENV_HELP = '''pipeline settings (environment, or "pipeline" in --config):
+  FETCH_WORKERS      fetcher threads; 0 fetches and loads one page at a time (default 0)
+  WRITER_WORKERS     writer threads, each with its own MySQL connection (default 1)
+  PAGE_QUEUE_SIZE    fetched pages waiting for the writers (default 8)
+  TRANSFORM_WORKERS  processes flattening pages into rows; 0 flattens on the writers (default 0)'''
+
+
+# Function to read an ingest config file, for example
+#     {"pipeline": {"fetch_workers": 8, "writer_workers": 4},
+#      "resources": {"facilities": {"end": 500, "batch_size": 1000}}}
+# "pipeline" overrides the FETCH_WORKERS/WRITER_WORKERS/PAGE_QUEUE_SIZE/TRANSFORM_WORKERS settings and
+# "resources" the default start, end and batch_size of each resource.
+def load_config(path):
+    if not path:
+        return {}
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+# Function to pick an option: the command line wins, then the config file, then the resource default
+def _option(args, overrides, key, default):
+    value = getattr(args, key, None)
+    if value is not None:
+        return value
+    return overrides.get(key, default)
+
+
+# Function to tell whether a run left every one of its ranges completed
+def run_succeeded(summary):
+    return summary is not None and not summary.get(FAILED) and not summary.get(IN_FLIGHT)
+
+
+# Function to ingest one resource with the shared pipeline stages. args may come from this CLI or
+# from one of the per-resource scripts; options a script does not have are treated as off. module is
+# the resource's module (imported by name when not given): a script run as __main__ passes itself,
+# so it is not imported a second time under its module name.
+# checkpoints is shared with other resources running at the same time (a store of its own is
+# opened otherwise) and progress, a ProgressReporter, is told how many ranges the run has.
+# With args.distributed (a crawl id) the ranges are shared with every other worker of that crawl
+# through the lease table instead. With args.adaptive the page size follows the API's response times
+# and sizes, starting from the size the last adaptive run of the resource settled on. With
+# args.export_parquet (a directory) every loaded page of hotels is exported to Parquet there as well.
+# Returns the checkpoint summary of the ranges this run loaded (of the whole crawl when distributed),
+# or None if it could not start.
+def run_resource(name, args, config=None, checkpoints=None, progress=None, module=None):
+    config = config or {}
+    resource = RESOURCES[name]
+    module = module or importlib.import_module(resource.module)
+    overrides = config.get('resources', {}).get(name, {})
+    start = _option(args, overrides, 'start', resource.start)
+    end = _option(args, overrides, 'end', resource.end)
+    batch_size = _option(args, overrides, 'batch_size', resource.batch_size)
+    settings = settings_from_env()._replace(**config.get('pipeline', {}))
+    metrics.start_from_env()
+    profiling.start(getattr(args, 'profile', None), getattr(args, 'profile_sample', None),
+                    getattr(args, 'profile_cprofile', None), getattr(args, 'profile_memory', None))
+
+    error = invalid_options(args)
+    if error:
+        logging.error(error)
+        return None
+    upsert = _resource_option(args, name, 'upsert')
+    incremental = _resource_option(args, name, 'incremental')
+    export_dir = _resource_option(args, name, 'export_parquet')
+    crawl_id = getattr(args, 'distributed', None)
+    adaptive = getattr(args, 'adaptive', False)
+    job = None if incremental else getattr(module, resource.upsert_job if upsert else resource.job)
+    exporter = None
+    if export_dir:
+        try:
+            exporter = ParquetExporter.from_env(export_dir)
+        except ValueError as err:
+            logging.error(f"Cannot export {name} to Parquet: {err}")
+            return None
+        job = job._replace(export_page=exporter.write_page)
+    if resource.prepare and not getattr(module, resource.prepare)(bool(upsert or incremental)):
+        return None
+
+    own_checkpoints = checkpoints is None
+    if own_checkpoints:
+        checkpoints = CheckpointStore(getattr(args, 'checkpoint_file', None) or DEFAULT_CHECKPOINT_FILE)
+    started = time.time()
+    try:
+        if incremental:
+            return getattr(module, resource.incremental)(getattr(args, 'since', None), batch_size, checkpoints,
+                                                         settings)
+
+        resume = getattr(args, 'resume', False)
+        if adaptive:
+            # An explicit --batch-size wins over the learned page size
+            page_size = getattr(args, 'batch_size', None) or checkpoints.get_page_size(job.resource) or batch_size
+            skip = checkpoints.completed_ranges(job.resource) if resume else ()
+            # Covering exactly the records the fixed split of batch_size pages would
+            ranges = AdaptivePaginator.from_env(start, end, page_size, resource.inclusive_end, skip,
+                                                last_requested_index(start, end, batch_size, resource.inclusive_end))
+            logging.info(f"Adaptive paging of {name} starts at {ranges.page_size} records per page.")
+        else:
+            ranges = page_ranges(start, end, batch_size, resource.inclusive_end)
+            if resume and not crawl_id:
+                ranges = checkpoints.pending_ranges(job.resource, ranges)
+                logging.info(f"Resuming {name}: {len(ranges)} ranges left to load.")
+        if progress:
+            progress.track(name, job.resource, ranges.estimated_ranges() if adaptive else len(ranges))
+
+        def run_ranges(ranges, checkpoints):
+            if getattr(args, 'stream', False):
+                run_streaming_ingest(ranges, checkpoints, job, settings.fetch_workers)
+            else:
+                run_ingest(ranges, checkpoints, job, settings)
+
+        if crawl_id:
+            leases = RangeLeaseStore(connect_from_env, crawl_id, lease_seconds=getattr(args, 'lease_seconds', 120),
+                                     checkpoints=checkpoints)
+            try:
+                summary = run_leased_ingest(leases, job.resource, ranges, run_ranges,
+                                            getattr(args, 'claim_size', 8))
+            finally:
+                leases.close()
+        else:
+            run_ranges(ranges, checkpoints)
+            summary = checkpoints.summary(job.resource, started)
+        if adaptive:
+            checkpoints.set_page_size(job.resource, ranges.page_size)
+            logging.info(f"Adaptive paging of {name} settled on {ranges.page_size} records per page "
+                         f"({ranges.failures}/{ranges.pages} pages failed).")
+        logging.info(f"Checkpoint summary for {name}: {summary}")
+        return summary
+    finally:
+        if exporter:
+            exporter.close()
+        if progress:
+            progress.finish(name)
+        if own_checkpoints:
+            checkpoints.close()
+
+
+# Function to ingest several resources in one run: up to parallel at a time, each starting once the
+# resources it depends on have loaded completely, all sharing the API client (and so its rate limit
+# and daily budget) and one checkpoint store. Progress is logged every progress_interval seconds.
+# Returns {name: checkpoint summary, or None if it did not run or could not start}.
+def run_resources(names, args, config=None, parallel=1, progress_interval=30):
+    checkpoints = CheckpointStore(getattr(args, 'checkpoint_file', None) or DEFAULT_CHECKPOINT_FILE)
+    progress = ProgressReporter(checkpoints, progress_interval)
+    depends_on = {name: RESOURCES[name].depends_on for name in names}
+    summaries = {}
+
+    def run(name):
+        summaries[name] = run_resource(name, args, config, checkpoints, progress)
+        return run_succeeded(summaries[name])
+
+    started = time.monotonic()
+    progress.start()
+    try:
+        run_with_dependencies(names, run, depends_on, parallel)
+    finally:
+        progress.stop()
+        checkpoints.close()
+    logging.info(f"Sync of {', '.join(names)} finished in {time.monotonic() - started:.1f}s")
+    return {name: summaries.get(name) for name in names}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load Hotelbeds content API resources into MySQL.',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=PIPELINE_ENV_HELP)
+    parser.add_argument('resources', nargs='+', choices=sorted(RESOURCES),
+                        help='Resources to load; each one waits for the resources it depends on')
+    parser.add_argument('--config', help='JSON file with pipeline settings and per-resource ranges')
+    parser.add_argument('--start', type=int, help='Starting index (default: per resource)')
+    parser.add_argument('--end', type=int, help='End index (default: per resource)')
+    parser.add_argument('--batch-size', type=int, help='Number of records per batch (default: per resource)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip ranges already completed in the checkpoint file and retry the rest')
+    parser.add_argument('--checkpoint-file', default=DEFAULT_CHECKPOINT_FILE)
+    parser.add_argument('--upsert', action='store_true',
+                        help='Skip records whose content hash is unchanged and replace changed ones (hotels only)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Parse pages incrementally and load records as they arrive instead of per page')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only fetch and upsert hotels changed since the last incremental sync (hotels only)')
+    parser.add_argument('--since', help='Override the incremental sync start date (YYYY-MM-DD)')
+    parser.add_argument('--parallel', type=int, default=1,
+                        help='Resources loaded at the same time, dependencies permitting')
+    parser.add_argument('--progress-interval', type=float, default=30, help='Seconds between progress lines')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Grow or shrink the page size with the API response times, sizes and errors, '
+                             'within ADAPTIVE_MIN_PAGE_SIZE..ADAPTIVE_MAX_PAGE_SIZE, and remember it per resource')
+    parser.add_argument('--distributed', metavar='CRAWL_ID',
+                        help='Share the ranges with every worker started with the same crawl id, on any host, '
+                             'through a lease table in MySQL (already completed ranges are skipped, so '
+                             '--resume is implied). Each worker has its own rate limit: divide '
+                             'HOTELBEDS_RATE_LIMIT and HOTELBEDS_DAILY_QUOTA by the number of workers')
+    parser.add_argument('--lease-seconds', type=float, default=120,
+                        help='How long a claimed range stays leased without a heartbeat (--distributed)')
+    parser.add_argument('--claim-size', type=int, default=8, help='Ranges claimed at a time (--distributed)')
+    parser.add_argument('--export-parquet', metavar='DIR',
+                        help='Also write the loaded hotels to Parquet under DIR, one dataset per table '
+                             'partitioned by country_code/destination_code (needs pyarrow; use a fresh DIR '
+                             'per load, as reloaded pages are exported again)')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='Time every stage and statement and profile a sample of the pages in depth; the '
+                             'report and a collapsed-stack file for flame graphs are written to DIR on exit '
+                             '(default: PROFILE_DIR, profiling is off if neither is set)')
+    parser.add_argument('--profile-sample', type=float,
+                        help='Share of page fetches and loads profiled in depth (default: PROFILE_SAMPLE_RATE '
+                             'or 0.02)')
+    parser.add_argument('--profile-cprofile', action='store_true', default=None,
+                        help='Run the sampled pages under cProfile too, into DIR/cprofile.pstats')
+    parser.add_argument('--profile-memory', action='store_true', default=None,
+                        help='Trace the allocations of the sampled pages with tracemalloc, into DIR/memory_top.txt')
+    args = parser.parse_args(argv)
+    error = invalid_options(args, list(dict.fromkeys(args.resources)))
+    if error:
+        parser.error(error)
+    return args
+
+
+def main(argv=None):
+    # Configured before any resource module is imported, so this log file wins over theirs
+    logging.basicConfig(level=logging.INFO, filename='ingest.log',
+                        format='%(asctime)s:%(levelname)s:%(message)s')
+    args = parse_args(argv)
+    config = load_config(args.config)
+    summaries = run_resources(list(dict.fromkeys(args.resources)), args, config, args.parallel,
+                              args.progress_interval)
+    for name, summary in summaries.items():
+        print(f"{name}: {'ok' if run_succeeded(summary) else 'incomplete'} {summary or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,23 @@
+import argparse
+import datetime
+import functools
 import requests
 import mysql.connector
-import hashlib
-import time
-import json
 import os
+import sys
 from dotenv import load_dotenv
+from hotelbeds_client import get_shared_client
+from archive import get_shared_archive
+from checkpoint import COMPLETED, DEFAULT_CHECKPOINT_FILE
+from content_hash import changed_hotels, create_hash_table, store_hashes
+from dead_letter import (create_dead_letter_table, dead_letter_entry, dead_letter_table, note_page_dead_letters,
+                         store_dead_letters, write_dead_letters)
+from reference_cache import get_shared_reference_cache
+from transform import flatten_hotel_data
+import metrics
+import profiling
+import ingest
+from pipeline import IngestJob, run_ingest
 import logging
 
 # Load environment variables
@@ -14,23 +27,9 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, filename='hotel_data2.log',
                     format='%(asctime)s:%(levelname)s:%(message)s')
 
-def generate_api_signature(api_key, secret):
-    timestamp = str(int(time.time()))  # Get current timestamp in seconds
-    concatenated_string = api_key + secret + timestamp
-    signature = hashlib.sha256(concatenated_string.encode()).hexdigest()
-    return signature
-
-API_KEY = os.getenv('API_KEY')
-API_SECRET = os.getenv('API_SECRET')
-signature = generate_api_signature(API_KEY, API_SECRET)
-
-def save_json_to_file(data, filename):
-    with open(filename, 'w') as file:
-        json.dump(data, file, indent=4)
-
-# Function to fetch data from API
-def fetch_hotel_data(from_index, to_index):
-    url = 'https://api.hotelbeds.com/hotel-content-api/1.0/hotels'
+# Function to build the query parameters for a page of hotels.
+# last_update_time (YYYY-MM-DD) limits the result to hotels changed since that date
+def hotel_request_params(from_index, to_index, last_update_time=None):
     params = {
         'fields': 'all',
         'language': 'ENG',
@@ -38,16 +37,20 @@ def fetch_hotel_data(from_index, to_index):
         'to': to_index,
         'useSecondaryLanguage': False
     }
-    headers = {
-        'Api-Key': API_KEY,
-        'X-Signature': signature,
-        'Accept': 'application/json'
-    }
+    if last_update_time:
+        params['lastUpdateTime'] = last_update_time
+    return params
+
+# Function to fetch data from API
+def fetch_hotel_data(from_index, to_index, last_update_time=None, archive_name=None):
+    params = hotel_request_params(from_index, to_index, last_update_time)
 
     try:
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        response = get_shared_client().get('hotels', params)
+        if archive_name:
+            get_shared_archive().write(archive_name, response.content)
+        with profiling.stage('parse_json'):
+            return response.json()
     except requests.exceptions.RequestException as e:
         logging.error(f"Failed to fetch data from API: {e}")
         return None
@@ -67,13 +70,10 @@ def connect_to_mysql():
         return None
 
 # Function to insert data into MySQL tables
-import logging
-import mysql.connector
-
 def insert_data_into_mysql(hotel_data, conn):
     if not hotel_data or not conn:
         logging.error("Invalid input data or MySQL connection.")
-        return
+        return False
 
     cursor = conn.cursor()
 
@@ -276,34 +276,510 @@ def insert_data_into_mysql(hotel_data, conn):
 
         conn.commit()
         logging.info("Data inserted into MySQL tables successfully.")
+        return True
 
     except mysql.connector.Error as err:
         # logging.error(f"Error inserting data into MySQL: {err}")
         logging.error(f"Error inserting data into MySQL table: {table_name}, Error: {err}")
         conn.rollback()
+        return False
 
     finally:
         cursor.close()
 
 
+# Queries used by the batched write path; each one is sent as a multi-row INSERT
+BATCH_INSERT_QUERIES = {
+    'hb_hotel_info': """
+        INSERT INTO hb_hotel_info (hotel_code, hotel_name, category_code, accommodation_type_code, email, website, last_update, S2C, ranking)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """,
+    'hb_location_coordinates': """
+        INSERT INTO hb_location_coordinates (hotel_code, longitude, latitude, country_code, state_code, destination_code, zone_code, city)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """,
+    'hb_description': """
+        INSERT INTO hb_description (hotel_code, description_text)
+        VALUES (%s, %s)
+    """,
+    'hb_facilities': """
+        INSERT INTO hb_facilities (hotel_code, facility_code, facility_group_code, number, voucher)
+        VALUES (%s, %s, %s, %s, %s)
+    """,
+    'hb_rooms_type': """
+        INSERT INTO hb_rooms_type (hotel_code, room_code, room_type, characteristic_code, min_pax, max_pax, min_adults, max_adults, max_children, is_parent_room)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """,
+    'hb_room_features': """
+        INSERT INTO hb_room_features (room_id, facility_code, facility_group_code, ind_logic, number, voucher)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """,
+    'hb_room_stays': """
+        INSERT INTO hb_room_stays (room_id, stay_type, `orderid`, description)
+        VALUES (%s, %s, %s, %s)
+    """,
+    'hb_room_stay_facilities': """
+        INSERT INTO hb_room_stay_facilities (stay_id, facility_code, facility_group_code, number)
+        VALUES (%s, %s, %s, %s)
+    """,
+    'hb_phone_numbers': """
+        INSERT INTO hb_phone_numbers (hotel_code, phone_number, phone_type)
+        VALUES (%s, %s, %s)
+    """,
+    'hb_board_codes': """
+        INSERT INTO hb_board_codes (hotel_code, board_code)
+        VALUES (%s, %s)
+    """,
+    'hb_address': """
+        INSERT INTO hb_address (hotel_code, address, city)
+        VALUES (%s, %s, %s)
+    """,
+    'hb_images': """
+        INSERT INTO hb_images (hotel_code, image_type_code, path, image_order, visual_order, room_code, room_type, characteristic_code)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """,
+}
+
+# Per-hotel content hash index used by the upsert mode
+CONTENT_HASH_TABLE = 'hb_hotel_content_hash'
+
+# Maximum number of rows sent in a single multi-row INSERT (keeps statements under max_allowed_packet)
+INSERT_CHUNK_SIZE = 1000
+
+
+# Function to send a table's rows as multi-row INSERT statements, INSERT_CHUNK_SIZE rows at a time
+def execute_in_batches(cursor, table_name, rows):
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        chunk = rows[start:start + INSERT_CHUNK_SIZE]
+        with metrics.db_write(table_name, len(chunk)):
+            cursor.executemany(BATCH_INSERT_QUERIES[table_name], chunk)
+
+
+# Function to look up the ids of the rooms just written for a set of hotels, keyed by (hotel_code, room_code).
+# MAX(id) picks the row from this load if the hotel was loaded before.
+def fetch_room_ids(cursor, hotel_codes):
+    room_ids = {}
+    for start in range(0, len(hotel_codes), INSERT_CHUNK_SIZE):
+        chunk = hotel_codes[start:start + INSERT_CHUNK_SIZE]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(f"""
+            SELECT hotel_code, room_code, MAX(id)
+            FROM hb_rooms_type
+            WHERE hotel_code IN ({placeholders})
+            GROUP BY hotel_code, room_code
+        """, tuple(chunk))
+        for hotel_code, room_code, room_id in cursor.fetchall():
+            room_ids[(hotel_code, room_code)] = room_id
+    return room_ids
+
+
+# Function to look up the ids of the stays just written for a set of rooms, keyed by (room_id, stay_type, order)
+def fetch_stay_ids(cursor, room_ids):
+    stay_ids = {}
+    for start in range(0, len(room_ids), INSERT_CHUNK_SIZE):
+        chunk = room_ids[start:start + INSERT_CHUNK_SIZE]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(f"""
+            SELECT room_id, stay_type, `orderid`, MAX(id)
+            FROM hb_room_stays
+            WHERE room_id IN ({placeholders})
+            GROUP BY room_id, stay_type, `orderid`
+        """, tuple(chunk))
+        for room_id, stay_type, order, stay_id in cursor.fetchall():
+            stay_ids[(room_id, stay_type, str(order))] = stay_id
+    return stay_ids
+
+
+# Tables keyed directly by hotel_code, in the order their rows are removed when a hotel is replaced
+HOTEL_CODE_TABLES = ('hb_images', 'hb_address', 'hb_board_codes', 'hb_phone_numbers', 'hb_rooms_type',
+                     'hb_facilities', 'hb_description', 'hb_location_coordinates', 'hb_hotel_info')
+
+
+# Function to delete every row belonging to a set of hotels, child tables first, with one statement per table
+def delete_hotels_from_mysql(cursor, hotel_codes):
+    for start in range(0, len(hotel_codes), INSERT_CHUNK_SIZE):
+        chunk = tuple(hotel_codes[start:start + INSERT_CHUNK_SIZE])
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(f"""
+            DELETE sf FROM hb_room_stay_facilities sf
+            JOIN hb_room_stays s ON sf.stay_id = s.id
+            JOIN hb_rooms_type r ON s.room_id = r.id
+            WHERE r.hotel_code IN ({placeholders})
+        """, chunk)
+        for child_table in ('hb_room_stays', 'hb_room_features'):
+            cursor.execute(f"""
+                DELETE c FROM {child_table} c
+                JOIN hb_rooms_type r ON c.room_id = r.id
+                WHERE r.hotel_code IN ({placeholders})
+            """, chunk)
+        for table_name in HOTEL_CODE_TABLES:
+            cursor.execute(f"DELETE FROM {table_name} WHERE hotel_code IN ({placeholders})", chunk)
+
+
+# Raised by write_rows_into_mysql with the table whose statement failed
+class TableWriteError(Exception):
+    def __init__(self, table_name, error):
+        super().__init__(f"{table_name}: {error}")
+        self.table_name = table_name
+        self.error = error
+
+
+# MySQL errors that come from contention between writers, whatever class the connector gives them:
+# lock wait timeout and deadlock
+CONTENTION_ERRNOS = (1205, 1213)
+
+# MySQL errors caused by a bad value, which the connector may raise as a plain DatabaseError: column
+# cannot be null, out of range, data truncated, incorrect date/time value, field without a default,
+# incorrect integer value, data too long and a foreign key that does not match
+RECORD_ERRNOS = (1048, 1264, 1265, 1292, 1364, 1366, 1406, 1452)
+
+
+# Function to tell errors caused by the data of some record (a bad value, a duplicate key, a missing
+# field while flattening) from ones that say nothing about the records, like a lost connection, a
+# lock wait timeout or a deadlock; only the former are worth isolating hotel by hotel. Of the MySQL
+# errors data (SQLSTATE 22) and integrity (SQLSTATE 23) errors and those in RECORD_ERRNOS are the
+# records' fault.
+def is_record_error(error):
+    if isinstance(error, TableWriteError):
+        error = error.error
+    if isinstance(error, mysql.connector.Error):
+        if error.errno in CONTENTION_ERRNOS:
+            return False
+        return (error.errno in RECORD_ERRNOS or
+                isinstance(error, (mysql.connector.DataError, mysql.connector.IntegrityError)))
+    return isinstance(error, (KeyError, TypeError, ValueError, AttributeError))
+
+
+# Function to write a flattened page on the caller's cursor without committing.
+# Raises TableWriteError naming the table whose statement failed.
+def write_rows_into_mysql(cursor, rows, replace_existing=False, content_hashes=None):
+    table_name = None
 
-def main():
-    batch_size = 100  # Number of records per batch
-    start_index = 21401  # Starting index
-    end_index = 25000  # End index
+    try:
+        if replace_existing:
+            table_name = 'hb_hotel_info'
+            delete_hotels_from_mysql(cursor, [row[0] for row in rows['hb_hotel_info']])
+
+        for table_name in ('hb_hotel_info', 'hb_location_coordinates', 'hb_description', 'hb_facilities',
+                           'hb_rooms_type', 'hb_phone_numbers', 'hb_board_codes', 'hb_address', 'hb_images'):
+            execute_in_batches(cursor, table_name, rows[table_name])
+
+        # Resolve room ids by natural key, then write the rows that hang off rooms
+        table_name = 'hb_rooms_type'
+        hotel_codes = list({row[0] for row in rows['hb_rooms_type']})
+        room_ids = fetch_room_ids(cursor, hotel_codes) if hotel_codes else {}
+
+        table_name = 'hb_room_features'
+        room_features = [(room_ids[row[0]],) + row[1:] for row in rows['hb_room_features']]
+        execute_in_batches(cursor, table_name, room_features)
+
+        table_name = 'hb_room_stays'
+        room_stays = [(room_ids[row[0]],) + row[1:] for row in rows['hb_room_stays']]
+        execute_in_batches(cursor, table_name, room_stays)
+
+        # Resolve stay ids the same way for the stay facilities
+        stay_room_ids = list({row[0] for row in room_stays})
+        stay_ids = fetch_stay_ids(cursor, stay_room_ids) if stay_room_ids else {}
+
+        table_name = 'hb_room_stay_facilities'
+        stay_facilities = []
+        for row in rows['hb_room_stay_facilities']:
+            hotel_code, room_code, stay_type, order = row[0]
+            stay_id = stay_ids[(room_ids[(hotel_code, room_code)], stay_type, str(order))]
+            stay_facilities.append((stay_id,) + row[1:])
+        execute_in_batches(cursor, table_name, stay_facilities)
+
+        if content_hashes:
+            table_name = CONTENT_HASH_TABLE
+            store_hashes(cursor, CONTENT_HASH_TABLE, content_hashes)
+
+    except (mysql.connector.Error, KeyError) as err:
+        raise TableWriteError(table_name, err) from err
+
+
+# Function to write a group of hotels inside a savepoint of the page's transaction. If the group
+# fails because of its data, it is rolled back to the savepoint and split in half, down to single
+# hotels, which are added to dead_letters instead of being written. Other errors are raised.
+def write_hotels_isolating_failures(cursor, hotels, replace_existing, content_hashes, dead_letters, depth=0):
+    savepoint = f'hotel_group_{depth}'
+    cursor.execute(f"SAVEPOINT {savepoint}")
+    try:
+        group_hashes = None
+        if content_hashes:
+            codes = {hotel.get('code') for hotel in hotels if isinstance(hotel, dict)}
+            group_hashes = {code: content_hash for code, content_hash in content_hashes.items() if code in codes}
+        with profiling.stage('flatten'):
+            rows = flatten_hotel_data({'hotels': hotels})
+        write_rows_into_mysql(cursor, rows, replace_existing, group_hashes)
+    except Exception as err:
+        if not is_record_error(err):
+            raise
+        cursor.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+        if len(hotels) == 1:
+            dead_letters.append(dead_letter_entry('hotels', hotels[0], getattr(err, 'error', err),
+                                                  getattr(err, 'table_name', None)))
+            return
+        middle = len(hotels) // 2
+        for group in (hotels[:middle], hotels[middle:]):
+            write_hotels_isolating_failures(cursor, group, replace_existing, content_hashes, dead_letters,
+                                            depth + 1)
+
+
+# Function to check the facility codes of a page of hotels against the reference cache, if
+# REFERENCE_CHECK is on. Returns the hotels to load; with REFERENCE_CHECK=reject, hotels using unknown
+# codes are added to dead_letters instead.
+def check_facility_codes(hotels, dead_letters):
+    reference = get_shared_reference_cache()
+    if not reference:
+        return hotels
+
+    checked = []
+    for hotel in hotels:
+        try:
+            unknown = reference.unknown_facilities(hotel)
+        except (AttributeError, TypeError):
+            unknown = None  # malformed hotel, isolated when it is written
+        if not unknown:
+            checked.append(hotel)
+        elif reference.on_unknown == 'reject':
+            dead_letters.append(dead_letter_entry(
+                'hotels', hotel, ValueError(f"unknown (facilityGroupCode, facilityCode): {unknown}")))
+        else:
+            logging.warning(f"Hotel {hotel.get('code')} uses unknown (facilityGroupCode, facilityCode): {unknown}")
+            checked.append(hotel)
+    return checked
+
+
+# Function to insert a page of hotels using one multi-row INSERT per table instead of one per row.
+# With replace_existing=True the page's hotels are deleted first in the same transaction, so the
+# page is upserted. content_hashes ({hotel_code: hash}) are written to the hash index table in the
+# same transaction as the rows they describe.
+# A hotel whose data makes the insert fail is isolated by bisecting the page over savepoints and
+# written to the dead letter file (and DEAD_LETTER_TABLE, if set) with its original JSON, while the
+# rest of the page commits. If every hotel of the page fails, nothing is committed. Hotels rejected by
+# check_facility_codes are dead-lettered the same way.
+def insert_data_into_mysql_batched(hotel_data, conn, replace_existing=False, content_hashes=None):
+    if not hotel_data or not conn:
+        logging.error("Invalid input data or MySQL connection.")
+        return False
+
+    hotels = hotel_data['hotels']
+    dead_letters = []
+    checked = check_facility_codes(hotels, dead_letters)
+    rejected = len(dead_letters)
+    cursor = conn.cursor()
+
+    try:
+        write_hotels_isolating_failures(cursor, checked, replace_existing, content_hashes, dead_letters)
+        # Also for a single hotel: with nothing loaded, the failure may as well be the page's as the hotel's
+        if len(dead_letters) > rejected and len(dead_letters) - rejected == len(checked):
+            logging.error(f"Every hotel of the page failed to load, last error: {dead_letters[-1]['error']}")
+            conn.rollback()
+            return False
+
+        table_name = dead_letter_table()
+        if dead_letters and table_name:
+            store_dead_letters(cursor, table_name, dead_letters)
+
+        with metrics.DB_COMMIT_SECONDS.time():
+            conn.commit()
+
+    except (mysql.connector.Error, TableWriteError) as err:
+        logging.error(f"Error inserting data into MySQL table: {getattr(err, 'table_name', None)}, "
+                      f"Error: {getattr(err, 'error', err)}")
+        conn.rollback()
+        return False
+
+    finally:
+        cursor.close()
+
+    if dead_letters:
+        write_dead_letters(dead_letters)
+        note_page_dead_letters(dead_letters)
+        for entry in dead_letters:
+            logging.warning(f"Dead-lettered hotel {entry['code']} (table: {entry['table']}): {entry['error']}")
+    logging.info(f"Data inserted into MySQL tables successfully ({len(hotels) - len(dead_letters)} hotels, "
+                 f"batched, {len(dead_letters)} dead-lettered).")
+    return True
+
+
+# Function to write a page that has already been flattened by transform.flatten_hotel_data, given as
+# (hotel_data, rows). The page is loaded all or nothing; see load_transformed_page for the fallback when
+# it fails. A page with hotels that check_facility_codes rejects is not loaded here but left to that
+# fallback, which dead-letters them.
+def insert_rows_into_mysql(transformed_page, conn, replace_existing=False, content_hashes=None):
+    hotel_data, rows = transformed_page
+    hotels = hotel_data['hotels']
+    if len(check_facility_codes(hotels, [])) < len(hotels):
+        logging.info("Page has hotels with unknown facility codes.")
+        return False
+
+    cursor = conn.cursor()
+
+    try:
+        write_rows_into_mysql(cursor, rows, replace_existing, content_hashes)
+        with metrics.DB_COMMIT_SECONDS.time():
+            conn.commit()
+        logging.info(f"Data inserted into MySQL tables successfully ({len(rows['hb_hotel_info'])} hotels, batched).")
+        return True
+
+    except (mysql.connector.Error, TableWriteError) as err:
+        logging.error(f"Error inserting data into MySQL table: {getattr(err, 'table_name', None)}, "
+                      f"Error: {getattr(err, 'error', err)}")
+        conn.rollback()
+        return False
+
+    finally:
+        cursor.close()
 
+
+# Function to upsert a page of hotels: hotels whose content hash matches the stored one are skipped,
+# the rest replace their existing rows and hash in a single transaction
+def upsert_hotels_into_mysql(hotel_data, conn):
+    if not hotel_data or not conn:
+        logging.error("Invalid input data or MySQL connection.")
+        return False
+
+    cursor = conn.cursor()
+    try:
+        hotels, content_hashes, unchanged = changed_hotels(cursor, CONTENT_HASH_TABLE, hotel_data['hotels'])
+    except mysql.connector.Error as err:
+        logging.error(f"Error reading content hashes from MySQL table: {CONTENT_HASH_TABLE}, Error: {err}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+
+    logging.info(f"Upsert: {len(hotels)} changed hotels, {unchanged} unchanged skipped.")
+    if not hotels:
+        conn.rollback()
+        return True
+    return insert_data_into_mysql_batched({'hotels': hotels}, conn, replace_existing=True,
+                                          content_hashes=content_hashes)
+
+
+# Names this script's page ranges are recorded under in the checkpoint store
+CHECKPOINT_RESOURCE = 'hotels'
+DELTA_CHECKPOINT_RESOURCE = 'hotels_delta'
+
+FULL_INGEST_JOB = IngestJob(CHECKPOINT_RESOURCE, fetch_hotel_data, insert_data_into_mysql_batched, 'hotel_data',
+                            load_rows=insert_rows_into_mysql, transform=flatten_hotel_data, endpoint='hotels',
+                            request_params=hotel_request_params, records_key='hotels')
+UPSERT_INGEST_JOB = FULL_INGEST_JOB._replace(load_page=upsert_hotels_into_mysql, load_rows=None)
+
+
+# Function to wrap fetch_page so that page_range, already fetched as page, is handed out once from there
+# instead of being fetched again
+def reuse_fetched_page(fetch_page, page_range, page):
+    fetched = {page_range: page}
+
+    def fetch(from_index, to_index, **kwargs):
+        page = fetched.pop((from_index, to_index), None)
+        return page if page is not None else fetch_page(from_index, to_index, **kwargs)
+    return fetch
+
+
+# Function to load only the hotels changed since the last successful incremental sync (or --since).
+# Pages are upserted, so hotels whose content did not actually change are skipped by hash.
+# The high-water mark is the UTC date the sync started and only moves forward when every page loaded,
+# so a partly failed sync is simply repeated from the same date next time. Returns the checkpoint
+# summary, or None if the sync could not start.
+def run_incremental_sync(since, batch_size, checkpoints, settings):
+    since = since or checkpoints.get_high_water_mark(DELTA_CHECKPOINT_RESOURCE)
+    if not since:
+        logging.error("No previous incremental sync recorded; pass --since YYYY-MM-DD for the first one.")
+        return None
+
+    sync_started = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+    file_prefix = f'hotel_delta_{since}'
+    first_page = fetch_hotel_data(1, batch_size, since, archive_name=f'{file_prefix}_1_{batch_size}')
+    if first_page is None:
+        logging.error(f"Could not start incremental sync since {since}.")
+        return None
+
+    total = first_page.get('total', 0)
+    logging.info(f"Incremental sync: {total} hotels changed since {since}.")
+    page_ranges = [(from_index, from_index + batch_size - 1) for from_index in range(1, total + 1, batch_size)]
+
+    # Offsets are relative to this sync's filtered result, so progress from an older sync is meaningless
+    checkpoints.reset(DELTA_CHECKPOINT_RESOURCE)
+    # The first page was fetched (and archived) for its total already; the pipeline loads it from there
+    job = IngestJob(
+        DELTA_CHECKPOINT_RESOURCE,
+        reuse_fetched_page(functools.partial(fetch_hotel_data, last_update_time=since), (1, batch_size), first_page),
+        upsert_hotels_into_mysql,
+        file_prefix
+    )
+    run_ingest(page_ranges, checkpoints, job, settings._replace(transform_workers=0))
+
+    summary = checkpoints.summary(DELTA_CHECKPOINT_RESOURCE)
+    logging.info(f"Checkpoint summary: {summary}")
+    if summary.get(COMPLETED, 0) == len(page_ranges):
+        checkpoints.set_high_water_mark(DELTA_CHECKPOINT_RESOURCE, sync_started)
+        logging.info(f"Incremental sync complete, next sync starts from {sync_started}.")
+    return summary
+
+
+# Function to create a bookkeeping table up front, so DDL never runs inside a page's transaction
+def prepare_table(create_table, table_name):
     conn = connect_to_mysql()
     if not conn:
-        return
+        return False
+    cursor = conn.cursor()
+    try:
+        create_table(cursor, table_name)
+        conn.commit()
+        return True
+    except mysql.connector.Error as err:
+        logging.error(f"Error creating MySQL table: {table_name}, Error: {err}")
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def prepare_content_hash_table():
+    return prepare_table(create_hash_table, CONTENT_HASH_TABLE)
+
+
+# Function to set up what a run needs before its first page: the content hash table for the upsert
+# and incremental modes, the dead letter table if one is configured, and the facility reference data
+# if REFERENCE_CHECK is on, so a run without it fails early
+def prepare_ingest(upsert):
+    if upsert and not prepare_content_hash_table():
+        return False
+    if dead_letter_table() and not prepare_table(create_dead_letter_table, dead_letter_table()):
+        return False
+    reference = get_shared_reference_cache()
+    if reference:
+        try:
+            reference.refresh()
+        except (mysql.connector.Error, OSError, ValueError) as e:
+            logging.error(f"Could not load the facility reference data: {e}")
+            return False
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load Hotelbeds hotels into the normalized MySQL tables.')
+    parser.add_argument('--start', type=int, default=21401, help='Starting index')
+    parser.add_argument('--end', type=int, default=25000, help='End index')
+    parser.add_argument('--batch-size', type=int, default=100, help='Number of records per batch')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip ranges already completed in the checkpoint file and retry the rest')
+    parser.add_argument('--checkpoint-file', default=DEFAULT_CHECKPOINT_FILE)
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only fetch and upsert hotels changed since the last incremental sync')
+    parser.add_argument('--since', help='Override the incremental sync start date (YYYY-MM-DD)')
+    parser.add_argument('--upsert', action='store_true',
+                        help='Skip hotels whose content hash is unchanged and replace the rows of changed ones')
+    parser.add_argument('--stream', action='store_true',
+                        help='Parse pages incrementally and load hotels as they arrive instead of per page')
+    return parser.parse_args()
 
-    for from_index in range(start_index, end_index, batch_size):
-        to_index = from_index + batch_size - 1
-        hotel_data = fetch_hotel_data(from_index, to_index)
-        if hotel_data:
-            save_json_to_file(hotel_data, f'hotel_data_{from_index}_{to_index}.json')
-            insert_data_into_mysql(hotel_data, conn)
 
-    conn.close()
+def main():
+    ingest.run_resource('hotels', parse_args(), module=sys.modules[__name__])
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,25 @@
+import argparse
 import requests
 import mysql.connector
-import hashlib
-import time
 import json
 import os
+import sys
 from dotenv import load_dotenv
+from hotelbeds_client import get_shared_client
+from archive import get_shared_archive
+from checkpoint import DEFAULT_CHECKPOINT_FILE
+from content_hash import changed_hotels, create_hash_table, store_hashes
+import ingest
+from pipeline import IngestJob
+import metrics
+import profiling
 import logging
 
+try:
+    import orjson
+except ImportError:  # only makes the lean document mode faster
+    orjson = None
+
 # Load environment variables
 load_dotenv()
 
@@ -14,44 +27,33 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, filename='hotel_data2.log',
                     format='%(asctime)s:%(levelname)s:%(message)s')
 
-def generate_api_signature(api_key, secret):
-    timestamp = str(int(time.time()))  # Get current timestamp in seconds
-    concatenated_string = api_key + secret + timestamp
-    signature = hashlib.sha256(concatenated_string.encode()).hexdigest()
-    return signature
-
-API_KEY = os.getenv('API_KEY')
-API_SECRET = os.getenv('API_SECRET')
-signature = generate_api_signature(API_KEY, API_SECRET)
-
-def save_json_to_file(data, filename):
-    with open(filename, 'w') as file:
-        json.dump(data, file, indent=4)
-
-# Function to fetch data from API
-def fetch_hotel_data(from_index, to_index):
-    url = 'https://api.hotelbeds.com/hotel-content-api/1.0/hotels'
-    params = {
+# Function to build the query parameters for a page of hotels
+def hotel_request_params(from_index, to_index):
+    return {
         'fields': 'all',
         'language': 'ENG',
         'from': from_index,
         'to': to_index,
         'useSecondaryLanguage': False
     }
-    headers = {
-        'Api-Key': API_KEY,
-        'X-Signature': signature,
-        'Accept': 'application/json'
-    }
+
+# Function to fetch data from API
+def fetch_hotel_data(from_index, to_index, archive_name=None):
+    params = hotel_request_params(from_index, to_index)
 
     try:
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        response = get_shared_client().get('hotels', params)
+        if archive_name:
+            get_shared_archive().write(archive_name, response.content)
+        with profiling.stage('parse_json'):
+            return response.json()
     except requests.exceptions.RequestException as e:
         logging.error(f"Failed to fetch data from API: {e}")
         return None
 
+# Per-hotel content hash index used by the upsert mode
+CONTENT_HASH_TABLE = 'hb_hotel_document_hash'
+
 # Function to establish MySQL connection
 def connect_to_mysql():
     try:
@@ -66,15 +68,22 @@ def connect_to_mysql():
         logging.error(f"Error connecting to MySQL: {err}")
         return None
 
-# Function to insert data into MySQL tables
-def insert_data_into_mysql(hotel_data, conn):
+# Function to insert data into MySQL tables.
+# With replace_existing=True the page's hotels are deleted first in the same transaction, and
+# content_hashes ({hotel_code: hash}) are stored alongside the rows they describe.
+def insert_data_into_mysql(hotel_data, conn, replace_existing=False, content_hashes=None):
     if not hotel_data or not conn:
         logging.error("Invalid input data or MySQL connection.")
-        return
+        return False
 
     cursor = conn.cursor()
 
     try:
+        if replace_existing:
+            hotel_codes = tuple(hotel['code'] for hotel in hotel_data['hotels'])
+            placeholders = ', '.join(['%s'] * len(hotel_codes))
+            cursor.execute(f"DELETE FROM hb_hotel_info WHERE hotel_code IN ({placeholders})", hotel_codes)
+
         for hotel in hotel_data['hotels']:
             hotel_code = hotel['code']
             
@@ -130,34 +139,186 @@ def insert_data_into_mysql(hotel_data, conn):
             # Execute the insertion
             cursor.execute(insert_query, insert_data)
 
+        if content_hashes:
+            store_hashes(cursor, CONTENT_HASH_TABLE, content_hashes)
+
         # Commit the transaction
         conn.commit()
         logging.info("Data inserted into MySQL tables successfully.")
+        return True
 
     except mysql.connector.Error as err:
         logging.error(f"Error inserting data into MySQL table: {err}")
         conn.rollback()
+        return False
 
     finally:
         cursor.close()
 
-def main():
-    batch_size = 200  # Number of records per batch
-    start_index = 1  # Starting index
-    end_index = 400  # End index
+# Function to upsert a page of hotels: hotels whose content hash matches the stored one are skipped,
+# the rest replace their existing row and hash in a single transaction
+def upsert_hotels_into_mysql(hotel_data, conn, insert=insert_data_into_mysql, hash_table=CONTENT_HASH_TABLE):
+    if not hotel_data or not conn:
+        logging.error("Invalid input data or MySQL connection.")
+        return False
+
+    cursor = conn.cursor()
+    try:
+        hotels, content_hashes, unchanged = changed_hotels(cursor, hash_table, hotel_data['hotels'])
+    except mysql.connector.Error as err:
+        logging.error(f"Error reading content hashes from MySQL table: {hash_table}, Error: {err}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+
+    logging.info(f"Upsert: {len(hotels)} changed hotels, {unchanged} unchanged skipped.")
+    if not hotels:
+        conn.rollback()
+        return True
+    return insert({'hotels': hotels}, conn, replace_existing=True, content_hashes=content_hashes)
+
+# Lean document mode: each hotel is serialized once and stored as a single JSON document, with the
+# fields that are filtered or sorted on exposed as generated columns instead of copied into the row
+DOCUMENT_TABLE = 'hb_hotel_document'
+DOCUMENT_HASH_TABLE = 'hb_hotel_lean_document_hash'
+
+# Hotels per multi-row INSERT in the lean document mode
+DOCUMENT_CHUNK_SIZE = 100
+
+
+# Function to create the lean document table if it does not exist yet. JSON_UNQUOTE(JSON_EXTRACT())
+# works on both MySQL and MariaDB; the indexed columns are STORED so MariaDB can index them too.
+def create_document_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DOCUMENT_TABLE} (
+            hotel_code INT NOT NULL PRIMARY KEY,
+            document JSON NOT NULL,
+            hotel_name VARCHAR(255) AS (JSON_UNQUOTE(JSON_EXTRACT(document, '$.name.content'))) VIRTUAL,
+            category_code VARCHAR(20) AS (JSON_UNQUOTE(JSON_EXTRACT(document, '$.categoryCode'))) STORED,
+            accommodation_type_code VARCHAR(20)
+                AS (JSON_UNQUOTE(JSON_EXTRACT(document, '$.accommodationTypeCode'))) VIRTUAL,
+            country_code VARCHAR(2) AS (JSON_UNQUOTE(JSON_EXTRACT(document, '$.countryCode'))) STORED,
+            destination_code VARCHAR(10) AS (JSON_UNQUOTE(JSON_EXTRACT(document, '$.destinationCode'))) STORED,
+            city VARCHAR(255) AS (JSON_UNQUOTE(JSON_EXTRACT(document, '$.city.content'))) VIRTUAL,
+            ranking INT AS (JSON_EXTRACT(document, '$.ranking')) VIRTUAL,
+            last_update VARCHAR(10) AS (JSON_UNQUOTE(JSON_EXTRACT(document, '$.lastUpdate'))) STORED,
+            KEY idx_destination (country_code, destination_code),
+            KEY idx_category (category_code),
+            KEY idx_last_update (last_update)
+        )
+    """)
+
+
+# Function to serialize a hotel once, with orjson when it is installed. The result is passed as text:
+# MySQL refuses to build a JSON value from a binary string.
+def dump_document(hotel):
+    if orjson:
+        return orjson.dumps(hotel).decode('utf-8')
+    return json.dumps(hotel, ensure_ascii=False, separators=(',', ':'))
+
+
+# Function to insert a page of hotels as lean documents: one JSON document per hotel, written with a
+# multi-row INSERT that replaces the document of a hotel that is already there
+def insert_documents_into_mysql(hotel_data, conn, replace_existing=False, content_hashes=None):
+    if not hotel_data or not conn:
+        logging.error("Invalid input data or MySQL connection.")
+        return False
+
+    cursor = conn.cursor()
+    insert_query = f"""
+        INSERT INTO {DOCUMENT_TABLE} (hotel_code, document) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE document = VALUES(document)
+    """
+
+    try:
+        rows = [(hotel['code'], dump_document(hotel)) for hotel in hotel_data['hotels']]
+        for start in range(0, len(rows), DOCUMENT_CHUNK_SIZE):
+            chunk = rows[start:start + DOCUMENT_CHUNK_SIZE]
+            with metrics.db_write(DOCUMENT_TABLE, len(chunk)):
+                cursor.executemany(insert_query, chunk)
+
+        if content_hashes:
+            store_hashes(cursor, DOCUMENT_HASH_TABLE, content_hashes)
+
+        with metrics.DB_COMMIT_SECONDS.time():
+            conn.commit()
+        logging.info(f"Data inserted into MySQL table {DOCUMENT_TABLE} successfully ({len(rows)} hotels).")
+        return True
+
+    except mysql.connector.Error as err:
+        logging.error(f"Error inserting data into MySQL table: {DOCUMENT_TABLE}, Error: {err}")
+        conn.rollback()
+        return False
+
+    finally:
+        cursor.close()
+
+
+def upsert_documents_into_mysql(hotel_data, conn):
+    return upsert_hotels_into_mysql(hotel_data, conn, insert_documents_into_mysql, DOCUMENT_HASH_TABLE)
 
+# Names this script's page ranges are recorded under in the checkpoint store
+CHECKPOINT_RESOURCE = 'hotels_document'
+LEAN_CHECKPOINT_RESOURCE = 'hotels_lean_document'
+
+DOCUMENT_INGEST_JOB = IngestJob(CHECKPOINT_RESOURCE, fetch_hotel_data, insert_data_into_mysql, 'hotel_data',
+                                endpoint='hotels', request_params=hotel_request_params, records_key='hotels')
+DOCUMENT_UPSERT_JOB = DOCUMENT_INGEST_JOB._replace(load_page=upsert_hotels_into_mysql)
+LEAN_INGEST_JOB = DOCUMENT_INGEST_JOB._replace(resource=LEAN_CHECKPOINT_RESOURCE,
+                                               load_page=insert_documents_into_mysql)
+LEAN_UPSERT_JOB = LEAN_INGEST_JOB._replace(load_page=upsert_documents_into_mysql)
+
+
+# Function to create the tables the document modes need before the first page is loaded
+def prepare_tables(create_tables):
     conn = connect_to_mysql()
     if not conn:
-        return
+        return False
+    cursor = conn.cursor()
+    try:
+        create_tables(cursor)
+        conn.commit()
+        return True
+    except mysql.connector.Error as err:
+        logging.error(f"Error creating MySQL tables: {err}")
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def prepare_document_ingest(upsert):
+    return not upsert or prepare_tables(lambda cursor: create_hash_table(cursor, CONTENT_HASH_TABLE))
+
 
-    for from_index in range(start_index, end_index, batch_size):
-        to_index = from_index + batch_size - 1
-        hotel_data = fetch_hotel_data(from_index, to_index)
-        if hotel_data:
-            save_json_to_file(hotel_data, f'hotel_data_{from_index}_{to_index}.json')
-            insert_data_into_mysql(hotel_data, conn)
+def prepare_lean_ingest(upsert):
+    def create_tables(cursor):
+        create_document_table(cursor)
+        if upsert:
+            create_hash_table(cursor, DOCUMENT_HASH_TABLE)
+    return prepare_tables(create_tables)
 
-    conn.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load Hotelbeds hotels into the JSON document hb_hotel_info table.')
+    parser.add_argument('--start', type=int, default=1, help='Starting index')
+    parser.add_argument('--end', type=int, default=400, help='End index')
+    parser.add_argument('--batch-size', type=int, default=200, help='Number of records per batch')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip ranges already completed in the checkpoint file and retry the rest')
+    parser.add_argument('--checkpoint-file', default=DEFAULT_CHECKPOINT_FILE)
+    parser.add_argument('--upsert', action='store_true',
+                        help='Skip hotels whose content hash is unchanged and replace the rows of changed ones')
+    parser.add_argument('--lean', action='store_true',
+                        help=f'Store each hotel once as a JSON document in {DOCUMENT_TABLE}, with generated '
+                             f'columns for the hot fields')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ingest.run_resource('hotels_lean' if args.lean else 'hotels_document', args, module=sys.modules[__name__])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,278 @@
+import atexit
+import bisect
+import contextlib
+import http.server
+import logging
+import math
+import os
+import threading
+import time
+
+# Latency buckets in seconds, from a fast local INSERT to a slow API page
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, key)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# Base of the metric types: a name, help text and label names, and values kept per label set
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    # Function to get the total over every label set, or only those matching the given labels
+    def total(self, **labels):
+        wanted = [(self.labelnames.index(name), str(value)) for name, value in labels.items()]
+        with self.lock:
+            return sum(count for key, count in self.values.items()
+                       if all(key[index] == value for index, value in wanted))
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(self.labelnames, labels)] = value
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(_label_key(self.labelnames, labels), 0)
+
+
+# Cumulative histogram with fixed bucket upper bounds, as Prometheus expects them
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    # Function to get (count, sum) over every label set
+    def count_and_sum(self):
+        with self.lock:
+            return (sum(sum(counts) for counts, _ in self.values.values()),
+                    sum(total for _, total in self.values.values()))
+
+    # Function to estimate the q quantile (0..1) over every label set as the upper bound of the bucket
+    # it falls in; math.inf if it falls past the last bucket, None without observations
+    def quantile(self, q):
+        with self.lock:
+            merged = [sum(counts[i] for counts, _ in self.values.values()) for i in range(len(self.buckets) + 1)]
+        count = sum(merged)
+        if not count:
+            return None
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), merged):
+            running += bucket_count
+            if running >= q * count:
+                return bound
+        return math.inf
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                running = 0
+                for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                    running += bucket_count
+                    le = 'le="+Inf"' if bound == math.inf else f'le="{bound!r}"'
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [le])} {running}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {running}')
+        return lines
+
+
+REGISTRY = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+API_REQUEST_SECONDS = _register(Histogram(
+    'hb_api_request_seconds', 'Time per API request attempt, until the body (or headers when streaming) arrived',
+    ('endpoint', 'status')))
+API_BYTES = _register(Counter('hb_api_bytes_total', 'Decompressed API response bytes read', ('endpoint',)))
+API_RETRIES = _register(Counter('hb_api_retries_total', 'API requests retried, by reason', ('endpoint', 'reason')))
+RATE_LIMIT_WAIT_SECONDS = _register(Counter(
+    'hb_rate_limit_wait_seconds_total', 'Time spent waiting for the API rate limiter'))
+PAGE_FETCH_SECONDS = _register(Histogram(
+    'hb_page_fetch_seconds', 'Time to fetch, archive and parse one page', ('resource',)))
+PAGE_LOAD_SECONDS = _register(Histogram(
+    'hb_page_load_seconds', 'Time to transform and load one page into MySQL', ('resource',)))
+PAGES = _register(Counter('hb_pages_total', 'Pages finished, by outcome', ('resource', 'status')))
+RECORDS_LOADED = _register(Counter('hb_records_loaded_total', 'Records (hotels, facilities, ...) loaded',
+                                   ('resource',)))
+ROWS_WRITTEN = _register(Counter('hb_rows_written_total', 'Rows written to MySQL', ('table',)))
+DB_EXECUTE_SECONDS = _register(Histogram('hb_db_execute_seconds', 'Time per batched MySQL write', ('table',)))
+DB_COMMIT_SECONDS = _register(Histogram('hb_db_commit_seconds', 'Time per MySQL commit'))
+PAGE_QUEUE_DEPTH = _register(Gauge('hb_page_queue_depth', 'Pages fetched and waiting for a writer', ('resource',)))
+
+
+# Function to time a batched write of rows to a table
+@contextlib.contextmanager
+def db_write(table_name, row_count):
+    with DB_EXECUTE_SECONDS.time(table=table_name):
+        yield
+    ROWS_WRITTEN.inc(row_count, table=table_name)
+
+
+# Function to render every metric in the Prometheus text exposition format
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to serve /metrics on a background thread; returns the server (server_port has the port)
+def start_http_server(port, host='127.0.0.1'):
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+def _format_seconds(value):
+    if value is None:
+        return '-'
+    return '>60s' if value == math.inf else f'{value * 1000:.0f}ms'
+
+
+# Function to build one summary line from the totals now and at the previous summary, so the rates
+# cover the interval between them and it is visible whether the API, parsing or MySQL is the limit
+def summary_line(previous, elapsed):
+    current = {
+        'records': RECORDS_LOADED.total(),
+        'rows': ROWS_WRITTEN.total(),
+        'bytes': API_BYTES.total(),
+        'retries': API_RETRIES.total(),
+        'failed_pages': PAGES.total(status='failed'),
+        'api_seconds': API_REQUEST_SECONDS.count_and_sum()[1],
+        'fetch_seconds': PAGE_FETCH_SECONDS.count_and_sum()[1],
+        'db_seconds': DB_EXECUTE_SECONDS.count_and_sum()[1] + DB_COMMIT_SECONDS.count_and_sum()[1],
+        'wait_seconds': RATE_LIMIT_WAIT_SECONDS.total(),
+    }
+    delta = {key: value - previous.get(key, 0) for key, value in current.items()}
+    elapsed = max(elapsed, 1e-9)
+    with PAGE_QUEUE_DEPTH.lock:
+        queue_depth = sum(PAGE_QUEUE_DEPTH.values.values())
+    parse_seconds = max(delta['fetch_seconds'] - delta['api_seconds'], 0)
+    line = (f"{delta['records'] / elapsed:.1f} records/s, {delta['rows'] / elapsed:.0f} rows/s, "
+            f"{delta['bytes'] / elapsed / 1024 / 1024:.2f} MB/s downloaded, "
+            f"API p50/p99 {_format_seconds(API_REQUEST_SECONDS.quantile(0.5))}/"
+            f"{_format_seconds(API_REQUEST_SECONDS.quantile(0.99))}, "
+            f"busy seconds API {delta['api_seconds']:.1f} / parse {parse_seconds:.1f} / "
+            f"MySQL {delta['db_seconds']:.1f} / rate limit wait {delta['wait_seconds']:.1f}, "
+            f"{delta['retries']:.0f} retries, {delta['failed_pages']:.0f} failed pages, queue depth {queue_depth}")
+    return line, current
+
+
+# Background thread logging a summary line every interval seconds, and a last one at exit
+class SummaryReporter:
+    def __init__(self, interval=60):
+        self.interval = interval
+        self.previous = {}
+        self.last = time.monotonic()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='metrics-summary', daemon=True)
+
+    def report(self):
+        now = time.monotonic()
+        line, self.previous = summary_line(self.previous, now - self.last)
+        self.last = now
+        logging.info(f"Metrics: {line}")
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def start(self):
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if not self.stopped.is_set():
+            self.stopped.set()
+            self.report()
+
+
+_started = False
+_started_lock = threading.Lock()
+
+
+# Function to start the /metrics endpoint (METRICS_PORT, off when unset) and the periodic summary line
+# (METRICS_SUMMARY_INTERVAL seconds, default 60, 0 for none) once per process
+def start_from_env():
+    global _started
+    with _started_lock:
+        if _started:
+            return
+        _started = True
+        port = os.getenv('METRICS_PORT')
+        if port:
+            server = start_http_server(int(port), os.getenv('METRICS_HOST', '127.0.0.1'))
+            logging.info(f"Serving metrics on http://{server.server_address[0]}:{server.server_port}/metrics")
+        interval = float(os.getenv('METRICS_SUMMARY_INTERVAL', 60))
+        if interval > 0:
+            SummaryReporter(interval).start()
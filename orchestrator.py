@@ -0,0 +1,117 @@
+import concurrent.futures
+import logging
+import threading
+import time
+
+from checkpoint import COMPLETED, FAILED, IN_FLIGHT
+
+
+# Function to order names so every name comes after the ones it depends on, keeping the given order
+# otherwise. Dependencies on names that are not being run are ignored.
+def dependency_order(names, depends_on):
+    ordered = []
+    visiting = set()
+
+    def visit(name, path):
+        if name in ordered:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+        visiting.add(name)
+        for dependency in depends_on.get(name, ()):
+            if dependency in names:
+                visit(dependency, path + [name])
+        visiting.discard(name)
+        ordered.append(name)
+
+    for name in names:
+        visit(name, [])
+    return ordered
+
+
+# Function to run run(name) for every name on up to parallel threads, starting each one as soon as
+# everything it depends on has finished. run returns a truthy result on success; a name whose
+# dependency failed is skipped (result None), and so are the names depending on it.
+# Returns {name: result}.
+def run_with_dependencies(names, run, depends_on, parallel=1):
+    pending = dependency_order(names, depends_on)
+    results = {}
+    running = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, parallel), thread_name_prefix='sync') as executor:
+        while pending or running:
+            for name in list(pending):
+                dependencies = [dependency for dependency in depends_on.get(name, ()) if dependency in names]
+                failed = [dependency for dependency in dependencies if dependency in results and not results[dependency]]
+                if failed:
+                    logging.error(f"Skipping {name}: {', '.join(failed)} did not complete")
+                    results[name] = None
+                    pending.remove(name)
+                elif all(dependency in results for dependency in dependencies) and len(running) < max(1, parallel):
+                    logging.info(f"Starting {name}")
+                    running[executor.submit(run, name)] = name
+                    pending.remove(name)
+
+            if not running:
+                continue
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    logging.error(f"{name} failed: {e}")
+                    results[name] = None
+    return results
+
+
+# Background thread that logs a progress line per resource every interval seconds, counting the
+# ranges each run has completed or failed so far from the shared checkpoint store
+class ProgressReporter:
+    def __init__(self, checkpoints, interval=30):
+        self.checkpoints = checkpoints
+        self.interval = interval
+        self.tracked = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='progress', daemon=True)
+
+    # Function to start tracking a resource run that is about to load total page ranges
+    def track(self, name, checkpoint_resource, total):
+        with self.lock:
+            self.tracked[name] = (checkpoint_resource, total, time.time(), time.monotonic())
+
+    # Function to record that a resource run is over, freezing its elapsed time
+    def finish(self, name):
+        with self.lock:
+            if name in self.tracked:
+                self.tracked[name] += (time.monotonic(),)
+
+    def progress_lines(self):
+        with self.lock:
+            tracked = dict(self.tracked)
+        lines = []
+        for name, (resource, total, since, started, *finished) in tracked.items():
+            summary = self.checkpoints.summary(resource, since)
+            completed = summary.get(COMPLETED, 0)
+            elapsed = (finished[0] if finished else time.monotonic()) - started
+            lines.append(f"{name}: {completed}/{total} pages ({100 * completed / max(total, 1):.0f}%), "
+                         f"{summary.get(FAILED, 0)} failed, {summary.get(IN_FLIGHT, 0)} in flight, "
+                         f"{elapsed:.1f}s{'' if finished else ' running'}")
+        return lines
+
+    def report(self):
+        for line in self.progress_lines():
+            logging.info(f"Progress {line}")
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.report()
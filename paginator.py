@@ -0,0 +1,142 @@
+import logging
+import os
+import queue
+import threading
+
+# The content API returns at most this many records per request
+API_MAX_PAGE_SIZE = 1000
+
+
+# Function to merge (from_index, to_index) ranges into sorted, non-overlapping ones
+def merge_ranges(ranges):
+    merged = []
+    for from_index, to_index in sorted(ranges):
+        if merged and from_index <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], to_index)
+        else:
+            merged.append([from_index, to_index])
+    return [tuple(page_range) for page_range in merged]
+
+
+# Function to get the last record index the fixed split of start..end into pages of batch_size
+# (pipeline.page_ranges) requests: end with inclusive_end, otherwise the end of the last full page
+def last_requested_index(start, end, batch_size, inclusive_end=False):
+    if inclusive_end:
+        return end
+    return start + max(0, -(-(end - start) // batch_size)) * batch_size - 1
+
+
+# Hands out from/to windows over start..end whose size follows what the API has been doing. After each
+# fetched page it estimates the time and bytes one record costs and sizes the next windows so a page
+# takes about target_seconds and at most max_bytes, growing by at most growth per page and within
+# min_size..max_size; a failed page halves the size. Ranges in skip (already loaded) are never handed out.
+#
+# It takes the place of the page range queue in the pipeline: fetch workers call get_nowait() (raises
+# queue.Empty once every record has been handed out) and report each page with observe(). Windows
+# never go past last_index, by default the last record pipeline.page_ranges would request with pages of
+# page_size, so whatever sizes they take they cover the same records as the fixed split.
+class AdaptivePaginator:
+    def __init__(self, start, end, page_size, inclusive_end=False, min_size=10, max_size=API_MAX_PAGE_SIZE,
+                 target_seconds=10.0, max_bytes=32 * 1024 * 1024, growth=1.5, skip=(), last_index=None):
+        self.end = end
+        self.inclusive_end = inclusive_end
+        if last_index is None:
+            last_index = last_requested_index(start, end, page_size, inclusive_end)
+        self.last_index = last_index
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, min(max_size, API_MAX_PAGE_SIZE))
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self.growth = growth
+        self.size = self._clamp(page_size)
+        self.skip = merge_ranges(skip)
+        self.next_index = start
+        self.seconds_per_record = None
+        self.bytes_per_record = None
+        self.pages = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    # Function to build a paginator with its bounds from ADAPTIVE_MIN_PAGE_SIZE, ADAPTIVE_MAX_PAGE_SIZE,
+    # ADAPTIVE_TARGET_SECONDS and ADAPTIVE_MAX_PAGE_BYTES
+    @classmethod
+    def from_env(cls, start, end, page_size, inclusive_end=False, skip=(), last_index=None):
+        return cls(start, end, page_size, inclusive_end,
+                   min_size=int(os.getenv('ADAPTIVE_MIN_PAGE_SIZE', 10)),
+                   max_size=int(os.getenv('ADAPTIVE_MAX_PAGE_SIZE', API_MAX_PAGE_SIZE)),
+                   target_seconds=float(os.getenv('ADAPTIVE_TARGET_SECONDS', 10)),
+                   max_bytes=int(os.getenv('ADAPTIVE_MAX_PAGE_BYTES', 32 * 1024 * 1024)),
+                   skip=skip, last_index=last_index)
+
+    def _clamp(self, size):
+        return int(max(self.min_size, min(self.max_size, size)))
+
+    @property
+    def page_size(self):
+        return self.size
+
+    def _done(self, index):
+        return index > self.last_index
+
+    def get_nowait(self):
+        with self.lock:
+            from_index = self.next_index
+            # Jump over the loaded ranges the window would start in
+            for skip_from, skip_to in self.skip:
+                if skip_from <= from_index <= skip_to:
+                    from_index = skip_to + 1
+            if self._done(from_index):
+                raise queue.Empty
+            to_index = min(from_index + self.size - 1, self.last_index)
+            # Stop short of the next loaded range
+            for skip_from, _ in self.skip:
+                if from_index < skip_from <= to_index:
+                    to_index = skip_from - 1
+                    break
+            self.next_index = to_index + 1
+            return from_index, to_index
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.get_nowait()
+            except queue.Empty:
+                return
+
+    # Function to estimate how many windows are left at the current size, for progress reporting
+    def estimated_ranges(self):
+        with self.lock:
+            remaining = self.last_index - self.next_index + 1
+            remaining -= sum(max(0, skip_to - max(skip_from, self.next_index) + 1) for skip_from, skip_to in self.skip)
+            return max(0, -(-remaining // self.size))
+
+    # Function to learn from a fetched page: records it held, seconds the request took and the bytes of
+    # its body (None if unknown), or failed if it could not be fetched
+    def observe(self, records=0, seconds=None, response_bytes=None, failed=False):
+        with self.lock:
+            self.pages += 1
+            if failed:
+                self.failures += 1
+                self.size = self._clamp(self.size // 2)
+                logging.info(f"Page failed, page size down to {self.size} "
+                             f"({self.failures}/{self.pages} pages failed).")
+                return
+            if not records or seconds is None:
+                return
+            self.seconds_per_record = self._average(self.seconds_per_record, seconds / records)
+            if response_bytes:
+                self.bytes_per_record = self._average(self.bytes_per_record, response_bytes / records)
+
+            ideal = self.target_seconds / max(self.seconds_per_record, 1e-6)
+            if self.bytes_per_record:
+                ideal = min(ideal, self.max_bytes / self.bytes_per_record)
+            size = self._clamp(min(ideal, self.size * self.growth))
+            if size != self.size:
+                logging.debug(f"Page size {self.size} -> {size} ({self.seconds_per_record * 1000:.1f} ms and "
+                              f"{self.bytes_per_record or 0:.0f} bytes per record)")
+            self.size = size
+
+    # Exponentially weighted, so the estimate follows the catalogue as the crawl moves through it
+    @staticmethod
+    def _average(current, sample, weight=0.3):
+        return sample if current is None else current + weight * (sample - current)
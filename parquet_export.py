@@ -0,0 +1,234 @@
+import logging
+import os
+import threading
+import uuid
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+except ImportError:  # only needed for the Parquet export
+    pyarrow = None
+
+from transform import HOTEL_TABLES, flatten_hotels_separately
+
+# Every exported table is split into <table>/country_code=<..>/destination_code=<..>/ directories
+PARTITION_COLUMNS = ('country_code', 'destination_code')
+
+# Buffered rows of a table that trigger writing it out; bigger buffers mean fewer, larger files per partition
+DEFAULT_FLUSH_ROWS = 500000
+
+# Columns of the rows transform.flatten_hotel_data makes, as (name, type) with the types named in
+# _arrow_type. Rooms and stays are keyed by their natural key instead of the MySQL ids, which only exist
+# in the database. Columns typed 'code' are dictionary-encoded, in Arrow and in the Parquet files.
+EXPORT_COLUMNS = {
+    'hb_hotel_info': (('hotel_code', 'int'), ('hotel_name', 'text'), ('category_code', 'code'),
+                      ('accommodation_type_code', 'code'), ('email', 'text'), ('website', 'text'),
+                      ('last_update', 'text'), ('S2C', 'code'), ('ranking', 'int')),
+    'hb_location_coordinates': (('hotel_code', 'int'), ('longitude', 'float'), ('latitude', 'float'),
+                                ('country_code', 'text'), ('state_code', 'code'), ('destination_code', 'text'),
+                                ('zone_code', 'int'), ('city', 'code')),
+    'hb_description': (('hotel_code', 'int'), ('description_text', 'text')),
+    'hb_facilities': (('hotel_code', 'int'), ('facility_code', 'int'), ('facility_group_code', 'int'),
+                      ('number', 'int'), ('voucher', 'bool')),
+    'hb_rooms_type': (('hotel_code', 'int'), ('room_code', 'code'), ('room_type', 'code'),
+                      ('characteristic_code', 'code'), ('min_pax', 'int'), ('max_pax', 'int'),
+                      ('min_adults', 'int'), ('max_adults', 'int'), ('max_children', 'int'),
+                      ('is_parent_room', 'bool')),
+    'hb_room_features': (('hotel_code', 'int'), ('room_code', 'code'), ('facility_code', 'int'),
+                         ('facility_group_code', 'int'), ('ind_logic', 'bool'), ('number', 'int'),
+                         ('voucher', 'bool')),
+    'hb_room_stays': (('hotel_code', 'int'), ('room_code', 'code'), ('stay_type', 'code'),
+                      ('stay_order', 'code'), ('description', 'text')),
+    'hb_room_stay_facilities': (('hotel_code', 'int'), ('room_code', 'code'), ('stay_type', 'code'),
+                                ('stay_order', 'code'), ('facility_code', 'int'),
+                                ('facility_group_code', 'int'), ('number', 'int')),
+    'hb_phone_numbers': (('hotel_code', 'int'), ('phone_number', 'text'), ('phone_type', 'code')),
+    'hb_board_codes': (('hotel_code', 'int'), ('board_code', 'code')),
+    'hb_address': (('hotel_code', 'int'), ('address', 'text'), ('city', 'code')),
+    'hb_images': (('hotel_code', 'int'), ('image_type_code', 'code'), ('path', 'text'), ('image_order', 'int'),
+                  ('visual_order', 'int'), ('room_code', 'code'), ('room_type', 'code'),
+                  ('characteristic_code', 'code')),
+}
+
+# Leading row values that hold a parent's natural key (a tuple) and are spread over several columns
+KEY_WIDTHS = {'hb_room_features': 2, 'hb_room_stays': 2, 'hb_room_stay_facilities': 4}
+
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise ValueError("The Parquet export needs the pyarrow package")
+
+
+def _arrow_type(kind):
+    return {
+        'int': pyarrow.int64(),
+        'float': pyarrow.float64(),
+        'bool': pyarrow.bool_(),
+        'text': pyarrow.string(),
+        'code': pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+    }[kind]
+
+
+# Function to get the Arrow schema of an exported table: its columns, then the partition columns the
+# table does not have itself
+def export_schema(table_name):
+    _require_pyarrow()
+    columns = EXPORT_COLUMNS[table_name]
+    names = {name for name, _ in columns}
+    fields = [pyarrow.field(name, _arrow_type(kind)) for name, kind in columns]
+    fields += [pyarrow.field(name, pyarrow.string()) for name in PARTITION_COLUMNS if name not in names]
+    return pyarrow.schema(fields)
+
+
+# Function to turn a value into the Python type of a column kind, or None if it cannot be: codes that
+# are numbers on some pages and strings on others become strings, numbers sent as strings numbers
+def _coerce(value, kind):
+    if value is None:
+        return None
+    try:
+        if kind in ('code', 'text'):
+            return value if isinstance(value, str) else str(value)
+        if kind == 'int':
+            return int(value)
+        if kind == 'float':
+            return float(value)
+        if isinstance(value, str):
+            return value.strip().lower() in ('true', '1', 'y', 'yes')
+        return bool(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Function to build an Arrow column of a fixed type. Values of another type are only converted when
+# the column does not convert as it is, so well-typed pages pay nothing for it.
+def _arrow_column(values, kind, arrow_type):
+    try:
+        return pyarrow.array(values, type=arrow_type)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        return pyarrow.array([_coerce(value, kind) for value in values], type=arrow_type)
+
+
+def _partition_of(hotel):
+    return hotel.get('countryCode'), hotel.get('destinationCode')
+
+
+# Function to flatten a page of hotels into an Arrow table per HOTEL_TABLES entry (tables without rows
+# are left out). Like flatten_hotel_data it touches neither the network nor the database, so it can run
+# in a worker process. A page that cannot be flattened as a whole is flattened hotel by hotel, and the
+# hotels that fail are logged and left out. Values are converted to the column types of EXPORT_COLUMNS
+# (those that cannot be are left empty), so every page has the same schema. Returns (tables, hotels
+# exported).
+def page_tables(hotel_data):
+    _require_pyarrow()
+    rows, hotels, failed = flatten_hotels_separately(hotel_data)
+    for hotel, err in failed:
+        code = hotel.get('code') if isinstance(hotel, dict) else None
+        logging.error(f"Hotel {code} left out of the Parquet export: {type(err).__name__}: {err}")
+
+    partitions = {hotel['code']: _partition_of(hotel) for hotel in hotels}
+    tables = {}
+    for table_name in HOTEL_TABLES:
+        table_rows = rows[table_name]
+        if not table_rows:
+            continue
+        schema = export_schema(table_name)
+        key_width = KEY_WIDTHS.get(table_name)
+        if key_width:
+            table_rows = [row[0] + row[1:] for row in table_rows]
+        partition_at = len(EXPORT_COLUMNS[table_name])
+        columns = list(zip(*table_rows))
+        if len(schema) > partition_at:
+            hotel_partitions = [partitions.get(hotel_code, (None, None)) for hotel_code in columns[0]]
+            columns += list(zip(*hotel_partitions))
+        kinds = [kind for _, kind in EXPORT_COLUMNS[table_name]] + ['text'] * (len(schema) - partition_at)
+        tables[table_name] = pyarrow.Table.from_arrays(
+            [_arrow_column(column, kind, field.type) for column, kind, field in zip(columns, kinds, schema)],
+            schema=schema)
+    return tables, len(hotels)
+
+
+# Writes the flattened hotel data to Parquet under directory, one dataset per table partitioned by
+# PARTITION_COLUMNS (Hive-style directory names, which DuckDB, Spark, pandas and pyarrow read as
+# columns). Pages are buffered per table and written once flush_rows rows are waiting, so the files
+# do not shrink to a page each. Every exporter names its files with a run id of its own, so several
+# exporters (threads, processes or hosts sharing a file system) can write into the same directory.
+#
+# The export adds to what is in directory: export a full load or replay into a fresh directory, as
+# loading a page twice exports it twice.
+class ParquetExporter:
+    def __init__(self, directory, flush_rows=DEFAULT_FLUSH_ROWS, compression='zstd'):
+        _require_pyarrow()
+        self.directory = directory
+        self.flush_rows = flush_rows
+        self.file_options = pyarrow.dataset.ParquetFileFormat().make_write_options(
+            compression=compression,
+            use_dictionary=[name for columns in EXPORT_COLUMNS.values() for name, kind in columns
+                            if kind == 'code'])
+        self.partitioning = pyarrow.dataset.partitioning(
+            pyarrow.schema([pyarrow.field(name, pyarrow.string()) for name in PARTITION_COLUMNS]), flavor='hive')
+        self.run_id = uuid.uuid4().hex[:12]
+        self.buffers = {table_name: [] for table_name in HOTEL_TABLES}
+        self.buffered_rows = dict.fromkeys(HOTEL_TABLES, 0)
+        self.files_written = 0
+        self.hotels = 0
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+    # Function to build an exporter writing to directory, with its flush size from PARQUET_FLUSH_ROWS
+    # and compression from PARQUET_COMPRESSION (default zstd)
+    @classmethod
+    def from_env(cls, directory):
+        return cls(directory, flush_rows=int(os.getenv('PARQUET_FLUSH_ROWS', DEFAULT_FLUSH_ROWS)),
+                   compression=os.getenv('PARQUET_COMPRESSION', 'zstd'))
+
+    # Function to export a page of hotels; returns False if it could not be converted at all
+    def write_page(self, hotel_data):
+        try:
+            tables, hotels = page_tables(hotel_data)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError) as err:
+            logging.error(f"Page could not be converted for the Parquet export: {err}")
+            return False
+        self.add_tables(tables, hotels)
+        return True
+
+    # Function to buffer the tables of a page made by page_tables, writing out the tables whose buffer
+    # is full
+    def add_tables(self, tables, hotels=0):
+        full = []
+        with self.lock:
+            self.hotels += hotels
+            for table_name, table in tables.items():
+                self.buffers[table_name].append(table)
+                self.buffered_rows[table_name] += table.num_rows
+                if self.buffered_rows[table_name] >= self.flush_rows:
+                    full.append((table_name, self._take(table_name)))
+        for table_name, buffered in full:
+            self._write(table_name, buffered)
+
+    def _take(self, table_name):
+        buffered, self.buffers[table_name] = self.buffers[table_name], []
+        self.buffered_rows[table_name] = 0
+        return buffered
+
+    def _write(self, table_name, buffered):
+        # Pages may have built different dictionaries for the same column
+        table = pyarrow.concat_tables(buffered).unify_dictionaries()
+        with self.write_lock:
+            self.files_written += 1
+            pyarrow.dataset.write_dataset(
+                table, os.path.join(self.directory, table_name), format='parquet',
+                partitioning=self.partitioning, file_options=self.file_options,
+                basename_template=f'part-{self.run_id}-{self.files_written}-{{i}}.parquet',
+                existing_data_behavior='overwrite_or_ignore')
+
+    # Function to write out everything still buffered
+    def flush(self):
+        with self.lock:
+            buffered = [(table_name, self._take(table_name)) for table_name in HOTEL_TABLES
+                        if self.buffers[table_name]]
+        for table_name, tables in buffered:
+            self._write(table_name, tables)
+
+    def close(self):
+        self.flush()
+        logging.info(f"Exported {self.hotels} hotels to Parquet in {self.directory}.")
@@ -0,0 +1,362 @@
+import collections
+import concurrent.futures
+import functools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+
+import mysql.connector
+import requests
+
+import db_pool
+import metrics
+import profiling
+from archive import get_shared_archive
+from dead_letter import take_page_dead_letter_codes
+from hotelbeds_client import get_shared_client
+from paginator import AdaptivePaginator
+
+# Marker put on the page queue to tell a writer there is nothing left to load
+PIPELINE_DONE = object()
+
+# What a run does with each page range: which checkpoint resource it records to, how a page is
+# fetched and loaded and the prefix of the archived page name. Jobs whose pages can be transformed
+# into rows in a worker process name the transform and how those rows are loaded (load_rows is given
+# the page and its rows as a (data, rows) pair, so it can still check the records); jobs that can be
+# streamed name the endpoint, its request parameters (from_index, to_index) and the key of the
+# record list in its responses. export_page, if set, is given every page (its data) once it has loaded.
+IngestJob = collections.namedtuple(
+    'IngestJob',
+    ['resource', 'fetch_page', 'load_page', 'file_prefix', 'load_rows', 'transform', 'endpoint', 'request_params',
+     'records_key', 'export_page'],
+    defaults=(None, None, None, None, None, None))
+
+# Pipeline sizing: fetcher threads (0 fetches and loads one page at a time, as the scripts always did),
+# writer threads each with their own pooled connection, pages buffered between them and transform
+# processes (0 transforms on the writer threads)
+PipelineSettings = collections.namedtuple(
+    'PipelineSettings', ['fetch_workers', 'writer_workers', 'queue_size', 'transform_workers'])
+
+
+# Function to read the pipeline sizing from FETCH_WORKERS (default 0, sequential), WRITER_WORKERS
+# (default 1), PAGE_QUEUE_SIZE (default 8) and TRANSFORM_WORKERS (default 0). A run only goes
+# concurrent when FETCH_WORKERS is set.
+def settings_from_env():
+    return PipelineSettings(
+        fetch_workers=int(os.getenv('FETCH_WORKERS', 0)),
+        writer_workers=int(os.getenv('WRITER_WORKERS', 1)),
+        queue_size=int(os.getenv('PAGE_QUEUE_SIZE', 8)),
+        transform_workers=int(os.getenv('TRANSFORM_WORKERS', 0))
+    )
+
+
+# Function to split start..end into from/to page ranges of batch_size records. With inclusive_end the
+# last range stops at end; otherwise end is exclusive for the range starts and every range is full size.
+def page_ranges(start, end, batch_size, inclusive_end=False):
+    if inclusive_end:
+        return [(from_index, min(from_index + batch_size - 1, end))
+                for from_index in range(start, end + 1, batch_size)]
+    return [(from_index, from_index + batch_size - 1) for from_index in range(start, end, batch_size)]
+
+
+# Function to put page ranges on a queue for worker threads; an AdaptivePaginator is its own queue
+def range_source(page_ranges):
+    if isinstance(page_ranges, AdaptivePaginator):
+        return page_ranges
+    range_queue = queue.Queue()
+    for page_range in page_ranges:
+        range_queue.put(page_range)
+    return range_queue
+
+
+# Function to tell an AdaptivePaginator how fetching a page went, so it can size the next ones
+def observe_page(range_source, job, page):
+    if not isinstance(range_source, AdaptivePaginator):
+        return
+    last_response = get_shared_client().last_response() if page else None
+    if not last_response:
+        range_source.observe(failed=True)
+        return
+    seconds, response_bytes = last_response
+    range_source.observe(len(page.get(job.records_key or 'hotels', [])), seconds, response_bytes)
+
+
+# Fetcher thread: takes page ranges off range_queue and hands the fetched pages to the writers.
+# page_queue is bounded, so put() blocks once the writers fall behind and fetching pauses with it.
+# With a transform_pool, the page is transformed in a worker process and the writers get the page
+# together with a future of its rows.
+def fetch_pages_worker(range_queue, page_queue, checkpoints, job, transform_pool=None):
+    while True:
+        try:
+            from_index, to_index = range_queue.get_nowait()
+        except queue.Empty:
+            return
+        checkpoints.mark_in_flight(job.resource, from_index, to_index)
+        try:
+            with metrics.PAGE_FETCH_SECONDS.time(resource=job.resource):
+                page = job.fetch_page(from_index, to_index,
+                                      archive_name=f'{job.file_prefix}_{from_index}_{to_index}')
+            observe_page(range_queue, job, page)
+            if page and transform_pool:
+                page_queue.put((from_index, to_index, (page, transform_pool.submit(job.transform, page))))
+            elif page:
+                page_queue.put((from_index, to_index, page))
+            else:
+                checkpoints.mark_failed(job.resource, from_index, to_index, 'fetch failed')
+                metrics.PAGES.inc(resource=job.resource, status='fetch_failed')
+            metrics.PAGE_QUEUE_DEPTH.set(page_queue.qsize(), resource=job.resource)
+        except Exception as e:
+            logging.error(f"Fetcher failed for records {from_index} to {to_index}: {e}")
+            checkpoints.mark_failed(job.resource, from_index, to_index, str(e))
+            metrics.PAGES.inc(resource=job.resource, status='fetch_failed')
+
+
+# Function to count a page that has been loaded, or that failed to load, and to export it once loaded
+def record_page_loaded(job, page, loaded):
+    metrics.PAGES.inc(resource=job.resource, status='loaded' if loaded else 'failed')
+    written = written_records(job, page[0] if isinstance(page, tuple) else page)
+    if loaded:
+        metrics.RECORDS_LOADED.inc(len(written.get(job.records_key or 'hotels', [])), resource=job.resource)
+        export_page(job, written)
+
+
+# Function to get a page that has just been loaded on this thread without the records the load
+# dead-lettered (rejected by REFERENCE_CHECK or failing on their own), i.e. the records now in MySQL
+def written_records(job, data):
+    dead_lettered = take_page_dead_letter_codes()
+    if not dead_lettered:
+        return data
+    key = job.records_key or 'hotels'
+    return {**data, key: [record for record in data.get(key, [])
+                          if not (isinstance(record, dict) and record.get('code') in dead_lettered)]}
+
+
+# Function to hand the written records of a loaded page to the job's export. The page is in MySQL
+# already, so an export that fails is logged without failing the page.
+def export_page(job, data):
+    if not job.export_page:
+        return
+    try:
+        if not job.export_page(data):
+            logging.error(f"Export of a loaded {job.resource} page failed.")
+    except Exception as e:
+        logging.error(f"Export of a loaded {job.resource} page failed: {e}")
+
+
+# Function to load a page whose rows were transformed in the transform pool. If the transform or the
+# all-or-nothing load of those rows fails (or load_rows turns the page down), the page is loaded again
+# with job.load_page, which for hotels isolates the bad records.
+def load_transformed_page(job, page, conn):
+    data, rows_future = page
+    try:
+        if job.load_rows((data, rows_future.result()), conn):
+            return True
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        logging.error(f"Error transforming page in the transform pool: {e}")
+    if not conn.is_connected():
+        return False
+    logging.info("Loading the page again with bad records isolated.")
+    return job.load_page(data, conn)
+
+
+# Writer thread: drains page_queue into MySQL over its own pooled connection and transaction.
+# The connection is health-checked before every page, and a page whose load failed because the
+# connection dropped is retried once on a fresh one.
+def write_pages_worker(page_queue, checkpoints, job, pool):
+    conn = None
+    try:
+        while True:
+            item = page_queue.get()
+            if item is PIPELINE_DONE:
+                return
+            from_index, to_index, page = item
+            metrics.PAGE_QUEUE_DEPTH.set(page_queue.qsize(), resource=job.resource)
+            if isinstance(page, tuple):
+                load = functools.partial(load_transformed_page, job)
+            else:
+                load = job.load_page
+            with metrics.PAGE_LOAD_SECONDS.time(resource=job.resource):
+                loaded, conn = db_pool.load_with_reconnect(pool, conn, load, page,
+                                                           f'records {from_index} to {to_index}')
+            record_page_loaded(job, page, loaded)
+            if loaded:
+                checkpoints.mark_completed(job.resource, from_index, to_index)
+            else:
+                checkpoints.mark_failed(job.resource, from_index, to_index, 'insert failed')
+    finally:
+        db_pool.close_connection(conn)
+
+
+# Function to run the ingest as a pipeline: fetch_workers threads fetch pages ahead of time into a
+# queue of at most queue_size pages, and writer_workers threads load them into MySQL concurrently.
+# With transform_workers > 0 (and a job that supports it) pages are transformed into rows on a process
+# pool in between, so the CPU-bound transform runs on other cores instead of the writer threads.
+def run_pipelined_ingest(page_ranges, checkpoints, job, fetch_workers=4, writer_workers=1, queue_size=8,
+                         transform_workers=0):
+    range_queue = range_source(page_ranges)
+
+    page_queue = queue.Queue(maxsize=queue_size)
+
+    try:
+        pool = db_pool.create_pool(writer_workers)
+    except mysql.connector.Error as err:
+        logging.error(f"Error connecting to MySQL: {err}")
+        return
+
+    transform_pool = None
+    if transform_workers > 0 and job.load_rows and job.transform:
+        # spawn rather than fork: the pool's processes start while the fetcher threads are running
+        transform_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=transform_workers, mp_context=multiprocessing.get_context('spawn'))
+
+    writers = [threading.Thread(target=write_pages_worker, args=(page_queue, checkpoints, job, pool),
+                                name=f'writer-{i}')
+               for i in range(writer_workers)]
+    fetchers = [threading.Thread(target=fetch_pages_worker,
+                                 args=(range_queue, page_queue, checkpoints, job, transform_pool),
+                                 name=f'fetcher-{i}')
+                for i in range(fetch_workers)]
+    for thread in writers + fetchers:
+        thread.start()
+
+    for thread in fetchers:
+        thread.join()
+    for _ in writers:
+        page_queue.put(PIPELINE_DONE)
+    for thread in writers:
+        thread.join()
+
+    if transform_pool:
+        transform_pool.shutdown()
+
+
+# Records handed to the loader at a time in streaming mode
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 25))
+
+
+# Function to stream one page straight into MySQL: records are parsed off the response as it
+# downloads and loaded STREAM_CHUNK_SIZE at a time, while the raw body goes unchanged to the archive.
+# Each chunk commits on its own, so re-run a failed page with --upsert to avoid duplicates.
+def stream_page_into_mysql(from_index, to_index, conn, job):
+    params = job.request_params(from_index, to_index)
+    try:
+        with get_shared_archive().open_page(f'{job.file_prefix}_{from_index}_{to_index}') as archive:
+            chunk = []
+            for record in get_shared_client().iter_items(job.endpoint, params, job.records_key, archive):
+                chunk.append(record)
+                if len(chunk) >= STREAM_CHUNK_SIZE:
+                    if not load_stream_chunk(job, chunk, conn):
+                        return False
+                    chunk = []
+            # The body has been read to the end; a page left before this is not archived
+            archive.commit()
+            if chunk:
+                return load_stream_chunk(job, chunk, conn)
+            return True
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.error(f"Failed to stream data from API: {e}")
+        return False
+
+
+def load_stream_chunk(job, chunk, conn):
+    with metrics.PAGE_LOAD_SECONDS.time(resource=job.resource):
+        loaded = job.load_page({job.records_key: chunk}, conn)
+    written = written_records(job, {job.records_key: chunk})
+    if loaded:
+        metrics.RECORDS_LOADED.inc(len(written[job.records_key]), resource=job.resource)
+        export_page(job, written)
+    return loaded
+
+
+# Streaming worker thread: takes page ranges off range_queue and streams each into MySQL over its own
+# pooled connection, health-checked before every page
+def stream_pages_worker(range_queue, checkpoints, job, pool):
+    conn = None
+    try:
+        while True:
+            try:
+                from_index, to_index = range_queue.get_nowait()
+            except queue.Empty:
+                return
+            checkpoints.mark_in_flight(job.resource, from_index, to_index)
+            try:
+                conn = db_pool.ensure_connection(conn) if conn else db_pool.get_connection(pool)
+                streamed = stream_page_into_mysql(from_index, to_index, conn, job)
+            except mysql.connector.Error as err:
+                logging.error(f"No MySQL connection for records {from_index} to {to_index}: {err}")
+                streamed = False
+            except Exception as e:
+                # e.g. the connection dropping mid-body (urllib3 ProtocolError) or a truncated body (ijson)
+                logging.error(f"Streaming failed for records {from_index} to {to_index}: "
+                              f"{type(e).__name__}: {e}")
+                streamed = False
+            metrics.PAGES.inc(resource=job.resource, status='loaded' if streamed else 'failed')
+            if streamed:
+                checkpoints.mark_completed(job.resource, from_index, to_index)
+            else:
+                checkpoints.mark_failed(job.resource, from_index, to_index, 'stream failed')
+    finally:
+        db_pool.close_connection(conn)
+
+
+# Function to run the ingest in streaming mode: workers threads each stream whole pages, so memory
+# stays at roughly workers * STREAM_CHUNK_SIZE records regardless of the page size. An
+# AdaptivePaginator keeps the page size it starts with, as streamed pages are not observed.
+def run_streaming_ingest(page_ranges, checkpoints, job, workers=1):
+    range_queue = range_source(page_ranges)
+    job = profiling.instrument_job(job)
+
+    try:
+        pool = db_pool.create_pool(max(1, workers))
+    except mysql.connector.Error as err:
+        logging.error(f"Error connecting to MySQL: {err}")
+        return
+
+    threads = [threading.Thread(target=stream_pages_worker, args=(range_queue, checkpoints, job, pool),
+                                name=f'streamer-{i}')
+               for i in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+# Function to fetch and load the page ranges one at a time on a single connection
+def run_sequential_ingest(page_ranges, checkpoints, job):
+    try:
+        pool = db_pool.create_pool(1)
+        conn = db_pool.get_connection(pool)
+    except mysql.connector.Error as err:
+        logging.error(f"Error connecting to MySQL: {err}")
+        return
+
+    for from_index, to_index in page_ranges:
+        checkpoints.mark_in_flight(job.resource, from_index, to_index)
+        with metrics.PAGE_FETCH_SECONDS.time(resource=job.resource):
+            page = job.fetch_page(from_index, to_index, archive_name=f'{job.file_prefix}_{from_index}_{to_index}')
+        observe_page(page_ranges, job, page)
+        if page:
+            with metrics.PAGE_LOAD_SECONDS.time(resource=job.resource):
+                loaded, conn = db_pool.load_with_reconnect(pool, conn, job.load_page, page,
+                                                           f'records {from_index} to {to_index}')
+            record_page_loaded(job, page, loaded)
+            if loaded:
+                checkpoints.mark_completed(job.resource, from_index, to_index)
+                continue
+        checkpoints.mark_failed(job.resource, from_index, to_index)
+
+    db_pool.close_connection(conn)
+
+
+# Function to run page ranges (a list of (from_index, to_index) or an AdaptivePaginator) through the
+# pipeline, or sequentially when settings.fetch_workers is 0. With profiling on (see profiling.start)
+# the job's stages and statements are timed.
+def run_ingest(page_ranges, checkpoints, job, settings):
+    job = profiling.instrument_job(job)
+    if settings.fetch_workers > 0:
+        run_pipelined_ingest(page_ranges, checkpoints, job, settings.fetch_workers, settings.writer_workers,
+                             settings.queue_size, settings.transform_workers)
+    else:
+        run_sequential_ingest(page_ranges, checkpoints, job)
@@ -0,0 +1,311 @@
+import atexit
+import collections
+import contextlib
+import cProfile
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+# Statement kinds the per-table breakdown tells apart, matched at the start of each statement
+STATEMENT_PATTERN = re.compile(
+    r'^\s*(?:(INSERT)\s+(?:IGNORE\s+)?INTO|(REPLACE)\s+INTO|(DELETE)\s+FROM|(UPDATE)|(SELECT)\s.*?\sFROM)\s+`?(\w+)',
+    re.IGNORECASE | re.DOTALL)
+
+# Statements whose rows are counted; for the others only executes and time are
+WRITE_STATEMENTS = ('INSERT', 'REPLACE', 'UPDATE', 'DELETE')
+
+# Distinct statement texts whose kind and table are remembered, so statements with inlined values
+# cannot grow the cache without bound
+STATEMENT_CACHE_SIZE = 10000
+
+_NO_STAGE = contextlib.nullcontext()
+
+_profiler = None
+_start_lock = threading.Lock()
+
+
+# Low-overhead timers per pipeline stage and per statement kind and table, plus in-depth profiling of
+# a sample of the page fetches and loads. Sampled calls run one at a time, each with a stack sampler
+# (flame graph output), and optionally under cProfile and tracemalloc.
+class Profiler:
+    def __init__(self, output_dir, sample_rate=0.02, use_cprofile=False, trace_memory=False, stack_interval=0.005):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.use_cprofile = use_cprofile
+        self.trace_memory = trace_memory
+        self.stack_interval = stack_interval
+        self.lock = threading.Lock()
+        # {stage: [calls, seconds, max seconds]} and {(statement, table): [statements, rows, seconds]}
+        self.stages = {}
+        self.statements = {}
+        self.statement_keys = {}
+        # One sampled call at a time: cProfile and tracemalloc are not made to overlap
+        self.sample_lock = threading.Lock()
+        self.sampled_threads = {}
+        self.stacks = collections.Counter()
+        self.cprofile_stats = None
+        self.memory_peaks = {}
+        self.memory_lines = {}
+        self.started = time.perf_counter()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample_stacks, name='profile-sampler', daemon=True)
+
+    def add_stage(self, name, seconds):
+        with self.lock:
+            totals = self.stages.setdefault(name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+
+    def add_statement(self, query, rows, seconds):
+        key = self.statement_keys.get(query)
+        if key is None:
+            match = STATEMENT_PATTERN.match(query)
+            if match:
+                key = (next(kind for kind in match.groups()[:5] if kind).upper(), match.group(6))
+            else:
+                key = (query.split(None, 1)[0].upper() if query.strip() else '?', '-')
+            if len(self.statement_keys) < STATEMENT_CACHE_SIZE:
+                self.statement_keys[query] = key
+        with self.lock:
+            totals = self.statements.setdefault(key, [0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += rows if key[0] in WRITE_STATEMENTS else 0
+            totals[2] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started)
+
+    # Function to profile a call in depth if it is picked for the sample and no other call is being
+    # profiled; the stage name prefixes its stacks
+    @contextlib.contextmanager
+    def sampled(self, name):
+        if random.random() >= self.sample_rate or not self.sample_lock.acquire(blocking=False):
+            yield
+            return
+        thread_id = threading.get_ident()
+        profile = cProfile.Profile() if self.use_cprofile else None
+        try:
+            if self.trace_memory:
+                tracemalloc.start()
+            self.sampled_threads[thread_id] = name
+            if profile:
+                profile.enable()
+            try:
+                yield
+            finally:
+                if profile:
+                    profile.disable()
+                self.sampled_threads.pop(thread_id, None)
+                if self.trace_memory:
+                    self._record_memory(name, tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+                if profile:
+                    self._record_cprofile(profile)
+        finally:
+            self.sample_lock.release()
+
+    def _record_cprofile(self, profile):
+        with self.lock:
+            if self.cprofile_stats is None:
+                self.cprofile_stats = pstats.Stats(profile)
+            else:
+                self.cprofile_stats.add(profile)
+
+    # tracemalloc traces every thread, so the figures include what other threads allocated meanwhile
+    def _record_memory(self, name, snapshot, peak):
+        statistics = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics('lineno')
+        with self.lock:
+            self.memory_peaks[name] = max(self.memory_peaks.get(name, 0), peak)
+            for statistic in statistics[:50]:
+                frame = statistic.traceback[0]
+                key = (name, frame.filename, frame.lineno)
+                self.memory_lines[key] = max(self.memory_lines.get(key, 0), statistic.size)
+
+    def _sample_stacks(self):
+        while not self.stopped.wait(self.stack_interval):
+            if not self.sampled_threads:
+                continue
+            frames = sys._current_frames()
+            for thread_id, name in list(self.sampled_threads.items()):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[name + ';' + collapse_stack(frame)] += 1
+
+    def start(self):
+        self.sampler.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+
+    def summary_lines(self):
+        elapsed = time.perf_counter() - self.started
+        with self.lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1][1])
+            statements = sorted(self.statements.items(), key=lambda item: -item[1][2])
+        lines = [f"Profile of {elapsed:.1f}s (stage seconds add up over threads; stages nest)",
+                 f"{'stage':<24}{'calls':>9}{'seconds':>11}{'mean ms':>10}{'max ms':>10}"]
+        for name, (calls, seconds, longest) in stages:
+            lines.append(f"{name:<24}{calls:>9}{seconds:>11.2f}{seconds / calls * 1000:>10.2f}{longest * 1000:>10.1f}")
+        lines += ['', f"{'statement':<10}{'table':<28}{'executes':>10}{'rows':>11}{'seconds':>10}{'us/row':>9}"]
+        for (statement, table_name), (executes, rows, seconds) in statements:
+            per_row = f'{seconds / rows * 1e6:.1f}' if rows else '-'
+            lines.append(f"{statement:<10}{table_name:<28}{executes:>10}{rows:>11}{seconds:>10.2f}{per_row:>9}")
+        if self.memory_peaks:
+            lines += ['', 'Peak traced memory of sampled calls:']
+            lines += [f"  {name}: {peak / 1024 / 1024:.1f} MiB" for name, peak in sorted(self.memory_peaks.items())]
+        return lines
+
+    # Function to write profile_summary.txt, stacks.collapsed (one "stage;frame;...;frame count" line
+    # per stack, the input of flamegraph.pl, inferno or speedscope) and, when enabled, cprofile.pstats
+    # and memory_top.txt to output_dir
+    def write_report(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        lines = self.summary_lines()
+        with open(os.path.join(self.output_dir, 'profile_summary.txt'), 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        with open(os.path.join(self.output_dir, 'stacks.collapsed'), 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+        with self.lock:
+            if self.cprofile_stats is not None:
+                self.cprofile_stats.dump_stats(os.path.join(self.output_dir, 'cprofile.pstats'))
+            memory_lines = sorted(self.memory_lines.items(), key=lambda item: -item[1])[:100]
+        if self.trace_memory:
+            with open(os.path.join(self.output_dir, 'memory_top.txt'), 'w') as file:
+                for (name, filename, lineno), size in memory_lines:
+                    file.write(f'{size / 1024:>10.1f} KiB  {name}  {filename}:{lineno}\n')
+        for line in lines:
+            logging.info(f"Profile: {line}")
+        logging.info(f"Profile written to {self.output_dir}")
+
+
+# Function to turn a frame's stack into a root-first "file:function;file:function" string
+def collapse_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+# Connection wrapper timing each statement by kind and table, and commits as a stage
+class TimedConnection:
+    def __init__(self, conn, profiler):
+        self._conn = conn
+        self._profiler = profiler
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs), self._profiler)
+
+    def commit(self):
+        with self._profiler.stage('commit'):
+            self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class TimedCursor:
+    def __init__(self, cursor, profiler):
+        self._cursor = cursor
+        self._profiler = profiler
+
+    def execute(self, query, params=(), *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(query, params, *args, **kwargs)
+        finally:
+            self._profiler.add_statement(query, 1, time.perf_counter() - started)
+
+    def executemany(self, query, rows):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, rows)
+        finally:
+            self._profiler.add_statement(query, len(rows), time.perf_counter() - started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+# Function to time a stage of the ingest, e.g. with profiling.stage('parse_json'): ...
+# Costs next to nothing while profiling is off.
+def stage(name):
+    return _profiler.stage(name) if _profiler else _NO_STAGE
+
+
+# Function to add a duration measured elsewhere to a stage
+def record(name, seconds):
+    if _profiler:
+        _profiler.add_stage(name, seconds)
+
+
+# Function to wrap a job's page functions with the stage timers and sampling, and to give its loads a
+# connection that times every statement. The job is returned unchanged while profiling is off.
+def instrument_job(job):
+    profiler = _profiler
+    if profiler is None:
+        return job
+
+    def fetch_page(*args, **kwargs):
+        with profiler.stage('fetch_page'), profiler.sampled('fetch_page'):
+            return job.fetch_page(*args, **kwargs)
+
+    def load(function, name):
+        def run(page, conn):
+            with profiler.stage(name), profiler.sampled(name):
+                return function(page, TimedConnection(conn, profiler))
+        return run
+
+    return job._replace(fetch_page=fetch_page, load_page=load(job.load_page, 'load_page'),
+                        load_rows=job.load_rows and load(job.load_rows, 'load_rows'))
+
+
+# Function to turn profiling on for this process, once: output_dir (or PROFILE_DIR) receives the report
+# when the process exits. sample_rate (PROFILE_SAMPLE_RATE) is the share of page fetches and loads
+# profiled in depth, use_cprofile (PROFILE_CPROFILE=1) and trace_memory (PROFILE_MEMORY=1) add cProfile
+# and tracemalloc to those. Returns the profiler, or None when no output directory is set.
+def start(output_dir=None, sample_rate=None, use_cprofile=None, trace_memory=None):
+    global _profiler
+    with _start_lock:
+        if _profiler is not None:
+            return _profiler
+        output_dir = output_dir or os.getenv('PROFILE_DIR')
+        if not output_dir:
+            return None
+        profiler = Profiler(
+            output_dir,
+            sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', 0.02)) if sample_rate is None else sample_rate,
+            use_cprofile=os.getenv('PROFILE_CPROFILE') == '1' if use_cprofile is None else use_cprofile,
+            trace_memory=os.getenv('PROFILE_MEMORY') == '1' if trace_memory is None else trace_memory)
+        profiler.start()
+        atexit.register(finish)
+        _profiler = profiler
+    logging.info(f"Profiling to {output_dir}, {profiler.sample_rate:.0%} of pages in depth.")
+    return profiler
+
+
+# Function to stop profiling and write the report; called at exit
+def finish():
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler:
+        profiler.stop()
+        profiler.write_report()
@@ -0,0 +1,269 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+import mysql.connector
+
+from checkpoint import COMPLETED, FAILED, IN_FLIGHT
+
+DEFAULT_LEASE_TABLE = 'hb_ingest_range_lease'
+
+PENDING = 'pending'
+
+# MySQL errors a claim is retried after: lock wait timeout and deadlock between two claiming workers
+LOCK_ERRNOS = (1205, 1213)
+
+
+# Function to connect to the database holding the lease table, from the DB_* environment variables.
+# Every statement of the lease store stands on its own, so the connection autocommits.
+def connect_from_env():
+    return mysql.connector.connect(
+        host=os.getenv('DB_HOST'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASS'),
+        database=os.getenv('DB_NAME'),
+        autocommit=True
+    )
+
+
+def default_owner():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+# Shared work table of from/to page ranges in MySQL, so any number of worker processes on any number of
+# hosts can crawl one resource together without a coordinator. Every crawl (crawl_id) seeds its ranges
+# once; a worker claims a few pending ranges at a time, which leases them to it for lease_seconds, and
+# keeps the lease alive with a heartbeat while it loads them. A range whose lease ran out (its worker
+# crashed or hung) is claimed again by the next worker that asks, up to max_attempts claims, after
+# which it is marked failed. Lease times come from the database clock, so hosts need not agree on time.
+#
+# It stands in for the CheckpointStore in the pipeline: mark_completed and mark_failed end the lease of
+# a range, and only while this worker still holds it. With checkpoints, the ranges are recorded in that
+# local store too, for progress reporting.
+class RangeLeaseStore:
+    def __init__(self, connect, crawl_id, owner=None, lease_seconds=120, max_attempts=3,
+                 table_name=None, checkpoints=None):
+        self.connect = connect
+        self.crawl_id = crawl_id
+        self.owner = owner or default_owner()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.table_name = table_name or os.getenv('LEASE_TABLE', DEFAULT_LEASE_TABLE)
+        self.checkpoints = checkpoints
+        self.conn = None
+        self.lock = threading.Lock()
+        self.tokens = {}
+        self.stopped = threading.Event()
+        self.heartbeat_thread = None
+
+    # Function to run one statement on the store's connection, reconnecting once if it was dropped.
+    # Returns (rowcount, rows).
+    def _execute(self, query, params=(), many=False):
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.conn is None:
+                        self.conn = self.connect()
+                    cursor = self.conn.cursor()
+                    try:
+                        if many:
+                            cursor.executemany(query, params)
+                        else:
+                            cursor.execute(query, params)
+                        rows = cursor.fetchall() if cursor.with_rows else []
+                        return cursor.rowcount, rows
+                    finally:
+                        cursor.close()
+                except mysql.connector.Error as err:
+                    if attempt or self.conn is None or self.conn.is_connected():
+                        raise
+                    logging.warning(f"Lease store connection lost ({err}), reconnecting.")
+                    self.conn = None
+
+    def create_table(self):
+        self._execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table_name} (
+                crawl_id VARCHAR(64) NOT NULL,
+                resource VARCHAR(64) NOT NULL,
+                from_index INT NOT NULL,
+                to_index INT NOT NULL,
+                status VARCHAR(16) NOT NULL DEFAULT '{PENDING}',
+                owner VARCHAR(128),
+                lease_token CHAR(32),
+                lease_expires_at DATETIME(3),
+                attempts INT NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3),
+                PRIMARY KEY (crawl_id, resource, from_index, to_index),
+                KEY idx_range_lease_claim (crawl_id, resource, status, lease_expires_at),
+                KEY idx_range_lease_token (lease_token)
+            )
+        """)
+
+    # Function to add a crawl's ranges. Every worker seeds the same ranges; the ones already there,
+    # whatever their status, are left alone, so a worker joining late does not reset anything.
+    def seed(self, resource, ranges):
+        rows = [(self.crawl_id, resource, from_index, to_index) for from_index, to_index in ranges]
+        for start in range(0, len(rows), 1000):
+            self._execute(f"""
+                INSERT IGNORE INTO {self.table_name} (crawl_id, resource, from_index, to_index)
+                VALUES (%s, %s, %s, %s)
+            """, rows[start:start + 1000], many=True)
+
+    # Function to lease up to limit ranges to this worker: pending ranges first in index order, then
+    # ranges whose lease expired. Ranges that used up their attempts are marked failed instead.
+    # Returns the claimed (from_index, to_index) ranges.
+    def claim(self, resource, limit):
+        self._execute(f"""
+            UPDATE {self.table_name}
+            SET status = %s, error = 'lease expired too many times', owner = NULL, lease_token = NULL
+            WHERE crawl_id = %s AND resource = %s AND status = %s AND lease_expires_at < NOW(3)
+              AND attempts >= %s
+        """, (FAILED, self.crawl_id, resource, IN_FLIGHT, self.max_attempts))
+
+        token = uuid.uuid4().hex
+        for attempt in range(3):
+            try:
+                self._execute(f"""
+                    UPDATE {self.table_name}
+                    SET status = %s, owner = %s, lease_token = %s,
+                        lease_expires_at = NOW(3) + INTERVAL %s SECOND, attempts = attempts + 1
+                    WHERE crawl_id = %s AND resource = %s
+                      AND (status = %s OR (status = %s AND lease_expires_at < NOW(3)))
+                    ORDER BY status = %s DESC, from_index
+                    LIMIT %s
+                """, (IN_FLIGHT, self.owner, token, self.lease_seconds, self.crawl_id, resource, PENDING,
+                      IN_FLIGHT, PENDING, limit))
+                break
+            except mysql.connector.Error as err:
+                if err.errno not in LOCK_ERRNOS or attempt == 2:
+                    raise
+                logging.warning(f"Claiming {resource} ranges collided with another worker, retrying: {err}")
+                time.sleep(0.1 * (attempt + 1))
+
+        _, rows = self._execute(f"""
+            SELECT from_index, to_index FROM {self.table_name}
+            WHERE lease_token = %s ORDER BY from_index
+        """, (token,))
+        ranges = [(from_index, to_index) for from_index, to_index in rows]
+        for page_range in ranges:
+            self.tokens[(resource,) + page_range] = token
+        return ranges
+
+    # Function to extend the leases this worker holds by another lease_seconds
+    def heartbeat(self):
+        rowcount, _ = self._execute(f"""
+            UPDATE {self.table_name} SET lease_expires_at = NOW(3) + INTERVAL %s SECOND
+            WHERE crawl_id = %s AND owner = %s AND status = %s
+        """, (self.lease_seconds, self.crawl_id, self.owner, IN_FLIGHT))
+        return rowcount
+
+    # Function to end the lease of a range with a final status, if this worker still holds it
+    def _finish(self, resource, from_index, to_index, status, error=None):
+        token = self.tokens.pop((resource, from_index, to_index), None)
+        if token is None:
+            return False
+        # A range given back to the crawl fails for good once it has used up its attempts
+        if status == PENDING:
+            new_status, status_params = "CASE WHEN attempts >= %s THEN %s ELSE %s END", (self.max_attempts, FAILED,
+                                                                                          PENDING)
+        else:
+            new_status, status_params = "%s", (status,)
+        rowcount, _ = self._execute(f"""
+            UPDATE {self.table_name}
+            SET status = {new_status}, error = %s, owner = NULL, lease_token = NULL, lease_expires_at = NULL
+            WHERE crawl_id = %s AND resource = %s AND from_index = %s AND to_index = %s AND lease_token = %s
+        """, status_params + (error, self.crawl_id, resource, from_index, to_index, token))
+        if not rowcount:
+            logging.warning(f"Lease on {resource} records {from_index} to {to_index} was lost before it "
+                            f"was marked {status}; another worker has claimed it again.")
+        return bool(rowcount)
+
+    def mark_in_flight(self, resource, from_index, to_index):
+        if self.checkpoints:
+            self.checkpoints.mark_in_flight(resource, from_index, to_index)
+
+    def mark_completed(self, resource, from_index, to_index):
+        self._finish(resource, from_index, to_index, COMPLETED)
+        if self.checkpoints:
+            self.checkpoints.mark_completed(resource, from_index, to_index)
+
+    # Function to give a range that failed back to the crawl, to be retried by any worker until it has
+    # been claimed max_attempts times
+    def mark_failed(self, resource, from_index, to_index, error=None):
+        self._finish(resource, from_index, to_index, PENDING, error)
+        if self.checkpoints:
+            self.checkpoints.mark_failed(resource, from_index, to_index, error)
+
+    # Function to hand the ranges this worker still holds back to the crawl, when it stops early
+    def release_all(self):
+        for resource, from_index, to_index in list(self.tokens):
+            self._finish(resource, from_index, to_index, PENDING, 'worker stopped')
+
+    # Function to count a crawl's ranges by status (in_flight ones are leased), over all workers
+    def summary(self, resource, since=None):
+        _, rows = self._execute(f"""
+            SELECT status, COUNT(*) FROM {self.table_name} WHERE crawl_id = %s AND resource = %s GROUP BY status
+        """, (self.crawl_id, resource))
+        return {status: count for status, count in rows}
+
+    # Function to count the ranges no worker has finished yet, pending or leased
+    def remaining(self, resource):
+        summary = self.summary(resource)
+        return summary.get(PENDING, 0) + summary.get(IN_FLIGHT, 0)
+
+    def _run_heartbeat(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            try:
+                self.heartbeat()
+            except mysql.connector.Error as err:
+                logging.error(f"Lease heartbeat failed: {err}")
+
+    def start_heartbeat(self):
+        self.stopped.clear()
+        self.heartbeat_thread = threading.Thread(target=self._run_heartbeat, name='lease-heartbeat', daemon=True)
+        self.heartbeat_thread.start()
+
+    def stop_heartbeat(self):
+        self.stopped.set()
+        if self.heartbeat_thread:
+            self.heartbeat_thread.join()
+
+    def close(self):
+        self.stop_heartbeat()
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+# Function to crawl a resource's ranges together with every other worker of the same crawl: seed the
+# ranges, then claim claim_size of them at a time and load them with run_ranges(ranges, leases) until
+# no range is left pending or leased. While other workers still hold leases this one waits, so it can
+# take over their ranges if they stop heartbeating. Returns the crawl's summary.
+def run_leased_ingest(leases, resource, ranges, run_ranges, claim_size=16, poll_interval=None):
+    poll_interval = poll_interval or min(10, leases.lease_seconds / 2)
+    leases.create_table()
+    leases.seed(resource, ranges)
+    leases.start_heartbeat()
+    logging.info(f"Worker {leases.owner} joined crawl {leases.crawl_id} of {resource} ({len(ranges)} ranges).")
+    try:
+        while True:
+            claimed = leases.claim(resource, claim_size)
+            if claimed:
+                logging.info(f"Worker {leases.owner} claimed {len(claimed)} {resource} ranges "
+                             f"({claimed[0][0]} to {claimed[-1][1]}).")
+                run_ranges(claimed, leases)
+                # Ranges the run left without a final status (it stopped early) go back to the crawl
+                leases.release_all()
+                continue
+            if not leases.remaining(resource):
+                break
+            time.sleep(poll_interval)
+    finally:
+        leases.release_all()
+        leases.stop_heartbeat()
+    return leases.summary(resource)
@@ -0,0 +1,102 @@
+import datetime
+import logging
+import os
+import threading
+import time
+
+import requests
+
+
+# Raised by RateLimiter.acquire() once the daily request budget is spent.
+# It is a RequestException so the fetch functions log it and skip the page like any other API failure.
+class DailyQuotaExceeded(requests.exceptions.RequestException):
+    pass
+
+
+# Thread-safe token bucket shared by every request to the API.
+# - rate: requests per second allowed right now; it starts at max_rate, is halved on every 429
+#   (down to min_rate) and creeps back up by recovery_step after each successful response (AIMD).
+# - burst: how many requests may go out back to back after an idle period.
+# - daily_budget: hard cap on requests per UTC day (None for no cap).
+# Quota headers (X-RateLimit-Remaining / X-RateLimit-Reset style) lower the rate so the remaining
+# quota is spread over the reset window, and a 429 with Retry-After pauses all callers until then.
+class RateLimiter:
+    def __init__(self, max_rate=5.0, burst=5, daily_budget=None, min_rate=0.2, recovery_step=0.05):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.burst = burst
+        self.daily_budget = daily_budget
+        self.recovery_step = recovery_step
+
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0
+        self.quota_rate = None
+        self.day = datetime.datetime.now(datetime.timezone.utc).date()
+        self.used_today = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        daily_budget = os.getenv('HOTELBEDS_DAILY_QUOTA')
+        return cls(
+            max_rate=float(os.getenv('HOTELBEDS_RATE_LIMIT', 5.0)),
+            burst=int(os.getenv('HOTELBEDS_RATE_BURST', 5)),
+            daily_budget=int(daily_budget) if daily_budget else None
+        )
+
+    def _refill(self, now):
+        rate = self.rate if self.quota_rate is None else min(self.rate, self.quota_rate)
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * rate)
+        self.last_refill = now
+        return rate
+
+    def _roll_day(self):
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        if today != self.day:
+            self.day = today
+            self.used_today = 0
+
+    # Function to block until a request may be sent; raises DailyQuotaExceeded when the budget is spent
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._roll_day()
+                if self.daily_budget is not None and self.used_today >= self.daily_budget:
+                    raise DailyQuotaExceeded(f"Daily request budget of {self.daily_budget} exhausted")
+
+                now = time.monotonic()
+                rate = self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.used_today += 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / rate)
+            time.sleep(wait)
+
+    # Function to adapt the rate to an API response
+    def observe(self, response, retry_after=None):
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if response.status_code == 429:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.tokens = 0.0
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                logging.warning(f"API rate limit hit, throttling to {self.rate:.2f} requests/s")
+            elif response.ok:
+                self.rate = min(self.max_rate, self.rate + self.recovery_step)
+
+            remaining = response.headers.get('X-RateLimit-Remaining')
+            reset = response.headers.get('X-RateLimit-Reset')
+            if remaining is not None and reset is not None:
+                try:
+                    remaining, reset = float(remaining), float(reset)
+                except ValueError:
+                    return
+                # Reset may be an epoch timestamp or a number of seconds until the window resets
+                if reset > 10 ** 9:
+                    reset -= time.time()
+                self.quota_rate = max(self.min_rate, remaining / reset) if reset > 0 else None
@@ -0,0 +1,180 @@
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+import mysql.connector
+
+from archive import iter_archive_pages
+
+# One loaded snapshot of the reference tables:
+#   facilities  {(facility_group_code, facility_code): (facility_typology_code, description)}
+#   groups      {facility_group_code: description}
+#   typologies  frozenset of the facility typology codes the facilities use
+ReferenceData = collections.namedtuple('ReferenceData', ['facilities', 'groups', 'typologies'])
+
+FACILITY_PAGE_PREFIX = 'facility_data_'
+FACILITY_GROUP_PAGE_PREFIX = 'facility_group_data_'
+
+REFERENCE_CHECK_MODES = ('off', 'warn', 'reject')
+
+
+# Codes come back as ints from the API and from INT columns, but may be strings in older tables
+def _code(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _reference_data(facility_rows, group_rows):
+    facilities = {(_code(group_code), _code(code)): (_code(typology_code), description)
+                  for code, group_code, typology_code, description in facility_rows}
+    groups = {_code(group_code): description for group_code, description in group_rows}
+    typologies = frozenset(typology for typology, _ in facilities.values() if typology is not None)
+    return ReferenceData(facilities, groups, typologies)
+
+
+# Function to load the reference tables written by facilities.py and facilities_group.py
+def load_from_mysql():
+    conn = mysql.connector.connect(
+        host=os.getenv('DB_HOST'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASS'),
+        database=os.getenv('DB_NAME')
+    )
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT code, facilityGroupCode, facilityTypologyCode, description FROM hb_facilities_data")
+        facility_rows = cursor.fetchall()
+        cursor.execute("SELECT facilityGroupCode, description FROM hb_facilities_group")
+        group_rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    return _reference_data(facility_rows, group_rows)
+
+
+# Function to load the reference data from the archived types/facilities and types/facilitygroups pages
+def load_from_archive(archive_dir):
+    facility_rows = []
+    group_rows = []
+    for name, body in iter_archive_pages(archive_dir):
+        page_name = os.path.basename(name)
+        if page_name.startswith(FACILITY_PAGE_PREFIX):
+            for facility in json.loads(body).get('facilities', []):
+                facility_rows.append((facility.get('code'), facility.get('facilityGroupCode'),
+                                      facility.get('facilityTypologyCode'),
+                                      (facility.get('description') or {}).get('content')))
+        elif page_name.startswith(FACILITY_GROUP_PAGE_PREFIX):
+            for group in json.loads(body).get('facilityGroups', []):
+                group_rows.append((group.get('code'), (group.get('description') or {}).get('content')))
+    return _reference_data(facility_rows, group_rows)
+
+
+# Function to list the (facility_group_code, facility_code) pairs a hotel refers to, from its own
+# facilities and those of its rooms and room stays
+def hotel_facility_codes(hotel):
+    for facility in hotel.get('facilities') or []:
+        yield facility.get('facilityGroupCode'), facility.get('facilityCode')
+    for room in hotel.get('rooms') or []:
+        for feature in room.get('roomFacilities') or []:
+            yield feature.get('facilityGroupCode'), feature.get('facilityCode')
+        for stay in room.get('roomStays') or []:
+            for stay_facility in stay.get('roomStayFacilities') or []:
+                yield stay_facility.get('facilityGroupCode'), stay_facility.get('facilityCode')
+
+
+# In-memory facility, facility group and typology lookups for the hotel loader. load() returns a
+# ReferenceData snapshot; it is called on first use and again once the snapshot is older than ttl
+# seconds. Lookups never query the database. A failed refresh keeps serving the previous snapshot.
+# on_unknown says what the loader does with a hotel that uses codes the reference data lacks:
+# 'warn' loads it anyway and logs the codes, 'reject' dead-letters it.
+class ReferenceCache:
+    def __init__(self, load, ttl=3600, on_unknown='warn'):
+        self.load = load
+        self.ttl = ttl
+        self.on_unknown = on_unknown
+        self.data = None
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        mode = os.getenv('REFERENCE_CHECK', 'off')
+        if mode not in REFERENCE_CHECK_MODES:
+            raise ValueError(f"Unknown REFERENCE_CHECK: {mode}")
+        if mode == 'off':
+            return None
+        archive_dir = os.getenv('REFERENCE_ARCHIVE_DIR')
+        load = (lambda: load_from_archive(archive_dir)) if archive_dir else load_from_mysql
+        return cls(load, ttl=float(os.getenv('REFERENCE_TTL', 3600)), on_unknown=mode)
+
+    def refresh(self, force=False):
+        with self.lock:
+            if not force and self.data is not None and time.monotonic() - self.loaded_at < self.ttl:
+                return self.data
+            try:
+                data = self.load()
+            except (mysql.connector.Error, OSError, ValueError) as e:
+                if self.data is None:
+                    raise
+                logging.error(f"Reference data refresh failed, keeping the previous snapshot: {e}")
+                data = self.data
+            else:
+                logging.info(f"Reference data loaded: {len(data.facilities)} facilities, "
+                             f"{len(data.groups)} facility groups, {len(data.typologies)} typologies.")
+                if not data.facilities:
+                    logging.warning("Reference data has no facilities; facility codes are not checked.")
+            self.data = data
+            self.loaded_at = time.monotonic()
+            return data
+
+    def current(self):
+        data = self.data
+        if data is None or time.monotonic() - self.loaded_at >= self.ttl:
+            data = self.refresh()
+        return data
+
+    # Function to decode a facility: (facility_typology_code, description), or None if unknown
+    def facility(self, group_code, code):
+        return self.current().facilities.get((_code(group_code), _code(code)))
+
+    def facility_group(self, group_code):
+        return self.current().groups.get(_code(group_code))
+
+    def is_known_facility(self, group_code, code):
+        return (_code(group_code), _code(code)) in self.current().facilities
+
+    def is_known_typology(self, typology_code):
+        return _code(typology_code) in self.current().typologies
+
+    # Function to list the distinct (facility_group_code, facility_code) pairs a hotel uses that are
+    # not in the reference data; empty when nothing has been loaded into the reference tables
+    def unknown_facilities(self, hotel):
+        facilities = self.current().facilities
+        if not facilities:
+            return []
+        unknown = {}
+        for group_code, code in hotel_facility_codes(hotel):
+            key = (_code(group_code), _code(code))
+            if key not in facilities:
+                unknown[key] = None
+        return list(unknown)
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+# Function to get the process-wide reference cache configured by REFERENCE_CHECK (off | warn | reject),
+# REFERENCE_ARCHIVE_DIR (load from archived pages instead of MySQL) and REFERENCE_TTL (seconds).
+# Returns None when reference checks are off.
+def get_shared_reference_cache():
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ReferenceCache.from_env() or False
+        return _shared_cache or None
@@ -0,0 +1,205 @@
+import argparse
+import collections
+import concurrent.futures
+import importlib
+import json
+import logging
+import os
+import time
+
+import parquet_export
+from archive import list_archive_sources, read_archive_pages
+
+# How each script's archived pages are found and loaded: the module with the loader, the loader
+# function (and its --upsert variant), the page name prefixes it wrote, the key of the record list and
+# optionally the module function that prepares its tables before the first page, prepare(upsert) -> bool
+# (the same one ingest.py runs)
+ReplayResource = collections.namedtuple(
+    'ReplayResource', ['module', 'loader', 'upsert_loader', 'name_prefixes', 'records_key', 'prepare'],
+    defaults=(None,))
+
+RESOURCES = {
+    'hotels': ReplayResource('main', 'insert_data_into_mysql_batched', 'upsert_hotels_into_mysql',
+                             ('hotel_data_', 'hotel_delta_'), 'hotels', 'prepare_ingest'),
+    'hotels_document': ReplayResource('main_new', 'insert_data_into_mysql', 'upsert_hotels_into_mysql',
+                                      ('hotel_data_', 'hotel_delta_'), 'hotels', 'prepare_document_ingest'),
+    'hotels_lean': ReplayResource('main_new', 'insert_documents_into_mysql', 'upsert_documents_into_mysql',
+                                  ('hotel_data_', 'hotel_delta_'), 'hotels', 'prepare_lean_ingest'),
+    'facilities': ReplayResource('facilities', 'insert_data_into_mysql', None,
+                                 ('facility_data_',), 'facilities'),
+    'facility_groups': ReplayResource('facilities_group', 'insert_data_into_mysql', None,
+                                      ('facility_group_data_',), 'facilityGroups'),
+}
+
+# Parsed pages allowed in flight per worker process, so reading never runs far ahead of loading
+TASKS_PER_WORKER = 4
+
+# Pages between throughput log lines
+REPORT_EVERY = 50
+
+
+def page_matches(name, resource):
+    return os.path.basename(name).startswith(resource.name_prefixes)
+
+
+# Function to turn the archive into parse tasks. File and segment entries are read by the worker
+# itself, so disk reads are parallel too; JSON Lines archives are read here line by line and only
+# the raw page text is shipped to the workers.
+def iter_parse_tasks(archive_dir, resource):
+    for source in list_archive_sources(archive_dir):
+        if source[0] == 'jsonl':
+            for name, body in read_archive_pages(source):
+                if page_matches(name, resource):
+                    yield ('body', name, body)
+        elif page_matches(source[-1], resource):
+            yield ('source', source)
+
+
+# Worker process: read (if needed) and parse one page. Returns (name, data), with data None if the page
+# could not be read or is not valid JSON (say a page cut short by a crash), so one bad page does not
+# stop the replay.
+def parse_task(task):
+    name = task[1] if task[0] == 'body' else task[1][-1]
+    try:
+        if task[0] == 'source':
+            name, body = next(read_archive_pages(task[1]))
+        else:
+            _, name, body = task
+        return name, json.loads(body)
+    except (OSError, ValueError, StopIteration) as err:
+        logging.error(f"Page {name} could not be parsed: {type(err).__name__}: {err}")
+        return name, None
+
+
+# Worker process: read and parse one page and convert it to the Arrow tables of the Parquet export.
+# Returns (name, tables, hotels), with tables None if the page could not be parsed or converted.
+def export_task(task):
+    name, data = parse_task(task)
+    if data is None:
+        return name, None, 0
+    try:
+        tables, hotels = parquet_export.page_tables(data)
+    except (parquet_export.pyarrow.ArrowInvalid, parquet_export.pyarrow.ArrowTypeError) as err:
+        logging.error(f"Page {name} could not be converted for the Parquet export: {err}")
+        return name, None, 0
+    return name, tables, hotels
+
+
+# Function to run function (parse_task by default) over the tasks on a process pool, yielding its
+# results in archive order while keeping at most workers * TASKS_PER_WORKER pages queued
+def parse_pages_in_parallel(tasks, workers, function=parse_task):
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(executor.submit(function, task))
+            if len(pending) >= workers * TASKS_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# Function to rebuild a resource's MySQL tables from the archive without touching the API. The tables
+# the loader needs besides the schema (content hashes for --upsert, the dead letter table) are created
+# first, so a fresh database can be rebuilt.
+def replay(resource_name, archive_dir, workers, upsert=False):
+    resource = RESOURCES[resource_name]
+    module = importlib.import_module(resource.module)
+    if upsert and not resource.upsert_loader:
+        raise ValueError(f"--upsert is not supported for {resource_name}")
+    loader = getattr(module, resource.upsert_loader if upsert else resource.loader)
+    if resource.prepare and not getattr(module, resource.prepare)(upsert):
+        return
+
+    conn = module.connect_to_mysql()
+    if not conn:
+        return
+
+    started = time.monotonic()
+    pages = records = failed = 0
+    try:
+        for name, data in parse_pages_in_parallel(iter_parse_tasks(archive_dir, resource), workers):
+            if data is None:
+                failed += 1
+                logging.error(f"Replay skipped page {name}, which could not be parsed")
+            elif loader(data, conn):
+                pages += 1
+                records += len(data.get(resource.records_key, []))
+            else:
+                failed += 1
+                logging.error(f"Replay failed to load page {name}")
+
+            if (pages + failed) % REPORT_EVERY == 0:
+                elapsed = time.monotonic() - started
+                logging.info(f"Replay {resource_name}: {pages} pages, {records} records, {failed} failed, "
+                             f"{pages / elapsed:.1f} pages/s, {records / elapsed:.1f} records/s")
+    finally:
+        conn.close()
+
+    elapsed = time.monotonic() - started
+    summary = (f"Replay {resource_name} finished: {pages} pages, {records} records, {failed} failed in "
+               f"{elapsed:.1f}s ({records / max(elapsed, 1e-9):.1f} records/s)")
+    logging.info(summary)
+    print(summary)
+
+
+# Function to export a resource's archived hotel pages to Parquet under parquet_dir instead of loading
+# them into MySQL. Pages are parsed, flattened and converted on the worker processes; this process only
+# buffers and writes the files.
+def export_archive(resource_name, archive_dir, workers, parquet_dir):
+    resource = RESOURCES[resource_name]
+    if resource.records_key != 'hotels':
+        raise ValueError(f"--parquet is not supported for {resource_name}")
+    exporter = parquet_export.ParquetExporter.from_env(parquet_dir)
+
+    started = time.monotonic()
+    pages = records = failed = 0
+    try:
+        for name, tables, hotels in parse_pages_in_parallel(iter_parse_tasks(archive_dir, resource), workers,
+                                                            export_task):
+            if tables is None:
+                failed += 1
+            else:
+                exporter.add_tables(tables, hotels)
+                pages += 1
+                records += hotels
+
+            if (pages + failed) % REPORT_EVERY == 0:
+                elapsed = time.monotonic() - started
+                logging.info(f"Export {resource_name}: {pages} pages, {records} records, {failed} failed, "
+                             f"{pages / elapsed:.1f} pages/s, {records / elapsed:.1f} records/s")
+    finally:
+        exporter.close()
+
+    elapsed = time.monotonic() - started
+    summary = (f"Export {resource_name} finished: {pages} pages, {records} records, {failed} failed in "
+               f"{elapsed:.1f}s ({records / max(elapsed, 1e-9):.1f} records/s) to {parquet_dir}")
+    logging.info(summary)
+    print(summary)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Rebuild MySQL tables, or a Parquet export, from archived API pages.')
+    parser.add_argument('resource', choices=sorted(RESOURCES))
+    parser.add_argument('--archive-dir', default='.', help='Directory holding the archived pages')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Parser processes')
+    parser.add_argument('--upsert', action='store_true',
+                        help='Skip unchanged hotels and replace changed ones (hotel resources only)')
+    parser.add_argument('--parquet', metavar='DIR',
+                        help='Export the pages to Parquet under DIR (partitioned by country_code/destination_code) '
+                             'instead of loading them into MySQL (hotel resources only, needs pyarrow)')
+    args = parser.parse_args()
+    if args.parquet and args.upsert:
+        parser.error('--upsert does not apply to --parquet')
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.parquet:
+        export_archive(args.resource, args.archive_dir, args.workers, args.parquet)
+    else:
+        replay(args.resource, args.archive_dir, args.workers, args.upsert)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import io
+import json
+import os
+
+import pytest
+
+import archive
+import hotelbeds_client
+import main
+import pipeline
+from benchmarks import mock_api
+
+
+def write_pages(directory, compression, pages, flush_pages):
+    sink = archive.JsonLinesArchive(str(directory), compression, flush_pages=flush_pages)
+    for i in range(pages):
+        sink.write_stream(f'hotel_data_{i}', io.BytesIO(json.dumps({'hotels': [{'code': i}]}).encode()))
+    return sink
+
+
+# What a run that died leaves behind: the archive as flushed so far, never closed
+def crashed_archive(directory, compression, pages, flush_pages):
+    sink = write_pages(directory, compression, pages, flush_pages)
+    with open(sink.path, 'rb') as file:
+        data = file.read()
+    sink.close()
+    with open(sink.path, 'wb') as file:
+        file.write(data)
+    return sink.path
+
+
+def read_names(directory):
+    return [name for name, body in archive.iter_archive_pages(str(directory))]
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+def test_archive_of_a_crashed_run_is_read_up_to_its_last_flush(tmp_path, compression):
+    if compression == 'zstd' and archive.zstandard is None:
+        pytest.skip('zstandard is not installed')
+    crashed_archive(tmp_path, compression, pages=25, flush_pages=10)
+    names = read_names(tmp_path)
+    assert names[:20] == [f'hotel_data_{i}' for i in range(20)]
+    assert len(names) < 25
+
+
+def test_partly_written_last_page_is_skipped(tmp_path, caplog):
+    sink = write_pages(tmp_path, 'none', pages=3, flush_pages=0)
+    sink.close()
+    with open(sink.path, 'rb+') as file:
+        file.truncate(os.path.getsize(sink.path) - 5)
+    assert read_names(tmp_path) == ['hotel_data_0', 'hotel_data_1']
+    assert 'partly written page' in caplog.text
+
+
+def test_closed_archive_reads_every_page(tmp_path):
+    write_pages(tmp_path, 'gzip', pages=25, flush_pages=10).close()
+    assert read_names(tmp_path) == [f'hotel_data_{i}' for i in range(25)]
+
+
+@pytest.fixture
+def streaming(tmp_path, monkeypatch):
+    server = mock_api.start_mock_api(shape=mock_api.HotelShape(rooms=1, images=1), total_hotels=100)
+    client = hotelbeds_client.HotelbedsClient('key', 'secret', base_url=server.base_url)
+    monkeypatch.setattr(pipeline, 'get_shared_client', lambda: client)
+    monkeypatch.setattr(pipeline, 'get_shared_archive', lambda: archive.FileArchive(str(tmp_path)))
+    monkeypatch.setattr(pipeline, 'STREAM_CHUNK_SIZE', 10)
+    yield tmp_path
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_streamed_page_is_archived_once_read_to_the_end(streaming):
+    job = main.FULL_INGEST_JOB._replace(load_page=lambda data, conn: True, export_page=None)
+    assert pipeline.stream_page_into_mysql(1, 50, None, job)
+    with open(streaming / 'hotel_data_1_50.json', 'rb') as file:
+        assert len(json.load(file)['hotels']) == 50
+
+
+def test_page_whose_load_failed_part_way_is_not_archived(streaming):
+    job = main.FULL_INGEST_JOB._replace(load_page=lambda data, conn: False, export_page=None)
+    assert not pipeline.stream_page_into_mysql(1, 50, None, job)
+    assert read_names(streaming) == []
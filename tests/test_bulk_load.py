@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+import bulk_load
+from benchmarks import mock_api
+
+
+# Connection that keeps the statements it was sent; every SELECT answers 1 (the next room/stay id)
+class RecordingConnection:
+    def __init__(self):
+        self.statements = []
+        self.committed = False
+
+    def cursor(self):
+        return RecordingCursor(self.statements)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+
+class RecordingCursor:
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, query, params=None):
+        self.statements.append(' '.join(query.split()))
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def dead_letters(monkeypatch):
+    dead_letters = []
+    monkeypatch.setattr(bulk_load, 'write_dead_letters', dead_letters.extend)
+    return dead_letters
+
+
+def page(*codes):
+    return mock_api.synthetic_page('hotels', min(codes), max(codes), mock_api.HotelShape(rooms=1, images=1), 100, 1)
+
+
+def test_hotel_that_cannot_be_flattened_is_dead_lettered(tmp_path, dead_letters):
+    bad_page = page(1, 2, 3)
+    del bad_page['hotels'][1]['name']
+    conn = RecordingConnection()
+
+    row_counts = bulk_load.bulk_load([page(4, 5), bad_page], conn, str(tmp_path / 'staging'))
+
+    assert row_counts['hb_hotel_info'] == 4
+    assert [entry['code'] for entry in dead_letters] == [2]
+    assert conn.committed
+
+
+def test_deferred_constraints_do_not_alter_the_tables(tmp_path, dead_letters):
+    conn = RecordingConnection()
+    bulk_load.bulk_load([page(1, 2)], conn, str(tmp_path / 'staging'), defer_constraints=True)
+    assert 'SET SESSION foreign_key_checks = 0' in conn.statements
+    assert not [statement for statement in conn.statements if statement.startswith('ALTER')]
+
+
+def test_archived_page_that_cannot_be_parsed_is_skipped(tmp_path):
+    (tmp_path / 'hotel_data_1_2.json').write_text(json.dumps(page(1, 2)))
+    (tmp_path / 'hotel_data_3_4.json').write_text(json.dumps(page(3, 4))[:300])
+    assert [len(data['hotels']) for data in bulk_load.iter_archived_hotel_pages(str(tmp_path))] == [2]
@@ -0,0 +1,114 @@
+import email.utils
+import itertools
+import time
+
+import pytest
+import requests
+
+import hotelbeds_client
+from benchmarks import mock_api
+
+
+@pytest.fixture(scope='module')
+def mock_server():
+    server = mock_api.start_mock_api(total_hotels=20)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def server(mock_server):
+    mock_server.scripted.clear()
+    mock_server.signatures.clear()
+    return mock_server
+
+
+# Backoff sleeps are recorded instead of slept, and the jitter always picks the longest delay
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(hotelbeds_client.time, 'sleep', sleeps.append)
+    monkeypatch.setattr(hotelbeds_client.random, 'uniform', lambda low, high: high)
+    return sleeps
+
+
+# Every signature is different, so re-signing shows in the requests the server received
+@pytest.fixture(autouse=True)
+def numbered_signatures(monkeypatch):
+    numbers = itertools.count(1)
+    monkeypatch.setattr(hotelbeds_client, 'generate_api_signature', lambda api_key, secret: f'sig-{next(numbers)}')
+
+
+def client(server, **kwargs):
+    return hotelbeds_client.HotelbedsClient('key', 'secret', base_url=server.base_url, **kwargs)
+
+
+def get_hotels(client):
+    return client.get('hotels', {'from': 1, 'to': 10})
+
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503, 504])
+def test_retryable_status_is_retried(server, sleeps, status):
+    server.script(status, status)
+    response = get_hotels(client(server, backoff_base=1.0))
+    assert response.status_code == 200
+    assert len(response.json()['hotels']) == 10
+    assert sleeps == [1.0, 2.0]
+
+
+def test_other_errors_are_not_retried(server, sleeps):
+    server.script(400)
+    with pytest.raises(requests.exceptions.HTTPError):
+        get_hotels(client(server))
+    assert sleeps == [] and len(server.signatures) == 1
+
+
+def test_error_is_raised_once_retries_run_out(server, sleeps):
+    server.script(*[503] * 4)
+    with pytest.raises(requests.exceptions.HTTPError):
+        get_hotels(client(server, max_retries=3))
+    assert len(sleeps) == 3 and len(server.signatures) == 4
+
+
+def test_backoff_is_capped(server, sleeps):
+    server.script(*[500] * 6)
+    get_hotels(client(server, max_retries=6, backoff_base=1.0, backoff_max=5.0))
+    assert sleeps == [1.0, 2.0, 4.0, 5.0, 5.0, 5.0]
+
+
+def test_retry_after_outweighs_a_shorter_backoff(server, sleeps):
+    server.script((429, {'Retry-After': '7'}), (503, {'Retry-After': '0'}))
+    get_hotels(client(server, backoff_base=0.5))
+    assert sleeps == [7.0, 1.0]
+
+
+@pytest.mark.parametrize('status', [401, 403])
+def test_auth_failure_is_re_signed_once(server, sleeps, status):
+    server.script(status)
+    assert get_hotels(client(server)).status_code == 200
+    assert list(server.signatures) == ['sig-1', 'sig-2']
+    assert sleeps == []
+
+    server.script(status, status)
+    with pytest.raises(requests.exceptions.HTTPError):
+        get_hotels(client(server))
+    assert list(server.signatures)[2:] == ['sig-3', 'sig-4']
+
+
+def test_parse_retry_after_seconds():
+    assert hotelbeds_client.parse_retry_after('120') == 120.0
+    assert hotelbeds_client.parse_retry_after('1.5') == 1.5
+    assert hotelbeds_client.parse_retry_after('-3') == 0.0
+
+
+def test_parse_retry_after_http_date():
+    in_a_minute = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 58 <= hotelbeds_client.parse_retry_after(in_a_minute) <= 60
+    a_minute_ago = email.utils.formatdate(time.time() - 60, usegmt=True)
+    assert hotelbeds_client.parse_retry_after(a_minute_ago) == 0.0
+
+
+@pytest.mark.parametrize('value', [None, '', 'soon'])
+def test_parse_retry_after_without_a_delay(value):
+    assert hotelbeds_client.parse_retry_after(value) is None
@@ -0,0 +1,30 @@
+import checkpoint
+import main
+import pipeline
+
+
+def test_first_page_is_fetched_once_and_archived(tmp_path, monkeypatch):
+    fetches = []
+
+    def fetch_hotel_data(from_index, to_index, last_update_time=None, archive_name=None):
+        fetches.append((from_index, to_index, archive_name))
+        return {'total': 25, 'hotels': [{'code': from_index}]}
+
+    # Fetches and "loads" every range one after the other, as the sequential ingest does
+    def run_ingest(page_ranges, checkpoints, job, settings):
+        for from_index, to_index in page_ranges:
+            assert job.fetch_page(from_index, to_index, archive_name=f'{job.file_prefix}_{from_index}_{to_index}')
+            checkpoints.mark_completed(job.resource, from_index, to_index)
+
+    monkeypatch.setattr(main, 'fetch_hotel_data', fetch_hotel_data)
+    monkeypatch.setattr(main, 'run_ingest', run_ingest)
+    checkpoints = checkpoint.CheckpointStore(str(tmp_path / 'checkpoints.db'))
+    settings = pipeline.PipelineSettings(0, 1, 8, 0)
+
+    main.run_incremental_sync('2026-01-01', 10, checkpoints, settings)
+
+    assert fetches == [(1, 10, 'hotel_delta_2026-01-01_1_10'),
+                       (11, 20, 'hotel_delta_2026-01-01_11_20'),
+                       (21, 30, 'hotel_delta_2026-01-01_21_30')]
+    assert checkpoints.get_high_water_mark(main.DELTA_CHECKPOINT_RESOURCE)
+    checkpoints.close()
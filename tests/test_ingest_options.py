@@ -0,0 +1,27 @@
+import pytest
+
+import ingest
+
+
+@pytest.mark.parametrize('options, key', [
+    (['--upsert'], 'upsert'),
+    (['--incremental'], 'incremental'),
+    (['--export-parquet', 'export'], 'export_parquet'),
+])
+def test_hotel_options_apply_to_hotels_only(options, key):
+    args = ingest.parse_args(['facility_groups', 'facilities', 'hotels'] + options)
+    assert ingest._resource_option(args, 'hotels', key)
+    assert not ingest._resource_option(args, 'facilities', key)
+    assert not ingest._resource_option(args, 'facility_groups', key)
+
+
+@pytest.mark.parametrize('argv', [
+    ['facilities', '--upsert'],
+    ['facility_groups', 'facilities', '--export-parquet', 'export'],
+    ['hotels', '--incremental', '--distributed', 'crawl-1'],
+    ['hotels', '--adaptive', '--incremental'],
+    ['hotels', '--export-parquet', 'export', '--upsert'],
+])
+def test_invalid_options_are_rejected_up_front(argv):
+    with pytest.raises(SystemExit):
+        ingest.parse_args(argv)
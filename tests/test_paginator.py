@@ -0,0 +1,62 @@
+import queue
+
+import pytest
+
+from paginator import AdaptivePaginator, last_requested_index, merge_ranges
+from pipeline import page_ranges
+
+
+def test_last_requested_index_matches_page_ranges():
+    for start, end, batch_size, inclusive_end in ((21401, 25000, 100, False), (1, 1000, 7, False),
+                                                  (1, 100, 10, True), (1, 95, 10, True), (5, 6, 100, False)):
+        assert last_requested_index(start, end, batch_size, inclusive_end) == \
+            page_ranges(start, end, batch_size, inclusive_end)[-1][1]
+
+
+def test_final_window_is_clamped_after_the_size_grows():
+    paginator = AdaptivePaginator(21401, 25000, 100, target_seconds=10, growth=2)
+    windows = [paginator.get_nowait()]
+    # Fast pages: the size grows well past the starting 100
+    paginator.observe(100, 0.01, 1000)
+    while True:
+        try:
+            windows.append(paginator.get_nowait())
+        except queue.Empty:
+            break
+        paginator.observe(windows[-1][1] - windows[-1][0] + 1, 0.01, 1000)
+    assert paginator.page_size > 100
+    assert windows[-1][1] == 25000
+    assert merge_ranges(windows) == [(21401, 25000)]
+
+
+def test_final_window_stops_at_the_fixed_split_bound():
+    paginator = AdaptivePaginator(21401, 25000, 400, last_index=25000)
+    windows = list(paginator)
+    assert windows[-1] == (24601, 25000)
+    assert merge_ranges(windows) == [(21401, 25000)]
+
+
+def test_inclusive_end_and_skipped_ranges():
+    paginator = AdaptivePaginator(1, 100, 10, inclusive_end=True, min_size=5, skip=[(21, 40), (41, 50), (95, 99)])
+    windows = list(paginator)
+    assert windows[-1] == (100, 100)
+    assert merge_ranges(windows) == [(1, 20), (51, 94), (100, 100)]
+
+
+def test_failed_page_halves_the_size():
+    paginator = AdaptivePaginator(1, 1000, 100, min_size=10)
+    paginator.observe(failed=True)
+    assert paginator.page_size == 50
+    assert paginator.get_nowait() == (1, 50)
+
+
+def test_estimated_ranges_counts_only_what_is_left():
+    paginator = AdaptivePaginator(1, 1001, 100, skip=[(1, 300)])
+    assert paginator.estimated_ranges() == 7
+
+
+@pytest.mark.parametrize('seconds_per_record, expected', [(1.0, 10), (0.001, 150)])
+def test_size_follows_the_target_time(seconds_per_record, expected):
+    paginator = AdaptivePaginator(1, 100000, 100, min_size=10, target_seconds=10)
+    paginator.observe(100, 100 * seconds_per_record, None)
+    assert paginator.page_size == expected
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+import pipeline
+from benchmarks import mock_api
+from dead_letter import note_page_dead_letters
+
+pyarrow = pytest.importorskip('pyarrow')
+import pyarrow.dataset  # noqa: E402
+
+import parquet_export  # noqa: E402
+
+
+def hotels(*codes):
+    rng = random.Random(1)
+    return [mock_api.synthetic_hotel(code, mock_api.HotelShape(rooms=1, images=1, room_stays=1), rng)
+            for code in codes]
+
+
+def read_table(directory, table_name):
+    return pyarrow.dataset.dataset(f'{directory}/{table_name}', format='parquet', partitioning='hive').to_table()
+
+
+def test_code_columns_of_mixed_types_are_stringified(tmp_path):
+    exporter = parquet_export.ParquetExporter(str(tmp_path))
+    text_codes, int_codes = hotels(1), hotels(2)
+    int_codes[0]['rooms'][0]['roomStays'][0]['order'] = 1
+    int_codes[0]['rooms'][0]['roomCode'] = 101
+    int_codes[0]['images'][0]['imageTypeCode'] = 7
+    assert exporter.write_page({'hotels': text_codes})
+    assert exporter.write_page({'hotels': int_codes})
+    exporter.close()
+
+    stays = read_table(tmp_path, 'hb_room_stays')
+    assert sorted(stays.column('stay_order').to_pylist()) == ['1', '1']
+    assert '101' in stays.column('room_code').to_pylist()
+    assert pyarrow.types.is_dictionary(stays.schema.field('room_code').type)
+    assert '7' in read_table(tmp_path, 'hb_images').column('image_type_code').to_pylist()
+
+
+def test_hotel_without_country_goes_to_the_default_partition(tmp_path):
+    page = hotels(1, 2)
+    del page[1]['countryCode'], page[1]['coordinates']
+    exporter = parquet_export.ParquetExporter(str(tmp_path))
+    exporter.write_page({'hotels': page})
+    exporter.close()
+    table = read_table(tmp_path, 'hb_hotel_info')
+    assert dict(zip(table.column('hotel_code').to_pylist(), table.column('country_code').to_pylist()))[2] is None
+
+
+def test_dead_lettered_hotels_are_not_exported():
+    exported = []
+    job = pipeline.IngestJob('hotels', None, None, 'hotel_data', records_key='hotels',
+                             export_page=lambda data: exported.append(data) or True)
+    page = {'hotels': hotels(1, 2, 3)}
+    # What insert_data_into_mysql_batched notes after dead-lettering hotel 2
+    note_page_dead_letters([{'code': 2}])
+    pipeline.record_page_loaded(job, page, True)
+    assert [hotel['code'] for hotel in exported[0]['hotels']] == [1, 3]
+
+    # The codes are for that page only
+    pipeline.record_page_loaded(job, page, True)
+    assert [hotel['code'] for hotel in exported[1]['hotels']] == [1, 2, 3]
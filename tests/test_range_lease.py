@@ -0,0 +1,175 @@
+import functools
+import multiprocessing
+import os
+import time
+import uuid
+
+import pytest
+
+from benchmarks import stand_in_lease_db
+from checkpoint import COMPLETED, FAILED, IN_FLIGHT
+from range_lease import PENDING, RangeLeaseStore, connect_from_env, run_leased_ingest
+
+RANGES = [(from_index, from_index + 9) for from_index in range(1, 101, 10)]
+
+
+# Database clock the tests move forward to expire leases
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    stores = []
+    connect = functools.partial(stand_in_lease_db.connect, str(tmp_path / 'leases.sqlite3'), clock)
+
+    def store(owner, lease_seconds=60, max_attempts=3):
+        leases = RangeLeaseStore(connect, 'crawl-1', owner, lease_seconds, max_attempts)
+        leases.create_table()
+        stores.append(leases)
+        return leases
+
+    yield store
+    for leases in stores:
+        leases.close()
+
+
+def test_claim_leases_pending_ranges_in_order(store):
+    first, second = store('first'), store('second')
+    first.seed('hotels', RANGES)
+    second.seed('hotels', RANGES)
+
+    assert first.claim('hotels', 3) == RANGES[:3]
+    assert second.claim('hotels', 3) == RANGES[3:6]
+    assert first.summary('hotels') == {IN_FLIGHT: 6, PENDING: 4}
+
+    first.mark_completed('hotels', *RANGES[0])
+    assert first.summary('hotels') == {COMPLETED: 1, IN_FLIGHT: 5, PENDING: 4}
+    assert first.remaining('hotels') == 9
+
+
+def test_expired_lease_is_claimed_again(store, clock):
+    crashed, survivor = store('crashed', lease_seconds=30), store('survivor')
+    crashed.seed('hotels', RANGES[:2])
+    assert crashed.claim('hotels', 2) == RANGES[:2]
+
+    clock.now += 10
+    crashed.heartbeat()
+    clock.now += 29
+    assert survivor.claim('hotels', 2) == []
+
+    clock.now += 2
+    assert survivor.claim('hotels', 2) == RANGES[:2]
+
+
+def test_stale_token_does_not_finish_a_range_claimed_again(store, clock):
+    stale, current = store('stale', lease_seconds=30), store('current')
+    stale.seed('hotels', RANGES[:1])
+    stale.claim('hotels', 1)
+    clock.now += 31
+    assert current.claim('hotels', 1) == RANGES[:1]
+
+    assert not stale._finish('hotels', *RANGES[0], COMPLETED)
+    stale.mark_failed('hotels', *RANGES[0], 'too late')
+    assert current.summary('hotels') == {IN_FLIGHT: 1}
+
+    current.mark_completed('hotels', *RANGES[0])
+    assert current.summary('hotels') == {COMPLETED: 1}
+
+
+def test_range_fails_once_it_used_up_its_attempts(store, clock):
+    worker = store('worker', lease_seconds=30, max_attempts=2)
+    worker.seed('hotels', RANGES[:1])
+    for attempt in range(2):
+        assert worker.claim('hotels', 1) == RANGES[:1]
+        clock.now += 31
+    assert worker.claim('hotels', 1) == []
+    assert worker.summary('hotels') == {FAILED: 1}
+
+
+def lease_store(backend, path, table_name, lease_seconds):
+    connect = connect_from_env if backend == 'mysql' else functools.partial(stand_in_lease_db.connect, path)
+    return RangeLeaseStore(connect, 'crawl-1', lease_seconds=lease_seconds, table_name=table_name)
+
+
+# Worker process: crawl RANGES with the other workers and report the ranges it loaded
+def crawl_worker(backend, path, table_name, loaded):
+    leases = lease_store(backend, path, table_name, lease_seconds=30)
+
+    def run_ranges(claimed, leases):
+        for page_range in claimed:
+            time.sleep(0.01)
+            loaded.put(page_range)
+            leases.mark_completed('hotels', *page_range)
+
+    run_leased_ingest(leases, 'hotels', RANGES, run_ranges, claim_size=2, poll_interval=0.05)
+    leases.close()
+
+
+# Worker process: claim two ranges with a short lease and die without giving them back
+def crashing_worker(backend, path, table_name):
+    leases = lease_store(backend, path, table_name, lease_seconds=0.5)
+    leases.create_table()
+    leases.seed('hotels', RANGES)
+    leases.claim('hotels', 2)
+    os._exit(1)
+
+
+# Against MySQL (the DB_* environment variables) only when LEASE_TEST_MYSQL is set
+@pytest.fixture(params=['sqlite', 'mysql'])
+def backend(request, tmp_path):
+    if request.param == 'mysql' and not os.getenv('LEASE_TEST_MYSQL'):
+        pytest.skip('set LEASE_TEST_MYSQL to run against the MySQL database of DB_*')
+    table_name = f'test_range_lease_{uuid.uuid4().hex[:8]}'
+    yield request.param, str(tmp_path / 'leases.sqlite3'), table_name
+    if request.param == 'mysql':
+        lease_store(request.param, None, table_name, 1)._execute(f'DROP TABLE IF EXISTS {table_name}')
+
+
+def run_workers(context, target, args, count):
+    processes = [context.Process(target=target, args=args) for _ in range(count)]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def test_workers_in_several_processes_load_every_range_once(backend):
+    context = multiprocessing.get_context('spawn')
+    loaded = context.Queue()
+    workers = run_workers(context, crawl_worker, backend + (loaded,), 3)
+    for worker in workers:
+        worker.join(60)
+    assert all(worker.exitcode == 0 for worker in workers)
+
+    loaded_ranges = [loaded.get(timeout=5) for _ in RANGES]
+    assert sorted(loaded_ranges) == RANGES
+    leases = lease_store(*backend, lease_seconds=30)
+    assert leases.summary('hotels') == {COMPLETED: len(RANGES)}
+    leases.close()
+
+
+def test_ranges_of_a_crashed_process_are_taken_over(backend):
+    context = multiprocessing.get_context('spawn')
+    crashed, = run_workers(context, crashing_worker, backend, 1)
+    crashed.join(60)
+    assert crashed.exitcode == 1
+
+    loaded = context.Queue()
+    workers = run_workers(context, crawl_worker, backend + (loaded,), 2)
+    for worker in workers:
+        worker.join(60)
+    assert sorted(loaded.get(timeout=5) for _ in RANGES) == RANGES
+    leases = lease_store(*backend, lease_seconds=30)
+    assert leases.summary('hotels') == {COMPLETED: len(RANGES)}
+    _, rows = leases._execute(f'SELECT from_index, attempts FROM {leases.table_name} WHERE attempts > 1')
+    assert sorted(rows) == [(1, 2), (11, 2)]
+    leases.close()
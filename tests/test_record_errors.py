@@ -0,0 +1,95 @@
+import random
+
+import mysql.connector
+import pytest
+
+import main
+from benchmarks import mock_api, stand_in_db
+
+
+# Stand-in connection whose hotel inserts fail with error for the hotels in failing_codes
+class FailingConnection(stand_in_db.StandInConnection):
+    def __init__(self, error, failing_codes):
+        super().__init__(stand_in_db.StandInDatabase())
+        self.error = error
+        self.failing_codes = failing_codes
+        self.committed = self.rolled_back = False
+
+    def cursor(self, **kwargs):
+        cursor = stand_in_db.StandInCursor(self.database)
+        executemany = cursor.executemany
+
+        def failing_executemany(query, rows):
+            if 'hb_hotel_info' in query and any(row[0] in self.failing_codes for row in rows):
+                raise self.error
+            return executemany(query, rows)
+
+        cursor.executemany = failing_executemany
+        return cursor
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+@pytest.fixture(autouse=True)
+def no_reference_check_or_dead_letter_files(monkeypatch):
+    monkeypatch.setattr(main, 'get_shared_reference_cache', lambda: None)
+    monkeypatch.setattr(main, 'dead_letter_table', lambda: None)
+    monkeypatch.setattr(main, 'write_dead_letters', lambda dead_letters: None)
+
+
+def hotels(*codes):
+    rng = random.Random(1)
+    return [mock_api.synthetic_hotel(code, mock_api.HotelShape(rooms=1, images=1), rng) for code in codes]
+
+
+@pytest.mark.parametrize('error, expected', [
+    (mysql.connector.DataError(msg='Data too long', errno=1406), True),
+    (mysql.connector.IntegrityError(msg='Duplicate entry', errno=1062), True),
+    (mysql.connector.DatabaseError(msg='Lock wait timeout exceeded', errno=1205), False),
+    (mysql.connector.DatabaseError(msg='Deadlock found', errno=1213), False),
+    (mysql.connector.InternalError(msg='Deadlock found', errno=1213, sqlstate='40001'), False),
+    (mysql.connector.OperationalError(msg='Lost connection', errno=2013), False),
+    (mysql.connector.ProgrammingError(msg='Unknown column', errno=1054), False),
+    (main.TableWriteError('hb_images', KeyError('path')), True),
+    (mysql.connector.DatabaseError(msg="Column 'hotel_name' cannot be null", errno=1048), True),
+    (mysql.connector.DatabaseError(msg='Out of range value', errno=1264), True),
+    (mysql.connector.DatabaseError(msg='Data truncated', errno=1265), True),
+    (mysql.connector.DatabaseError(msg='Incorrect datetime value', errno=1292), True),
+    (mysql.connector.DatabaseError(msg="Field doesn't have a default value", errno=1364), True),
+    (mysql.connector.DatabaseError(msg='Incorrect integer value', errno=1366), True),
+    (mysql.connector.DatabaseError(msg='Data too long', errno=1406), True),
+    (mysql.connector.DatabaseError(msg='Cannot add or update a child row', errno=1452), True),
+    (mysql.connector.DatabaseError(msg='Table is full', errno=1114), False),
+])
+def test_is_record_error(error, expected):
+    assert main.is_record_error(error) is expected
+
+
+def test_bad_hotel_is_dead_lettered_and_the_rest_committed():
+    conn = FailingConnection(mysql.connector.DataError(msg='Data too long', errno=1406), {2})
+    assert main.insert_data_into_mysql_batched({'hotels': hotels(1, 2, 3)}, conn)
+    assert conn.committed
+    assert conn.database.row_counts['hb_hotel_info'] == 2
+
+
+def test_bad_value_raised_as_a_plain_database_error_is_dead_lettered():
+    conn = FailingConnection(mysql.connector.DatabaseError(msg='Incorrect integer value', errno=1366), {2})
+    assert main.insert_data_into_mysql_batched({'hotels': hotels(1, 2, 3)}, conn)
+    assert conn.committed
+    assert conn.database.row_counts['hb_hotel_info'] == 2
+
+
+def test_lock_wait_timeout_fails_the_page_without_dead_letters():
+    conn = FailingConnection(mysql.connector.DatabaseError(msg='Lock wait timeout exceeded', errno=1205), {2})
+    assert not main.insert_data_into_mysql_batched({'hotels': hotels(1, 2, 3)}, conn)
+    assert conn.rolled_back and not conn.committed
+
+
+def test_single_hotel_page_that_fails_is_not_committed():
+    conn = FailingConnection(mysql.connector.IntegrityError(msg='Duplicate entry', errno=1062), {1})
+    assert not main.insert_data_into_mysql_batched({'hotels': hotels(1)}, conn)
+    assert conn.rolled_back and not conn.committed
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import checkpoint
+import db_pool
+import main
+import pipeline
+import reference_cache
+from benchmarks import mock_api, stand_in_db
+
+
+@pytest.fixture
+def reference_archive(tmp_path, monkeypatch):
+    for prefix, endpoint, count in ((reference_cache.FACILITY_PAGE_PREFIX, 'types/facilities', mock_api.FACILITY_COUNT),
+                                    (reference_cache.FACILITY_GROUP_PAGE_PREFIX, 'types/facilitygroups',
+                                     mock_api.FACILITY_GROUP_COUNT)):
+        page = mock_api.synthetic_page(endpoint, 1, count, mock_api.HotelShape(), 0, 1)
+        (tmp_path / f'{prefix}1_{count}.json').write_text(json.dumps(page))
+    monkeypatch.setenv('REFERENCE_CHECK', 'reject')
+    monkeypatch.setenv('REFERENCE_ARCHIVE_DIR', str(tmp_path))
+    monkeypatch.setattr(reference_cache, '_shared_cache', None)
+    yield
+    monkeypatch.setattr(reference_cache, '_shared_cache', None)
+
+
+@pytest.fixture
+def dead_letters(monkeypatch):
+    dead_letters = []
+    monkeypatch.setattr(main, 'dead_letter_table', lambda: None)
+    monkeypatch.setattr(main, 'write_dead_letters', dead_letters.extend)
+    return dead_letters
+
+
+def test_reference_check_rejects_hotels_on_the_transform_path(tmp_path, monkeypatch, reference_archive,
+                                                                dead_letters):
+    page = mock_api.synthetic_page('hotels', 1, 4, mock_api.HotelShape(rooms=1, images=1), 4, 1)
+    page['hotels'][2]['facilities'][0]['facilityCode'] = 99999
+    database = stand_in_db.StandInDatabase()
+    monkeypatch.setattr(db_pool, 'create_pool', lambda pool_size, pool_name='hb_ingest':
+                        stand_in_db.StandInPool(database))
+    monkeypatch.setenv('TRANSFORM_WORKERS', '2')
+    monkeypatch.setenv('FETCH_WORKERS', '1')
+
+    job = main.FULL_INGEST_JOB._replace(fetch_page=lambda from_index, to_index, archive_name=None: page,
+                                        export_page=None)
+    checkpoints = checkpoint.CheckpointStore(str(tmp_path / 'checkpoints.db'))
+    pipeline.run_ingest([(1, 4)], checkpoints, job, pipeline.settings_from_env())
+
+    assert checkpoints.summary(main.CHECKPOINT_RESOURCE) == {checkpoint.COMPLETED: 1}
+    assert [entry['code'] for entry in dead_letters] == [3]
+    assert database.row_counts['hb_hotel_info'] == 3
+    checkpoints.close()
+
+
+def test_archived_reference_data_without_descriptions(tmp_path):
+    (tmp_path / f'{reference_cache.FACILITY_PAGE_PREFIX}1_2.json').write_text(json.dumps(
+        {'facilities': [{'code': 1, 'facilityGroupCode': 10, 'facilityTypologyCode': 1, 'description': None},
+                        {'code': 2, 'facilityGroupCode': 10, 'facilityTypologyCode': 1}]}))
+    (tmp_path / f'{reference_cache.FACILITY_GROUP_PAGE_PREFIX}1_1.json').write_text(json.dumps(
+        {'facilityGroups': [{'code': 10, 'description': None}]}))
+    data = reference_cache.load_from_archive(str(tmp_path))
+    assert len(data.facilities) == 2 and len(data.groups) == 1
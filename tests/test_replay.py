@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+import main
+import main_new
+import replay
+from benchmarks import mock_api, stand_in_db
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = stand_in_db.StandInDatabase()
+    monkeypatch.setattr(main, 'connect_to_mysql', lambda: stand_in_db.StandInConnection(database))
+    return database
+
+
+def write_page(directory, from_index, to_index):
+    page = mock_api.synthetic_page('hotels', from_index, to_index, mock_api.HotelShape(rooms=1, images=1), 100, 1)
+    path = directory / f'hotel_data_{from_index}_{to_index}.json'
+    path.write_text(json.dumps(page))
+    return path
+
+
+def test_page_that_cannot_be_parsed_is_counted_as_failed(tmp_path, database, capsys):
+    write_page(tmp_path, 1, 10)
+    truncated = write_page(tmp_path, 11, 20)
+    truncated.write_bytes(truncated.read_bytes()[:500])
+    write_page(tmp_path, 21, 30)
+
+    replay.replay('hotels', str(tmp_path), workers=1)
+
+    assert '2 pages, 20 records, 1 failed' in capsys.readouterr().out
+    assert database.row_counts['hb_hotel_info'] == 20
+
+
+@pytest.mark.parametrize('upsert', [False, True])
+def test_replay_prepares_the_tables_first(tmp_path, database, monkeypatch, upsert):
+    prepared = []
+    monkeypatch.setattr(main, 'prepare_ingest', lambda upsert: prepared.append(upsert) or True)
+    write_page(tmp_path, 1, 10)
+    replay.replay('hotels', str(tmp_path), workers=1, upsert=upsert)
+    assert prepared == [upsert]
+    assert database.row_counts['hb_hotel_info'] == 10
+
+
+def test_replay_stops_when_the_tables_cannot_be_prepared(tmp_path, database, monkeypatch):
+    monkeypatch.setattr(main, 'prepare_ingest', lambda upsert: False)
+    write_page(tmp_path, 1, 10)
+    replay.replay('hotels', str(tmp_path), workers=1)
+    assert database.row_counts['hb_hotel_info'] == 0
+
+
+# Stand-in connection that also keeps every statement it was sent
+class RecordingConnection(stand_in_db.StandInConnection):
+    def __init__(self, database, statements):
+        super().__init__(database)
+        self.statements = statements
+
+    def cursor(self, **kwargs):
+        cursor = super().cursor(**kwargs)
+        execute = cursor.execute
+
+        def recording_execute(query, params=None):
+            self.statements.append(' '.join(query.split()))
+            return execute(query, params)
+
+        cursor.execute = recording_execute
+        return cursor
+
+
+def test_lean_replay_creates_the_document_table_first(tmp_path, monkeypatch):
+    database, statements = stand_in_db.StandInDatabase(), []
+    monkeypatch.setattr(main_new, 'connect_to_mysql', lambda: RecordingConnection(database, statements))
+    write_page(tmp_path, 1, 10)
+    replay.replay('hotels_lean', str(tmp_path), workers=1)
+
+    document_statements = [statement for statement in statements if main_new.DOCUMENT_TABLE in statement]
+    assert document_statements[0].startswith(f'CREATE TABLE IF NOT EXISTS {main_new.DOCUMENT_TABLE}')
+    assert database.row_counts[main_new.DOCUMENT_TABLE] == 10
@@ -0,0 +1,169 @@
+import logging
+
+# Tables the normalized loader writes, parents before the rows that point at them
+HOTEL_TABLES = ('hb_hotel_info', 'hb_location_coordinates', 'hb_description', 'hb_facilities',
+                'hb_rooms_type', 'hb_room_features', 'hb_room_stays', 'hb_room_stay_facilities',
+                'hb_phone_numbers', 'hb_board_codes', 'hb_address', 'hb_images')
+
+
+# Function to flatten a page of hotels into per-table row lists. It touches neither the network nor
+# the database (a page dict in, plain tuples out), so it can run in a worker process.
+# Rooms and stays get their AUTO_INCREMENT ids from MySQL, so their child rows are
+# keyed by the parent's natural key instead:
+#   hb_room_features        -> (hotel_code, room_code)
+#   hb_room_stays           -> (hotel_code, room_code)
+#   hb_room_stay_facilities -> (hotel_code, room_code, stay_type, order)
+# and the key is swapped for the real id once the parent rows are written.
+def flatten_hotel_data(hotel_data):
+    rows = {table_name: [] for table_name in HOTEL_TABLES}
+
+    for hotel in hotel_data['hotels']:
+        hotel_code = hotel['code']
+        city = hotel['city']['content'] if 'city' in hotel and 'content' in hotel['city'] else None
+
+        rows['hb_hotel_info'].append((
+            hotel_code,
+            hotel['name']['content'],
+            hotel['categoryCode'],
+            hotel['accommodationTypeCode'],
+            hotel.get('email', None),
+            hotel.get('web', None),
+            hotel['lastUpdate'],
+            hotel.get('S2C', None),
+            hotel['ranking']
+        ))
+
+        if 'coordinates' in hotel:
+            rows['hb_location_coordinates'].append((
+                hotel_code,
+                hotel['coordinates'].get('longitude'),
+                hotel['coordinates'].get('latitude'),
+                hotel['countryCode'],
+                hotel['stateCode'],
+                hotel['destinationCode'],
+                hotel['zoneCode'],
+                city
+            ))
+
+        rows['hb_description'].append((
+            hotel_code,
+            hotel['description']['content'] if 'description' in hotel and 'content' in hotel['description'] else ''
+        ))
+
+        for facility in hotel['facilities']:
+            rows['hb_facilities'].append((
+                hotel_code,
+                facility['facilityCode'],
+                facility['facilityGroupCode'],
+                facility.get('number', 0),
+                facility.get('voucher', False)
+            ))
+
+        for room in hotel.get('rooms', []):
+            room_code = room.get('roomCode', None)
+            if not room_code:
+                logging.error(f"Missing room_code for hotel_code: {hotel_code}, room data: {room}")
+                continue
+            room_key = (hotel_code, room_code)
+            rows['hb_rooms_type'].append((
+                hotel_code,
+                room_code,
+                room['roomType'],
+                room['characteristicCode'],
+                room['minPax'],
+                room['maxPax'],
+                room['minAdults'],
+                room['maxAdults'],
+                room['maxChildren'],
+                room['isParentRoom']
+            ))
+
+            for feature in room.get('roomFacilities', []):
+                rows['hb_room_features'].append((
+                    room_key,
+                    feature['facilityCode'],
+                    feature['facilityGroupCode'],
+                    feature.get('indLogic', None),
+                    feature.get('number', None),
+                    feature.get('voucher', None)
+                ))
+
+            for stay in room.get('roomStays', []):
+                rows['hb_room_stays'].append((
+                    room_key,
+                    stay['stayType'],
+                    stay['order'],
+                    stay.get('description', None)
+                ))
+                stay_key = room_key + (stay['stayType'], stay['order'])
+
+                for stay_facility in stay.get('roomStayFacilities', []):
+                    rows['hb_room_stay_facilities'].append((
+                        stay_key,
+                        stay_facility['facilityCode'],
+                        stay_facility['facilityGroupCode'],
+                        stay_facility['number']
+                    ))
+
+        for phone in hotel.get('phones', []):
+            rows['hb_phone_numbers'].append((
+                hotel_code,
+                phone['phoneNumber'],
+                phone['phoneType']
+            ))
+
+        for board_code in hotel.get('boardCodes', []):
+            rows['hb_board_codes'].append((
+                hotel_code,
+                board_code
+            ))
+
+        if 'address' in hotel:
+            rows['hb_address'].append((
+                hotel_code,
+                hotel['address']['content'],
+                city
+            ))
+
+        for image in hotel.get('images', []):
+            rows['hb_images'].append((
+                hotel_code,
+                image['imageTypeCode'],
+                image['path'],
+                image['order'],
+                image.get('visualOrder', None),
+                image.get('roomCode', None),
+                image.get('roomType', None),
+                image.get('characteristicCode', None)
+            ))
+
+    return rows
+
+
+# Errors flatten_hotel_data raises for a hotel missing a field, or with one of an unexpected type
+FLATTEN_ERRORS = (KeyError, TypeError, ValueError, AttributeError)
+
+
+# Function to flatten a page like flatten_hotel_data, except that a page that cannot be flattened as a
+# whole is flattened hotel by hotel, leaving out the hotels that fail. Returns (rows, hotels flattened,
+# [(hotel, error), ...] for the hotels left out).
+def flatten_hotels_separately(hotel_data):
+    hotels = hotel_data.get('hotels', [])
+    try:
+        return flatten_hotel_data({'hotels': hotels}), hotels, []
+    except FLATTEN_ERRORS:
+        pass
+
+    rows = {table_name: [] for table_name in HOTEL_TABLES}
+    flattened = []
+    failed = []
+    for hotel in hotels:
+        try:
+            hotel_rows = flatten_hotel_data({'hotels': [hotel]})
+        except FLATTEN_ERRORS as err:
+            failed.append((hotel, err))
+            continue
+        flattened.append(hotel)
+        for table_name, table_rows in hotel_rows.items():
+            rows[table_name].extend(table_rows)
+    return rows, flattened, failed